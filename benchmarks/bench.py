@@ -0,0 +1,285 @@
+"""Benchmarks for the parally package.
+
+Runs a Server in this process and N loopback Clients in subprocesses over
+a sweep of task durations, payload sizes, client counts and batch sizes,
+and writes tasks/s, latency percentiles and coordinator CPU time as JSON.
+
+    python benchmarks/bench.py --output results.json
+    python benchmarks/bench.py --quick
+"""
+
+import argparse
+import importlib.metadata
+import itertools
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+from parally import Client, ParameterSource, Server
+
+HOST = "localhost"
+PAYLOAD_BUDGET = 1 << 30
+DEFAULTS = {
+    "durations": [0.0, 0.001, 0.01, 0.1],
+    "payloads": [100, 10_000, 1_000_000, 100_000_000],
+    "clients": [1, 2, 4],
+    "chunksizes": [1, 16],
+}
+QUICK = {
+    "durations": [0.0, 0.01],
+    "payloads": [100, 1_000_000],
+    "clients": [1, 2],
+    "chunksizes": [1, 16],
+}
+
+
+def task(params):
+    """
+    task The benchmarked function: sleeps for the requested duration.
+
+    Parameters
+    ----------
+    params : dict
+        The duration in seconds and the payload.
+
+    Returns
+    -------
+    int
+        The size of the payload received.
+    """
+    if params['duration']:
+        time.sleep(params['duration'])
+    return int(params['payload'].nbytes)
+
+
+def free_port() -> int:
+    """
+    free_port Returns a port free on the loopback interface.
+
+    Returns
+    -------
+    int
+        The port.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def task_count(tasks, duration, payload, clients, seconds) -> int:
+    """
+    task_count Scales down the number of tasks of a run so it takes about
+    seconds at most and sends at most PAYLOAD_BUDGET bytes.
+
+    Returns
+    -------
+    int
+        The number of tasks of the run.
+    """
+    if duration:
+        tasks = min(tasks, int(seconds * clients / duration))
+    tasks = min(tasks, PAYLOAD_BUDGET // payload)
+    return max(clients, tasks)
+
+
+def quantile(histogram, q) -> float:
+    """
+    quantile Estimates a quantile from a latency histogram as returned by
+    Server.stats, interpolating linearly within its bucket.
+
+    Parameters
+    ----------
+    histogram : dict
+        The cumulative count of each bucket keyed by upper bound, the sum
+        and the count of the values.
+    q : float
+        The quantile, between 0 and 1.
+
+    Returns
+    -------
+    float
+        The estimated quantile, nan if no value was recorded. Values above
+        the last finite bound are reported as that bound.
+    """
+    if not histogram['count']:
+        return math.nan
+    rank = q * histogram['count']
+    (lower, below) = (0.0, 0)
+    for bound, total in histogram['buckets'].items():
+        if total >= rank and total > below:
+            if math.isinf(bound):
+                return lower
+            return lower + (bound - lower) * (rank - below) / (total - below)
+        (lower, below) = (bound, total)
+    return lower
+
+
+def run(duration, payload, clients, chunksize, tasks, timeout) -> dict:
+    """
+    run Runs a single configuration.
+
+    Parameters
+    ----------
+    duration : float
+        Duration of each task in seconds.
+    payload : int
+        Size of the payload of each task in bytes.
+    clients : int
+        Number of client processes.
+    chunksize : int
+        Number of tasks per batch.
+    tasks : int
+        Number of tasks.
+    timeout : float
+        Longest time the run may take in seconds, after which the server
+        is stopped and the clients killed.
+
+    Returns
+    -------
+    dict
+        The configuration and its measures, measured from the start of
+        the server once every client has imported its modules.
+    """
+    port = free_port()
+    array = np.zeros(payload, dtype=np.uint8)
+    parameters = ({"duration": duration, "payload": array}
+                  for _ in range(tasks))
+    completed = []
+    server = Server(HOST, port, keep_results=False)
+    server.bind_parameters(ParameterSource(parameters, read_ahead=64),
+                           chunksize=chunksize)
+    server.on_completed(completed.extend)
+    server.on_error(completed.append)
+    # The clients are spawned first and wait for the port, so the
+    # interpreter and NumPy startup is not measured.
+    processes = [subprocess.Popen([sys.executable, __file__, "--client"],
+                                  stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, text=True)
+                 for _ in range(clients)]
+    for process in processes:
+        process.stdout.readline()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    server.start()
+    for process in processes:
+        process.stdin.write("{}\n".format(port))
+        process.stdin.close()
+    server.join(timeout)
+    timed_out = server.running
+    if timed_out:
+        server.stop()
+        server.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    for process in processes:
+        if timed_out:
+            process.kill()
+        process.wait(timeout=60)
+    stats = server.stats()
+    return {
+        "duration": duration,
+        "payload": payload,
+        "clients": clients,
+        "chunksize": chunksize,
+        "tasks": tasks,
+        "timed_out": timed_out,
+        "succeeded": stats['tasks']['succeeded'],
+        "elapsed": elapsed,
+        "tasks_per_second": stats['tasks']['succeeded'] / elapsed,
+        "latency_p50": quantile(stats['latency'], 0.5),
+        "latency_p99": quantile(stats['latency'], 0.99),
+        "coordinator_cpu": cpu,
+        "coordinator_cpu_per_task": cpu / tasks,
+        "bytes_sent": stats['bytes_sent'],
+        "bytes_received": stats['bytes_received'],
+    }
+
+
+def version() -> str:
+    """
+    version Returns the installed version of parally.
+
+    Returns
+    -------
+    str
+        The version, None if the package is not installed.
+    """
+    try:
+        return importlib.metadata.version("parally")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def main(argv=None) -> None:
+    """
+    main Parses the command line and runs the sweep.
+
+    Parameters
+    ----------
+    argv : list
+        The command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--client", action="store_true",
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--quick", action="store_true",
+                        help="run a smaller sweep")
+    parser.add_argument("--durations", type=float, nargs="+")
+    parser.add_argument("--payloads", type=int, nargs="+")
+    parser.add_argument("--clients", type=int, nargs="+")
+    parser.add_argument("--chunksizes", type=int, nargs="+")
+    parser.add_argument("--tasks", type=int, default=1000,
+                        help="largest number of tasks per run")
+    parser.add_argument("--seconds", type=float, default=10.0,
+                        help="longest time spent sleeping per client")
+    parser.add_argument("--timeout", type=float, default=300.0,
+                        help="longest time a run may take")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="file to write the JSON to")
+    args = parser.parse_args(argv)
+
+    if args.client:
+        print("ready", flush=True)
+        client = Client(HOST, int(sys.stdin.readline()))
+        client.run_function(task)
+        client.start()
+        return
+
+    sweep = QUICK if args.quick else DEFAULTS
+    axes = [getattr(args, name) or sweep[name]
+            for name in ("durations", "payloads", "clients", "chunksizes")]
+    results = []
+    for duration, payload, clients, chunksize in itertools.product(*axes):
+        tasks = task_count(args.tasks, duration, payload, clients,
+                           args.seconds)
+        for _ in range(args.repeat):
+            result = run(duration, payload, clients, chunksize, tasks,
+                         args.timeout)
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+
+    report = json.dumps({
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "parally": version(),
+        },
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
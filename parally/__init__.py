@@ -4,3 +4,12 @@ over a socket connection.
 
 from .server import * # noqa
 from .client import * # noqa
+from .aio import * # noqa
+from .serializers import * # noqa
+from .sources import * # noqa
+from .scheduling import * # noqa
+from .cache import * # noqa
+from .functions import * # noqa
+from .executor import * # noqa
+from .reducers import * # noqa
+from .protocol import Compression # noqa
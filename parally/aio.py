@@ -0,0 +1,516 @@
+"""Asyncio module for the parally package.
+
+AsyncServer and AsyncClient speak the same protocol as Server and Client,
+so both flavours can be mixed freely.
+"""
+
+import asyncio
+import inspect
+from functools import partial
+from itertools import count
+
+from .protocol import HEADER, JSON, encode_message, decode_message, \
+    decompress, frame_segments, get_compression
+from .serializers import get_serializer
+from .functions import load_function
+from .client import unavailable
+from .server import Logs
+
+__all__ = ['AsyncServer', 'AsyncClient']
+
+
+async def read_message(reader, serializer=JSON):
+    """
+    read_message Reads the next message from a stream.
+
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+        The stream to read from.
+    serializer : Serializer
+        The serializer of the connection.
+
+    Returns
+    -------
+    dict or None
+        The decoded message, None if the peer closed the connection.
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+        (codec, length) = HEADER.unpack(header)
+        payload = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return decode_message(decompress(codec, payload), serializer)
+
+
+async def write_message(writer, message, serializer=JSON,
+                        compression=None) -> None:
+    """
+    write_message Writes a message to a stream.
+
+    Parameters
+    ----------
+    writer : asyncio.StreamWriter
+        The stream to write to.
+    message : dict
+        The message to send.
+    serializer : Serializer
+        The serializer of the connection.
+    compression : Compression
+        The compression settings of the connection, if any.
+    """
+    writer.writelines(frame_segments(encode_message(message, serializer),
+                                     compression))
+    await writer.drain()
+
+
+class AsyncServer:
+    """
+    An asyncio server that distributes parameters to connected clients.
+
+    Every client connection is served by a coroutine on the running event
+    loop, so no threads are needed.
+    """
+    def __init__(self, host, port, chunksize=1, prefetch=2, serializer='json',
+                 compression=None, verbose=False, log_level='info',
+                 logger=None):
+        """
+        __init__ Initialises the AsyncServer object.
+
+        Parameters
+        ----------
+        host : string
+            Host address to listen on.
+        port : int
+            Port to listen on. Must be between 1024 and 65535.
+        chunksize : int
+            Largest number of queued parameters sent to a client
+            in a single message.
+        prefetch : int
+            Number of batches kept in flight on each client per task
+            it can run at once.
+        serializer : str or Serializer
+            The serializer used for every message after the handshake.
+        compression : str or Compression
+            The codec used to compress large messages, if any.
+        log_level : str
+            The lowest level of the messages logged: 'debug', 'info',
+            'warning' or 'error'.
+        logger : logging.Logger or str
+            A logger, or the name of one, to pass the messages to
+            instead of printing them when verbose.
+        """
+        self.host = host
+        self.port = port
+        self._chunksize = chunksize
+        self._prefetch = max(1, prefetch)
+        self._serializer = get_serializer(serializer)
+        self._compression = get_compression(compression)
+        self._task_ids = count()
+        self.running = False
+        self._server = None
+        self._pending = None
+        self._results = None
+        self._connections = set()
+        self._outstanding = 0
+        self._verbose = verbose
+        self._logs = Logs(log_level, logger=logger)
+
+    def get_logs(self) -> list:
+        """
+        get_logs Returns the logs of the server.
+
+        Returns
+        -------
+        list
+            The logs of the server.
+        """
+        return self._logs.get_logs()
+
+    async def start(self) -> None:
+        """
+        start Starts listening for clients on the running event loop.
+        """
+        if self.running:
+            raise ValueError("Server is already running.")
+        if self.port < 1024 or self.port > 65535:
+            raise ValueError("Port must be between 1024 and 65535.")
+        self._pending = asyncio.Queue()
+        self._results = asyncio.Queue()
+        self._server = await asyncio.start_server(
+            self._serve, self.host, self.port)
+        self.running = True
+        self._logs.info("Server started on {}:{}", self.host, self.port,
+                        verbose=self._verbose)
+
+    async def submit(self, parameters) -> asyncio.Future:
+        """
+        submit Queues parameters to be run by the next free client.
+
+        Parameters
+        ----------
+        parameters : dict
+            Parameters to be passed to a client.
+
+        Returns
+        -------
+        asyncio.Future
+            A future resolved with the output of the task.
+        """
+        if not self.running:
+            raise ValueError("Server is not running.")
+        future = asyncio.get_running_loop().create_future()
+        self._outstanding += 1
+        await self._pending.put((parameters, future))
+        return future
+
+    async def results(self):
+        """
+        results Iterates over the results in completion order until
+        every submitted task has finished.
+
+        Yields
+        ------
+        dict
+            The input parameters and the output of each task.
+        """
+        while self._outstanding > 0 or not self._results.empty():
+            result = await self._results.get()
+            if result is not None:
+                yield result
+
+    async def stop(self) -> None:
+        """
+        stop Stops the server and closes every client connection. The
+        tasks not run yet fail with a RuntimeError.
+        """
+        if not self.running:
+            raise ValueError("Server is not running.")
+        self.running = False
+        self._server.close()
+        connections = list(self._connections)
+        for connection in connections:
+            connection.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+        await self._server.wait_closed()
+        # Fails the tasks no client took, and wakes results() up.
+        while not self._pending.empty():
+            (_, future) = self._pending.get_nowait()
+            self._finish(future, error="Server stopped.")
+        self._outstanding = 0
+        self._results.put_nowait(None)
+        self._logs.info("Server stopped.", verbose=self._verbose)
+
+    async def _serve(self, reader, writer) -> None:
+        """
+        _serve Feeds one client with parameters until it disconnects.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            The stream to read from the client.
+        writer : asyncio.StreamWriter
+            The stream to write to the client.
+        """
+        address = writer.get_extra_info('peername')
+        self._logs.info("Connection from {}", address, verbose=self._verbose)
+        tasks = {}
+        slots = asyncio.Semaphore(0)
+        self._connections.add(asyncio.current_task())
+        feeder = None
+        try:
+            await write_message(writer, {
+                'action': 'hello',
+                'serializer': self._serializer.name,
+                'compression': None if self._compression is None
+                else self._compression.to_dict()
+            })
+            feeder = asyncio.create_task(self._feed(writer, tasks, slots))
+            while self.running:
+                data = await read_message(reader, self._serializer)
+                if data is None:
+                    break
+                if data['action'] == 'ready':
+                    capacity = max(1, int(data.get('capacity', 1)))
+                    for _ in range(capacity * self._prefetch):
+                        slots.release()
+                if data['action'] != 'result' or data['id'] not in tasks:
+                    continue
+                batch = tasks.pop(data['id'])
+                for (parameters, future), result in zip(batch,
+                                                        data['batch']):
+                    if 'error' in result:
+                        self._finish(future, error=result['error'])
+                    else:
+                        self._finish(future, {"input": parameters,
+                                              "output": result['data']})
+                slots.release()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(asyncio.current_task())
+            if feeder is not None:
+                feeder.cancel()
+            for batch in tasks.values():
+                for parameters, future in batch:
+                    error = "Connection to {} lost while running " \
+                        "parameters: {}".format(address, parameters)
+                    self._finish(future, error=error)
+            writer.close()
+
+    async def _feed(self, writer, tasks, slots) -> None:
+        """
+        _feed Sends queued parameters to a client whenever it has
+        a free slot.
+
+        Parameters
+        ----------
+        writer : asyncio.StreamWriter
+            The stream to write to the client.
+        tasks : dict
+            The batches in flight on the client, keyed by task ID.
+        slots : asyncio.Semaphore
+            The free slots of the client.
+        """
+        try:
+            while self.running:
+                await slots.acquire()
+                batch = [await self._pending.get()]
+                while len(batch) < self._chunksize and \
+                        not self._pending.empty():
+                    batch.append(self._pending.get_nowait())
+                task_id = next(self._task_ids)
+                tasks[task_id] = batch
+                try:
+                    await write_message(writer, {
+                        'action': 'run',
+                        'id': task_id,
+                        'batch': [parameters for parameters, _ in batch]
+                    }, self._serializer, self._compression)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    # The batch could not be encoded: it fails, and the
+                    # client gets the next one instead.
+                    del tasks[task_id]
+                    for parameters, future in batch:
+                        self._finish(future, error="Cannot send parameters "
+                                     "{}: {}".format(parameters, e))
+                    slots.release()
+        except ConnectionError:
+            pass
+
+    def _finish(self, future, result=None, error=None) -> None:
+        """
+        _finish Resolves the future of a task and publishes its result.
+
+        Parameters
+        ----------
+        future : asyncio.Future
+            The future of the task.
+        result : dict
+            The input parameters and the output of the task.
+        error : str
+            The error message of the task, if it failed.
+        """
+        self._outstanding -= 1
+        if error is not None:
+            self._logs.error(error, verbose=self._verbose)
+            if not future.done():
+                future.set_exception(RuntimeError(error))
+        elif not future.done():
+            future.set_result(result['output'])
+        self._results.put_nowait(result)
+
+
+class AsyncClient:
+    """
+    An asyncio client that runs the tasks sent by a server.
+
+    Coroutine functions are awaited on the event loop, plain functions are
+    run in the default executor so they do not block it.
+    """
+    def __init__(self, host, port, verbose=False, log_level='info',
+                 logger=None):
+        """
+        __init__ Initializes the client.
+
+        Parameters
+        ----------
+        host : str
+            The host to connect to.
+        port : int
+            The port to connect to.
+        log_level : str
+            The lowest level of the messages logged: 'debug', 'info',
+            'warning' or 'error'.
+        logger : logging.Logger or str
+            A logger, or the name of one, to pass the messages to
+            instead of printing them when verbose.
+        """
+        self._host = host
+        self._port = port
+        self._running = False
+        self._functions = {}
+        self.function = None
+        self._verbose = verbose
+        self._logs = Logs(log_level, logger=logger)
+
+    def get_logs(self) -> list:
+        """
+        get_logs Gets the logs.
+
+        Returns
+        -------
+        list
+            The logs.
+        """
+        return self._logs.get_logs()
+
+    def run_function(self, function) -> None:
+        """
+        run_function Sets the function to run on the parameters received.
+
+        Parameters
+        ----------
+        function : function
+            The function or coroutine function to run.
+        """
+        try:
+            if not callable(function):
+                raise TypeError("Callback must be a function.")
+            self.function = function
+
+            self._logs.info("Callback function set.", verbose=self._verbose)
+        except TypeError as e:
+            self._logs.error(e, verbose=self._verbose)
+
+    async def start(self) -> None:
+        """
+        start Connects to the server and runs tasks until it disconnects.
+        """
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        self._logs.info(f"Connected to server {self._host}:{self._port}",
+                        verbose=self._verbose)
+        self._running = True
+        serializer, compression = JSON, None
+        heartbeat = None
+        try:
+            while self._running:
+                data = await read_message(reader, serializer)
+                if data is None:
+                    self._logs.error("Server closed connection.",
+                                     verbose=self._verbose)
+                    break
+                if data['action'] == 'hello':
+                    serializer = get_serializer(data['serializer'])
+                    compression = get_compression(data.get('compression'))
+                    if data.get('function') is not None:
+                        self.function = self._load_function(data['function'])
+                    await write_message(writer, {'action': 'ready',
+                                                 'capacity': 1}, serializer)
+                    if data.get('heartbeat'):
+                        heartbeat = asyncio.create_task(self._heartbeat(
+                            writer, data['heartbeat'], serializer))
+                elif data['action'] == 'function':
+                    self._functions[data['job']] = self._load_function(
+                        data['function'])
+                elif data['action'] == 'forget':
+                    self._functions.pop(data['job'], None)
+                elif data['action'] == 'run':
+                    function = self._functions.get(data.get('job'),
+                                                   self.function)
+                    results = [await self._run(parameters, function)
+                               for parameters in data['batch']]
+                    await write_message(writer, {'action': 'result',
+                                                 'id': data['id'],
+                                                 'batch': results},
+                                        serializer, compression)
+        finally:
+            self._running = False
+            if heartbeat is not None:
+                heartbeat.cancel()
+            writer.close()
+
+    def _load_function(self, spec):
+        """
+        _load_function Loads a function sent by the server, compiling it
+        unless this process already did.
+
+        Parameters
+        ----------
+        spec : dict
+            The function, as returned by pack_function.
+
+        Returns
+        -------
+        function
+            The function, or one failing every task if it cannot be
+            loaded.
+        """
+        try:
+            function = load_function(spec).load()
+            self._logs.info("Function {} received.", spec['name'],
+                            verbose=self._verbose)
+            return function
+        except Exception as e:
+            error = "Cannot load function {}. {}".format(spec.get('name'), e)
+            self._logs.error(error, verbose=self._verbose)
+            return partial(unavailable, error)
+
+    def close(self) -> None:
+        """
+        close Stops the client after the current task.
+        """
+        self._running = False
+
+    async def _heartbeat(self, writer, interval, serializer) -> None:
+        """
+        _heartbeat Tells the server the client is alive, every interval
+        seconds.
+
+        Parameters
+        ----------
+        writer : asyncio.StreamWriter
+            The stream to write to the server.
+        interval : float
+            Seconds between two heartbeats.
+        serializer : Serializer
+            The serializer of the connection.
+        """
+        try:
+            while self._running:
+                await asyncio.sleep(interval)
+                await write_message(writer, {'action': 'heartbeat'},
+                                    serializer)
+        except ConnectionError:
+            pass
+
+    async def _run(self, parameters, function=None) -> dict:
+        """
+        _run Runs the function on a single set of parameters.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters received from the server.
+        function : function
+            The function of the job, None for the function of the client.
+
+        Returns
+        -------
+        dict
+            The output of the function, or the error message if it failed.
+        """
+        try:
+            if function is None:
+                function = self.function
+            if inspect.iscoroutinefunction(function):
+                result = await function(parameters)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, function, parameters)
+            return {'data': result}
+        except Exception as e:
+            return {'error': str(e)}
@@ -0,0 +1,213 @@
+"""Cache module for the parally package.
+
+A ResultCache keeps the output of every task in a sqlite database, keyed
+by a hash of its parameters, so a Server can answer the parameters it has
+already run without sending them to a client.
+"""
+
+import hashlib
+import json
+import pickle
+import sqlite3
+from threading import Lock
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+__all__ = ['ResultCache']
+
+
+class ResultCache:
+    """
+    A persistent cache of task outputs, evicting the least recently used
+    ones once it grows past max_size bytes.
+    """
+    def __init__(self, path, version='', max_size=1 << 30):
+        """
+        __init__ Initialises the ResultCache object.
+
+        Parameters
+        ----------
+        path : str
+            The path of the sqlite database, created if needed.
+        version : str
+            A tag of the function the outputs come from. Change it when
+            the function changes so earlier outputs are not reused.
+        max_size : int
+            The largest size of the outputs stored, in bytes. None for
+            no limit.
+        """
+        self._version = str(version)
+        self._max_size = max_size
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS results ("
+                         "key TEXT PRIMARY KEY, value BLOB, "
+                         "size INTEGER, used INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_used "
+                         "ON results (used)")
+        (size, used) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(used), 0) "
+            "FROM results").fetchone()
+        self._size = size
+        self._clock = used
+        self._hits = 0
+        self._misses = 0
+
+    def key(self, parameters):
+        """
+        key Returns the key of a set of parameters.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters of a task.
+
+        Returns
+        -------
+        str or None
+            The hash of the version and the canonical form of the
+            parameters, None if they cannot be hashed.
+        """
+        try:
+            canonical = json.dumps(parameters, sort_keys=True,
+                                   separators=(',', ':'), default=_canonical)
+        except (TypeError, ValueError):
+            return None
+        digest = hashlib.sha256(self._version.encode())
+        digest.update(b'\0')
+        digest.update(canonical.encode())
+        return digest.hexdigest()
+
+    def get(self, parameters) -> tuple:
+        """
+        get Looks up the output of a set of parameters.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters of a task.
+
+        Returns
+        -------
+        (bool, object)
+            Whether the output was found, and the output.
+        """
+        key = self.key(parameters)
+        if key is None:
+            return (False, None)
+        with self._lock:
+            row = self._db.execute("SELECT value FROM results WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is None:
+                self._misses += 1
+                return (False, None)
+            self._clock += 1
+            self._db.execute("UPDATE results SET used = ? WHERE key = ?",
+                             (self._clock, key))
+            self._hits += 1
+        return (True, pickle.loads(row[0]))
+
+    def put(self, parameters, output) -> None:
+        """
+        put Stores the output of a set of parameters.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters of a task.
+        output : object
+            The output of the task.
+        """
+        key = self.key(parameters)
+        if key is None:
+            return
+        try:
+            value = pickle.dumps(output, protocol=5)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        if self._max_size is not None and len(value) > self._max_size:
+            return
+        with self._lock:
+            row = self._db.execute("SELECT size FROM results WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is not None:
+                self._size -= row[0]
+            self._clock += 1
+            self._db.execute("INSERT OR REPLACE INTO results "
+                             "VALUES (?, ?, ?, ?)",
+                             (key, value, len(value), self._clock))
+            self._size += len(value)
+            self._evict()
+
+    def get_stats(self) -> dict:
+        """
+        get_stats Returns the hits, misses and size of the cache.
+
+        Returns
+        -------
+        dict
+            The number of hits and misses since the cache was opened,
+            and the size of the outputs stored in bytes.
+        """
+        return {"hits": self._hits, "misses": self._misses,
+                "size": self._size}
+
+    def close(self) -> None:
+        """
+        close Closes the database.
+        """
+        with self._lock:
+            self._db.close()
+
+    def _evict(self) -> None:
+        """
+        _evict Removes the least recently used outputs until the cache
+        fits in max_size.
+        """
+        if self._max_size is None:
+            return
+        while self._size > self._max_size:
+            rows = self._db.execute("SELECT key, size FROM results "
+                                    "ORDER BY used LIMIT 64").fetchall()
+            if not rows:
+                self._size = 0
+                return
+            for key, size in rows:
+                if self._size <= self._max_size:
+                    break
+                self._db.execute("DELETE FROM results WHERE key = ?",
+                                 (key,))
+                self._size -= size
+
+
+def _canonical(obj):
+    """
+    _canonical Replaces a NumPy object by a JSON equivalent for hashing.
+
+    Parameters
+    ----------
+    obj : object
+        The object json could not serialize.
+
+    Returns
+    -------
+    object
+        The dtype, shape and hash of the data of an array, or the Python
+        equivalent of a NumPy scalar.
+    """
+    if np is not None:
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+            data = np.ascontiguousarray(obj).tobytes()
+            return {'__ndarray__': hashlib.sha256(data).hexdigest(),
+                    'dtype': np.lib.format.dtype_to_descr(obj.dtype),
+                    'shape': list(obj.shape)}
+        if isinstance(obj, np.generic):
+            return obj.item()
+    raise TypeError("Object of type {} cannot be hashed."
+                    .format(type(obj).__name__))
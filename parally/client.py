@@ -1,18 +1,201 @@
 """Client module for the parally package."""
 
-import json
+import pickle
+import select
 import socket
+from concurrent.futures import CancelledError, ProcessPoolExecutor, \
+    ThreadPoolExecutor
+from functools import partial
+from threading import Event, Lock, Thread, Timer
 
+from .protocol import FrameBuffer, send_message, recv_message, \
+    get_compression
+from .serializers import JSONSerializer, get_serializer
+from .functions import MODULE_PREFIX, load_function
+from .reducers import get_reducer
 from .server import Logs
 
 __all__ = ['Client']
 
 
+def run_batch(function, batch, exceptions=False) -> list:
+    """
+    run_batch Runs a function on a batch of parameters, back to back.
+
+    Parameters
+    ----------
+    function : function
+        The function to run.
+    batch : list
+        The parameters of each task.
+    exceptions : bool
+        Whether to also return the exception of each task that failed.
+
+    Returns
+    -------
+    list
+        The output of the function, or the error message if it failed,
+        for each task.
+    """
+    results = []
+    for parameters in batch:
+        try:
+            results.append({'data': function(parameters)})
+        except Exception as e:
+            results.append(failure(e, exceptions))
+    return results
+
+
+def failure(error, exceptions=False) -> dict:
+    """
+    failure Returns the outcome of a task that failed.
+
+    Parameters
+    ----------
+    error : Exception
+        The exception raised by the task.
+    exceptions : bool
+        Whether to also return the exception, so the server can raise
+        it again. It is left out if it cannot be pickled, or if its
+        class is defined where the server cannot import it.
+
+    Returns
+    -------
+    dict
+        The error message, and the exception if asked for.
+    """
+    result = {'error': str(error)}
+    module = type(error).__module__
+    if exceptions and module != '__main__' and \
+            not module.startswith(MODULE_PREFIX):
+        try:
+            pickle.dumps(error)
+            result['exception'] = error
+        except Exception:
+            pass
+    return result
+
+
+def unavailable(error, parameters):
+    """
+    unavailable Stands for a function the client could not load.
+
+    Parameters
+    ----------
+    error : str
+        Why the function could not be loaded.
+    parameters : dict
+        The parameters of the task.
+
+    Raises
+    ------
+    ValueError
+        Always, with the error.
+    """
+    raise ValueError(error)
+
+
+class Combiner:
+    """
+    Folds the outputs of the batches run by a client with the reducer of
+    the server, and sends one partial value per window instead of the
+    outputs. The client flushes it early when it runs out of batches, as
+    the server sends no more until the ones folded are sent.
+    """
+    def __init__(self, reducer, window, send):
+        """
+        __init__ Initialises the Combiner object.
+
+        Parameters
+        ----------
+        reducer : Reducer
+            The reducer of the server.
+        window : float
+            Seconds the outputs are folded over, from the first batch of
+            the window. 0 to send a partial value per batch.
+        send : function
+            Called with each partial value message.
+        """
+        self.reducer = reducer
+        self.window = window
+        self._send = send
+        self._lock = Lock()
+        self._timer = None
+        self._ids = []
+        self._state = reducer.initial()
+        self._count = 0
+        self._errors = []
+
+    def add(self, task_id, results) -> None:
+        """
+        add Folds the outputs of a batch into the partial value.
+
+        Parameters
+        ----------
+        task_id : int
+            The ID of the batch.
+        results : list
+            The output or the error message of each task.
+        """
+        with self._lock:
+            self._ids.append(task_id)
+            for result in results:
+                if 'error' in result:
+                    self._errors.append(result['error'])
+                    continue
+                try:
+                    self._state = self.reducer.add(self._state,
+                                                   result['data'])
+                    self._count += 1
+                except Exception as e:
+                    self._errors.append("Cannot reduce output: {}"
+                                        .format(e))
+            if self.window and self._timer is None:
+                self._timer = Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if not self.window:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        flush Sends the partial value of the window, if any.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._ids:
+                return
+            message = {'action': 'partial', 'ids': self._ids,
+                       'partial': self._state, 'count': self._count,
+                       'errors': self._errors}
+            self._ids = []
+            self._state = self.reducer.initial()
+            self._count = 0
+            self._errors = []
+        self._send(message)
+
+    def close(self) -> None:
+        """
+        close Drops the partial value of the window, whose batches the
+        server runs again.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
 class Client:
     """
     A simple client class that connects to a given host and port.
+
+    With more than one process, the batches received are run on a local
+    pool and the server is told it can keep that many busy at once.
     """
-    def __init__(self, host, port, verbose=False):
+    def __init__(self, host, port, verbose=False, processes=1, threads=False,
+                 log_level='info', logger=None):
         """
         __init__ Initializes the client.
 
@@ -22,15 +205,37 @@ class Client:
             The host to connect to.
         port : int
             The port to connect to.
+        processes : int
+            Number of tasks run at the same time on this machine.
+        threads : bool
+            Whether to run them on a thread pool instead of a process
+            pool, for functions that release the GIL.
+        log_level : str
+            The lowest level of the messages logged: 'debug', 'info',
+            'warning' or 'error'. Per-task messages are 'debug'.
+        logger : logging.Logger or str
+            A logger, or the name of one, to pass the messages to
+            instead of printing them when verbose.
         """
         self._host = host
         self._port = port
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._running = False
         self._input_parameters = {}
+        self._buffer = FrameBuffer()
+        self._processes = max(1, processes)
+        self._threads = threads
+        self._executor = None
+        self._serializer = JSONSerializer()
+        self._compression = None
+        self._lock = Lock()
+        self._stopped = Event()
+        self._futures = {}
+        self._functions = {}
+        self._combiner = None
         self.function = None
         self._verbose = verbose
-        self._logs = Logs()
+        self._logs = Logs(log_level, logger=logger)
 
     def get_logs(self) -> list:
         """
@@ -61,6 +266,32 @@ class Client:
         except TypeError as e:
             self._logs.error(e, verbose=self._verbose)
 
+    def _load_function(self, spec):
+        """
+        _load_function Loads a function sent by the server, compiling it
+        unless this process already did.
+
+        Parameters
+        ----------
+        spec : dict
+            The function, as returned by pack_function.
+
+        Returns
+        -------
+        function
+            The function, or one failing every task if it cannot be
+            loaded.
+        """
+        try:
+            function = load_function(spec)
+            self._logs.info("Function {} received.", function,
+                            verbose=self._verbose)
+            return function
+        except Exception as e:
+            error = "Cannot load function {}. {}".format(spec.get('name'), e)
+            self._logs.error(error, verbose=self._verbose)
+            return partial(unavailable, error)
+
     def start(self) -> None:
         """
         start Starts the client.
@@ -69,43 +300,233 @@ class Client:
         self._logs.info(f"Connected to server {self._host}:{self._port}",
                         verbose=self._verbose)
         self._running = True
+        if self._processes > 1:
+            pool = ThreadPoolExecutor if self._threads else ProcessPoolExecutor
+            self._executor = pool(max_workers=self._processes)
+        try:
+            self._loop()
+        finally:
+            if self._running:
+                self.close()
+
+    def _loop(self) -> None:
+        """
+        _loop Handles the messages of the server until the connection
+        is closed.
+        """
         while self._running:
             try:
-                self._socket.sendall(json.dumps({'action': 'ready'}).encode())
+                data = recv_message(self._socket, self._buffer,
+                                    self._serializer)
             except Exception:
+                data = None
+            if data is None:
                 self._logs.error("Server closed connection.",
                                  verbose=self._verbose)
                 self.close()
                 break
-            try:
-                data = self._socket.recv(1024)
-            except Exception:
-                pass
-            if not data:
-                continue
-            data = json.loads(data.decode())
-            self._logs.info(f"Received data: {data}", verbose=self._verbose)
-            if data['action'] == 'run':
-                self._input_parameters = data['parameters']
-                self._logs.info("Running function with parameters {}"
-                                .format(self._input_parameters),
-                                verbose=self._verbose)
-                try:
-                    result = self.function(self._input_parameters)
-                    to_send = json.dumps({'action': 'result', 'data': result})
-                    self._socket.sendall(to_send.encode())
-                except (ValueError, TypeError) as e:
-                    to_send = json.dumps({'action': 'error', 'error': str(e)})
-                    self._socket.sendall(to_send.encode())
+            self._logs.debug("Received data: {}", data, verbose=self._verbose)
+            if data['action'] == 'hello':
+                self._serializer = get_serializer(data['serializer'])
+                self._compression = get_compression(data.get('compression'))
+                if data.get('function') is not None:
+                    self.function = self._load_function(data['function'])
+                self._send({'action': 'ready', 'capacity': self._processes})
+                if data.get('heartbeat'):
+                    Thread(target=self._heartbeat, args=(data['heartbeat'],),
+                           daemon=True).start()
+            elif data['action'] == 'function':
+                self._functions[data['job']] = self._load_function(
+                    data['function'])
+            elif data['action'] == 'forget':
+                self._functions.pop(data['job'], None)
+            elif data['action'] == 'combine':
+                self._combiner = self._load_combiner(data)
+            elif data['action'] == 'run':
+                function = self._functions.get(data.get('job'),
+                                               self.function)
+                combiner = None if 'job' in data else self._combiner
+                if self._executor is not None:
+                    future = self._executor.submit(
+                        run_batch, function, data['batch'],
+                        self._serializer.name == 'pickle')
+                    self._futures[data['id']] = future
+                    future.add_done_callback(partial(
+                        self._send_results, data['id'], len(data['batch']),
+                        combiner))
+                    continue
+                results = [self._run(parameters, function)
+                           for parameters in data['batch']]
+                if combiner is not None:
+                    combiner.add(data['id'], results)
+                    if not self._has_work():
+                        combiner.flush()
+                    continue
+                self._send({'action': 'result', 'id': data['id'],
+                            'batch': results})
+            elif data['action'] == 'cancel':
+                future = self._futures.get(data['id'])
+                if future is not None and future.cancel():
+                    self._logs.debug("Cancelled task {}", data['id'],
+                                     verbose=self._verbose)
             elif data['action'] == 'done':
                 continue
 
+    def _load_combiner(self, data):
+        """
+        _load_combiner Loads the reducer sent by the server to fold the
+        outputs of the bound parameters with.
+
+        Parameters
+        ----------
+        data : dict
+            The reducer, as returned by Reducer.to_dict, and the window.
+
+        Returns
+        -------
+        Combiner
+            The combiner, None if the reducer cannot be loaded, in which
+            case every output is sent.
+        """
+        try:
+            reducer = get_reducer(data['reducer'])
+        except Exception as e:
+            self._logs.error("Cannot load reducer {}. {}",
+                             data['reducer'].get('name'), e,
+                             verbose=self._verbose)
+            return None
+        self._logs.info("Reducer {} received.", reducer.name,
+                        verbose=self._verbose)
+        return Combiner(reducer, data['window'], self._send)
+
+    def _send_results(self, task_id, size, combiner, future) -> None:
+        """
+        _send_results Sends the results of a batch run on the pool.
+
+        Parameters
+        ----------
+        task_id : int
+            The ID of the batch.
+        size : int
+            The number of tasks in the batch.
+        combiner : Combiner
+            The combiner the outputs are folded with, None to send them.
+        future : concurrent.futures.Future
+            The future of the batch.
+        """
+        self._futures.pop(task_id, None)
+        try:
+            results = future.result()
+        except CancelledError:
+            results = [{'error': "Cancelled."}] * size
+            combiner = None
+        except Exception as e:
+            results = [{'error': str(e)}] * size
+        if combiner is not None:
+            combiner.add(task_id, results)
+            if not self._futures:
+                combiner.flush()
+            return
+        self._send({'action': 'result', 'id': task_id, 'batch': results})
+
+    def _has_work(self) -> bool:
+        """
+        _has_work Checks if a message from the server is waiting to be
+        read.
+
+        Returns
+        -------
+        bool
+            True if bytes are buffered or ready on the socket, False
+            otherwise.
+        """
+        if self._buffer.buffered():
+            return True
+        try:
+            return bool(select.select([self._socket], [], [], 0)[0])
+        except (OSError, ValueError):
+            return False
+
+    def _heartbeat(self, interval) -> None:
+        """
+        _heartbeat Tells the server the client is alive, every interval
+        seconds until the client is closed.
+
+        Parameters
+        ----------
+        interval : float
+            Seconds between two heartbeats.
+        """
+        while not self._stopped.wait(interval):
+            self._send({'action': 'heartbeat'})
+
+    def _send(self, message) -> None:
+        """
+        _send Sends a message to the server, one thread at a time.
+
+        Parameters
+        ----------
+        message : dict
+            The message to send.
+        """
+        try:
+            with self._lock:
+                send_message(self._socket, message, self._serializer,
+                             self._compression)
+        except OSError:
+            self._logs.error("Server closed connection.",
+                             verbose=self._verbose)
+        except (TypeError, ValueError) as e:
+            self._logs.error("Cannot serialize message: {}", e,
+                             verbose=self._verbose)
+            if message['action'] == 'result':
+                self._send({'action': 'result', 'id': message['id'],
+                            'batch': [{'error': str(e)}] * len(
+                                message['batch'])})
+            elif message['action'] == 'partial':
+                self._send({'action': 'partial', 'ids': message['ids'],
+                            'partial': None, 'count': 0,
+                            'errors': message['errors']
+                            + [str(e)] * message['count']})
+
+    def _run(self, parameters, function=None) -> dict:
+        """
+        _run Runs the function on a single set of parameters.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters received from the server.
+        function : function
+            The function of the job, None for the function of the client.
+
+        Returns
+        -------
+        dict
+            The output of the function, or the error message if it failed.
+        """
+        self._input_parameters = parameters
+        self._logs.debug("Running function with parameters {}", parameters,
+                         verbose=self._verbose)
+        if function is None:
+            function = self.function
+        try:
+            return {'data': function(parameters)}
+        except Exception as e:
+            return failure(e, self._serializer.name == 'pickle')
+
     def close(self) -> None:
         """
         close Closes the client.
         """
         self._running = False
+        self._stopped.set()
         self._logs.info("Closing client.", verbose=self._verbose)
+        if self._combiner is not None:
+            self._combiner.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
         self._socket.close()
 
     def _default_callback(self, results) -> None:
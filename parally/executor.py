@@ -0,0 +1,244 @@
+"""Executor module for the parally package.
+
+ParallyExecutor implements concurrent.futures.Executor on top of a Server,
+so code written for a ProcessPoolExecutor can run its tasks on remote
+clients instead of local processes.
+"""
+
+import time
+from concurrent.futures import Executor, wait
+from itertools import islice
+from threading import Lock, Thread
+from weakref import WeakKeyDictionary
+
+from .functions import pack_function
+from .server import Server
+
+__all__ = ['ParallyExecutor']
+
+
+class ParallyExecutor(Executor):
+    """
+    An Executor running its tasks on the clients connected to a Server,
+    started with the executor and stopped by shutdown().
+
+    Functions are sent to the clients, so they need no function of their
+    own. A task that fails raises its exception, or a RuntimeError with
+    its error message if the exception cannot be pickled.
+    """
+    def __init__(self, host='localhost', port=5000, **kwargs):
+        """
+        __init__ Initialises the ParallyExecutor object and starts its
+        server.
+
+        Parameters
+        ----------
+        host : str
+            Host address to listen on.
+        port : int
+            Port to listen on. Must be between 1024 and 65535.
+        **kwargs
+            Passed to Server. The serializer defaults to 'pickle', so
+            any picklable argument can be passed, as with a
+            ProcessPoolExecutor.
+        """
+        kwargs.setdefault('serializer', 'pickle')
+        self._server = Server(host, port, **kwargs)
+        self._packed = WeakKeyDictionary()
+        self._futures = set()
+        self._lock = Lock()
+        self._shutdown = False
+        self._server.start()
+        if not self._server.running:
+            logs = self._server.get_logs()
+            raise ValueError(logs[-1]['message'] if logs
+                             else "Cannot start server.")
+
+    def get_server(self) -> Server:
+        """
+        get_server Returns the server the tasks run on.
+
+        Returns
+        -------
+        Server
+            The server.
+        """
+        return self._server
+
+    def submit(self, fn, /, *args, **kwargs):
+        """
+        submit Runs fn(*args, **kwargs) on a client.
+
+        Parameters
+        ----------
+        fn : function
+            The function to run.
+        *args
+            The arguments of the function.
+        **kwargs
+            The keyword arguments of the function.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future of the output of the function.
+        """
+        return self._submit(self._pack(fn, 'arguments'), [list(args), kwargs])
+
+    def map(self, fn, *iterables, timeout=None, chunksize=1):
+        """
+        map Runs fn on each set of arguments taken from the iterables,
+        chunksize sets of arguments per task.
+
+        Parameters
+        ----------
+        fn : function
+            The function to run.
+        *iterables
+            The iterables the arguments are taken from.
+        timeout : float
+            Longest time in seconds to wait for the outputs from the
+            call, None to wait as long as needed.
+        chunksize : int
+            Number of sets of arguments sent to a client in one task.
+
+        Returns
+        -------
+        generator
+            The output of fn for each set of arguments, in order.
+        """
+        if chunksize < 1:
+            raise ValueError("chunksize must be >= 1.")
+        spec = self._pack(fn, 'chunk')
+        end = None if timeout is None else time.monotonic() + timeout
+        arguments = zip(*iterables)
+        futures = []
+        chunk = [list(args) for args in islice(arguments, chunksize)]
+        while chunk:
+            futures.append(self._submit(spec, chunk))
+            chunk = [list(args) for args in islice(arguments, chunksize)]
+        return _outputs(futures, end)
+
+    def shutdown(self, wait=True, *, cancel_futures=False) -> None:
+        """
+        shutdown Stops the server once the tasks submitted are done.
+
+        Parameters
+        ----------
+        wait : bool
+            Whether to return only once the tasks are done and the
+            server is stopped.
+        cancel_futures : bool
+            Whether to cancel the tasks not yet completed.
+        """
+        with self._lock:
+            first = not self._shutdown
+            self._shutdown = True
+            futures = list(self._futures)
+        if cancel_futures:
+            for future in futures:
+                future.cancel()
+        if not first:
+            if wait:
+                self._server.join()
+            return
+        if wait:
+            self._stop(futures)
+        else:
+            Thread(target=self._stop, args=(futures,), daemon=True).start()
+
+    def _stop(self, futures) -> None:
+        """
+        _stop Stops the server once futures are done.
+
+        Parameters
+        ----------
+        futures : list
+            The futures to wait for.
+        """
+        wait(futures)
+        if self._server.running:
+            self._server.stop()
+        self._server.join()
+
+    def _submit(self, spec, parameters):
+        """
+        _submit Submits a task to the server.
+
+        Parameters
+        ----------
+        spec : dict
+            The function, as returned by pack_function.
+        parameters : list
+            The arguments of the function.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future of the output of the task.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError(
+                    "cannot schedule new futures after shutdown")
+            future = self._server.submit(spec, parameters)
+            self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        return future
+
+    def _pack(self, fn, call) -> dict:
+        """
+        _pack Packs a function to be sent to the clients, once per
+        calling convention.
+
+        Parameters
+        ----------
+        fn : function
+            The function.
+        call : str
+            How the function is called, as in pack_function.
+
+        Returns
+        -------
+        dict
+            The function, as returned by pack_function.
+        """
+        if not callable(fn):
+            raise TypeError("Function must be callable.")
+        try:
+            packed = self._packed.setdefault(fn, {})
+        except TypeError:
+            packed = {}
+        if call not in packed:
+            packed[call] = pack_function(fn, call)
+        return packed[call]
+
+
+def _outputs(futures, end):
+    """
+    _outputs Yields the outputs of the chunks of a map, in order.
+
+    Parameters
+    ----------
+    futures : list
+        The future of each chunk.
+    end : float
+        The time.monotonic() to wait for the outputs until, None to wait
+        as long as needed.
+
+    Yields
+    ------
+    object
+        The output of each set of arguments.
+    """
+    try:
+        futures.reverse()
+        while futures:
+            future = futures.pop()
+            if end is None:
+                yield from future.result()
+            else:
+                yield from future.result(end - time.monotonic())
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,331 @@
+"""Functions module for the parally package.
+
+The Server can ship the function its clients run in the handshake, as the
+source of the module defining it or as a marshalled code object. Clients
+keep every function they load keyed by the hash of its code, so it is
+compiled once per process, and the bytecode of module sources is cached
+on disk so it is compiled once per machine.
+"""
+
+import base64
+import builtins
+import hashlib
+import inspect
+import marshal
+import os
+import sys
+import types
+from threading import Lock
+
+__all__ = ['pack_function', 'load_function', 'ShippedFunction']
+
+CALLS = ('parameters', 'arguments', 'chunk')
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'parally')
+
+MODULE_PREFIX = 'parally_function_'
+
+_loaded = {}
+_lock = Lock()
+
+
+def pack_function(function, call='parameters') -> dict:
+    """
+    pack_function Packs a function to be sent to the clients.
+
+    A function defined at the top level of a module is sent with the
+    source of the whole module, so it can use the imports and helpers of
+    the module. Any other function is sent as a code object, and must
+    import what it uses in its body.
+
+    Parameters
+    ----------
+    function : function
+        The function to pack.
+    call : str
+        How the function is called with the parameters of a task:
+        'parameters' passes them as they are, 'arguments' unpacks them
+        as a list of arguments and a dict of keyword arguments, and
+        'chunk' calls it on each list of arguments of a list.
+
+    Returns
+    -------
+    dict
+        The name, kind and code of the function, and its hash.
+    """
+    if not isinstance(function, types.FunctionType):
+        raise TypeError("Only Python functions can be shipped.")
+    if call not in CALLS:
+        raise ValueError("Call must be one of {}.".format(", ".join(CALLS)))
+    module = inspect.getmodule(function)
+    spec = None
+    if module is not None and \
+            getattr(module, function.__name__, None) is function:
+        try:
+            spec = {"name": function.__name__, "kind": "source",
+                    "package": module.__package__ or None,
+                    "code": inspect.getsource(module)}
+        except (OSError, TypeError):
+            spec = None
+    if spec is None:
+        if function.__closure__:
+            raise ValueError("Function {} uses variables of an enclosing "
+                             "function and cannot be shipped."
+                             .format(function.__qualname__))
+        try:
+            code = marshal.dumps((function.__code__, function.__defaults__,
+                                  function.__kwdefaults__))
+        except ValueError:
+            raise ValueError("Default arguments of function {} cannot be "
+                             "shipped.".format(function.__qualname__))
+        spec = {"name": function.__name__, "kind": "code",
+                "python": _python(),
+                "code": base64.b64encode(code).decode('ascii')}
+    spec["call"] = call
+    spec["hash"] = _digest(spec)
+    return spec
+
+
+def load_function(spec, directory=CACHE_DIR):
+    """
+    load_function Loads a function sent by the server.
+
+    Parameters
+    ----------
+    spec : dict
+        The function, as returned by pack_function.
+    directory : str
+        The directory the bytecode of module sources is cached in. None
+        to disable the cache on disk.
+
+    Returns
+    -------
+    ShippedFunction
+        The function.
+    """
+    function = ShippedFunction(spec, directory)
+    function.load()
+    return function
+
+
+class ShippedFunction:
+    """
+    A function sent by the server. It pickles as its code, so it can be
+    run on a process pool, and is loaded once per process.
+    """
+    __slots__ = ('spec', 'directory', '_function')
+
+    def __init__(self, spec, directory=CACHE_DIR):
+        """
+        __init__ Initialises the ShippedFunction object.
+
+        Parameters
+        ----------
+        spec : dict
+            The function, as returned by pack_function.
+        directory : str
+            The directory the bytecode of module sources is cached in.
+        """
+        self.spec = spec
+        self.directory = directory
+        self._function = None
+
+    def load(self):
+        """
+        load Compiles the function, unless this process already did.
+
+        Returns
+        -------
+        function
+            The function.
+        """
+        if self._function is None:
+            key = _digest(self.spec)
+            with _lock:
+                function = _loaded.get(key)
+                if function is None:
+                    function = _build(self.spec, key, self.directory)
+                    _loaded[key] = function
+            self._function = function
+        return self._function
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __reduce__(self):
+        return (ShippedFunction, (self.spec, self.directory))
+
+    def __repr__(self):
+        return "<shipped function {} {}>".format(self.spec['name'],
+                                                 self.spec['hash'][:12])
+
+
+def _build(spec, key, directory):
+    """
+    _build Compiles a function sent by the server.
+
+    Parameters
+    ----------
+    spec : dict
+        The function, as returned by pack_function.
+    key : str
+        The hash of the function.
+    directory : str
+        The directory the bytecode of module sources is cached in.
+
+    Returns
+    -------
+    function
+        The function.
+    """
+    function = _define(spec, key, directory)
+    call = spec.get('call', 'parameters')
+    if call == 'parameters':
+        return function
+    return CallWith(function, call == 'chunk')
+
+
+class CallWith:
+    """
+    Calls a function with the arguments held by the parameters of a
+    task, rather than with the parameters.
+    """
+    __slots__ = ('function', 'chunk')
+
+    def __init__(self, function, chunk=False):
+        """
+        __init__ Initialises the CallWith object.
+
+        Parameters
+        ----------
+        function : function
+            The function.
+        chunk : bool
+            Whether the parameters are a list of lists of arguments, the
+            function being called on each, instead of a list of
+            arguments and a dict of keyword arguments.
+        """
+        self.function = function
+        self.chunk = chunk
+
+    def __call__(self, parameters):
+        if self.chunk:
+            return [self.function(*args) for args in parameters]
+        (args, kwargs) = parameters
+        return self.function(*args, **kwargs)
+
+
+def _define(spec, key, directory):
+    """
+    _define Compiles the function of a spec.
+
+    Parameters
+    ----------
+    spec : dict
+        The function, as returned by pack_function.
+    key : str
+        The hash of the function.
+    directory : str
+        The directory the bytecode of module sources is cached in.
+
+    Returns
+    -------
+    function
+        The function.
+    """
+    if spec['kind'] == 'code':
+        if spec['python'] != _python():
+            raise ValueError("Function {} was packed by Python {}, not {}."
+                             .format(spec['name'], spec['python'], _python()))
+        (code, defaults, kwdefaults) = marshal.loads(
+            base64.b64decode(spec['code']))
+        function = types.FunctionType(code, {'__builtins__': builtins},
+                                      spec['name'], defaults)
+        function.__kwdefaults__ = kwdefaults
+        return function
+    if spec['kind'] != 'source':
+        raise ValueError("Unknown function kind: {}.".format(spec['kind']))
+    code = _compile(spec, key, directory)
+    module = types.ModuleType(MODULE_PREFIX + key[:16])
+    module.__package__ = spec.get('package')
+    sys.modules[module.__name__] = module
+    exec(code, module.__dict__)
+    function = getattr(module, spec['name'], None)
+    if not callable(function):
+        raise ValueError("Function {} not found in its module."
+                         .format(spec['name']))
+    return function
+
+
+def _compile(spec, key, directory):
+    """
+    _compile Compiles the source of a module, reading the bytecode from
+    the cache on disk if it is there and writing it otherwise.
+
+    Parameters
+    ----------
+    spec : dict
+        The function, as returned by pack_function.
+    key : str
+        The hash of the function.
+    directory : str
+        The directory of the cache, None to disable it.
+
+    Returns
+    -------
+    code
+        The code of the module.
+    """
+    path = None
+    if directory is not None:
+        path = os.path.join(directory, "{}.{}.pyc".format(
+            key, sys.implementation.cache_tag))
+        try:
+            with open(path, 'rb') as file:
+                return marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+    code = compile(spec['code'], "<parally {}>".format(spec['name']), 'exec')
+    if path is not None:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            temporary = "{}.{}".format(path, os.getpid())
+            with open(temporary, 'wb') as file:
+                marshal.dump(code, file)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+    return code
+
+
+def _digest(spec) -> str:
+    """
+    _digest Returns the hash of a packed function.
+
+    Parameters
+    ----------
+    spec : dict
+        The function, as returned by pack_function.
+
+    Returns
+    -------
+    str
+        The hash of its name, kind, calling convention and code.
+    """
+    digest = hashlib.sha256()
+    for field in ('name', 'kind', 'package', 'python', 'call', 'code'):
+        digest.update(str(spec.get(field)).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _python() -> str:
+    """
+    _python Returns the version of Python code objects are tied to.
+
+    Returns
+    -------
+    str
+        The implementation and the major and minor versions.
+    """
+    return "{}-{}.{}".format(sys.implementation.name, *sys.version_info[:2])
@@ -0,0 +1,274 @@
+"""Jobs module for the parally package.
+
+A Server can run several jobs at once on the same clients. A Job holds
+the batches and the scheduler of a set of parameters and the function the
+clients run them with, and hands the outcome of each of its tasks to a
+future, or to an iterator yielding them in order.
+"""
+
+import queue
+from concurrent.futures import Future
+from threading import Lock
+
+__all__ = ['Job']
+
+
+class Job:
+    """
+    The batches of a set of parameters run with the same function, and
+    where the outcome of each task goes.
+    """
+    def __init__(self, tasks, scheduler, job_id=None, function=None,
+                 ordered=False, open=False):
+        """
+        __init__ Initialises the Job object.
+
+        Parameters
+        ----------
+        tasks : TaskStore
+            The batches of the job.
+        scheduler : Scheduler
+            The policy sizing the batches of the job.
+        job_id : int
+            The ID of the job, None for the parameters bound to the
+            server, which run with the function of the handshake.
+        function : dict
+            The function the clients run, as returned by pack_function,
+            None to let them use their own.
+        ordered : bool
+            Whether the outcomes are read in order with results().
+        open : bool
+            Whether parameters are submitted to the job while it runs, in
+            which case it is never done.
+        """
+        self.job_id = job_id
+        self.tasks = tasks
+        self.scheduler = scheduler
+        self.function = function
+        self.open = open
+        self._lock = Lock()
+        self._futures = {}
+        self._results = queue.Queue() if ordered else None
+        self._error = None
+
+    def submit(self, parameters) -> Future:
+        """
+        submit Adds parameters to an open job.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters of the task.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future of the output of the task.
+        """
+        future = Future()
+        with self._lock:
+            index = self.tasks.get_source().put(parameters)
+            self._futures[index] = future
+        return future
+
+    def is_done(self) -> bool:
+        """
+        is_done Checks if every task of the job has completed.
+
+        Returns
+        -------
+        bool
+            True if the job is done, False otherwise. An open job is
+            never done.
+        """
+        return not self.open and self.tasks.is_done()
+
+    def start(self, task) -> bool:
+        """
+        start Marks the futures of a new batch as running as it is
+        dispatched, and drops the tasks whose future was cancelled.
+
+        Parameters
+        ----------
+        task : Task
+            The batch.
+
+        Returns
+        -------
+        bool
+            True if tasks are left in the batch, False otherwise.
+        """
+        kept = []
+        with self._lock:
+            if not self._futures:
+                return True
+            for position, index in enumerate(task.indexes):
+                future = self._futures.get(index)
+                if future is None or future.set_running_or_notify_cancel():
+                    kept.append(position)
+                else:
+                    del self._futures[index]
+        if len(kept) < len(task.indexes):
+            task.indexes = [task.indexes[i] for i in kept]
+            task.parameters = [task.parameters[i] for i in kept]
+        return bool(kept)
+
+    def share(self) -> int:
+        """
+        share Returns the number of batches of the job in flight, which
+        jobs are dispatched in increasing order of.
+
+        Returns
+        -------
+        int
+            The number of batches in flight.
+        """
+        return len(self.tasks.get_in_flight())
+
+    def set_result(self, index, output) -> None:
+        """
+        set_result Hands the output of a task to its future, or to the
+        results iterator.
+
+        Parameters
+        ----------
+        index : int
+            The position of the task in the job.
+        output : object
+            The output of the task.
+        """
+        self._deliver(index, output, None)
+
+    def set_error(self, index, error, exception=None) -> None:
+        """
+        set_error Hands the error of a task to its future, or to the
+        results iterator.
+
+        Parameters
+        ----------
+        index : int
+            The position of the task in the job.
+        error : str
+            The error message.
+        exception : BaseException
+            The exception raised by the task, raised again in place of
+            a RuntimeError with the error message. None if it was not
+            sent.
+        """
+        self._deliver(index, None, error if exception is None
+                      else exception)
+
+    def _deliver(self, index, output, error) -> None:
+        """
+        _deliver Hands the outcome of a task to its future, or to the
+        results iterator.
+
+        Parameters
+        ----------
+        index : int
+            The position of the task in the job.
+        output : object
+            The output of the task.
+        error : str or BaseException
+            The error message or the exception, None if the task
+            succeeded.
+        """
+        with self._lock:
+            future = self._futures.pop(index, None)
+        if future is not None:
+            _settle(future, output, error)
+        if self._results is not None:
+            self._results.put((index, output, error))
+
+    def results(self):
+        """
+        results Iterates over the outputs of the tasks in the order of
+        their parameters, blocking until the next one arrives.
+
+        Yields
+        ------
+        object
+            The output of each task.
+
+        Raises
+        ------
+        RuntimeError
+            At the position of a task that failed, unless its exception
+            was sent, or if the job was closed before it completed.
+        """
+        buffered = {}
+        position = 0
+        item = self._results.get()
+        while item is not None:
+            buffered[item[0]] = item
+            while position in buffered:
+                (_, output, error) = buffered.pop(position)
+                position += 1
+                if error is not None:
+                    raise _exception(error)
+                yield output
+            item = self._results.get()
+        if self._error is not None:
+            raise RuntimeError(self._error)
+
+    def close(self, error=None) -> None:
+        """
+        close Drops the parameters left and fails the tasks that have not
+        completed.
+
+        Parameters
+        ----------
+        error : str
+            Why the job was closed, None if it completed.
+        """
+        self.tasks.close()
+        self._error = error
+        with self._lock:
+            futures = list(self._futures.values())
+            self._futures = {}
+        for future in futures:
+            _settle(future, None, error or "Job closed.")
+        if self._results is not None:
+            self._results.put(None)
+
+
+def _settle(future, output, error) -> None:
+    """
+    _settle Hands the outcome of a task to its future, unless it was
+    cancelled. A future is set running first, after which it can no
+    longer be cancelled by another thread.
+
+    Parameters
+    ----------
+    future : concurrent.futures.Future
+        The future of the task.
+    output : object
+        The output of the task.
+    error : str or BaseException
+        The error message or the exception, None if the task succeeded.
+    """
+    if not future.running() and not future.set_running_or_notify_cancel():
+        return
+    if error is None:
+        future.set_result(output)
+    else:
+        future.set_exception(_exception(error))
+
+
+def _exception(error) -> BaseException:
+    """
+    _exception Returns the exception a failed task raises.
+
+    Parameters
+    ----------
+    error : str or BaseException
+        The error message or the exception.
+
+    Returns
+    -------
+    BaseException
+        The exception, or a RuntimeError with the error message.
+    """
+    if isinstance(error, BaseException):
+        return error
+    return RuntimeError(error)
@@ -0,0 +1,127 @@
+"""Journal module for the parally package.
+
+A Journal appends the result of every completed task to a file, so a job
+interrupted by a crash can be resumed without running them again. Records
+are flushed to disk in batches to limit the cost of fsync.
+"""
+
+import os
+import pickle
+import struct
+import time
+
+__all__ = ['Journal']
+
+RECORD = struct.Struct('!I')
+
+
+class Journal:
+    """
+    An append-only file of results, keyed by the position of their
+    parameters in the source of the job.
+    """
+    def __init__(self, path, sync_every=256, sync_interval=1.0):
+        """
+        __init__ Initialises the Journal object.
+
+        Parameters
+        ----------
+        path : str
+            The path of the journal, created if needed.
+        sync_every : int
+            Number of records written between two fsyncs.
+        sync_interval : float
+            Longest time in seconds a record waits to be fsynced.
+        """
+        self._path = path
+        self._sync_every = max(1, sync_every)
+        self._sync_interval = sync_interval
+        self._file = None
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def load(self) -> dict:
+        """
+        load Reads the results written so far. A record cut short by a
+        crash, or that cannot be read, is dropped with everything after
+        it, and the file is truncated to the last good record.
+
+        Returns
+        -------
+        dict
+            The input parameters and the output of each task, keyed by
+            position.
+        """
+        results = {}
+        if not os.path.exists(self._path):
+            return results
+        end = 0
+        with open(self._path, 'rb') as file:
+            while True:
+                header = file.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    break
+                (length,) = RECORD.unpack(header)
+                payload = file.read(length)
+                if len(payload) < length:
+                    break
+                try:
+                    (index, result) = pickle.loads(payload)
+                except Exception:
+                    # A corrupt payload raises about any error, such as
+                    # AttributeError or ImportError: it ends the journal
+                    # like a short one.
+                    break
+                results[index] = result
+                end = file.tell()
+        if end < os.path.getsize(self._path):
+            os.truncate(self._path, end)
+        return results
+
+    def append(self, index, result) -> None:
+        """
+        append Writes the result of a task.
+
+        Parameters
+        ----------
+        index : int
+            The position of the parameters of the task in the source.
+        result : dict
+            The input parameters and the output of the task.
+        """
+        if self._file is None:
+            self._file = open(self._path, 'ab')
+        payload = pickle.dumps((index, result), protocol=5)
+        self._file.write(RECORD.pack(len(payload)) + payload)
+        self._unsynced += 1
+        if self._unsynced >= self._sync_every or \
+                time.monotonic() - self._synced_at >= self._sync_interval:
+            self.sync()
+
+    def sync_if_due(self) -> None:
+        """
+        sync_if_due Flushes the records written to disk if the oldest
+        one has waited for sync_interval seconds.
+        """
+        if self._unsynced and \
+                time.monotonic() - self._synced_at >= self._sync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """
+        sync Flushes the records written to disk.
+        """
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def close(self) -> None:
+        """
+        close Flushes the records written and closes the file.
+        """
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
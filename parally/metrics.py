@@ -0,0 +1,357 @@
+"""Metrics module for the parally package.
+
+The Server keeps counters and histograms of its activity in a Metrics
+object, returned as a dict by Server.stats() and optionally served in the
+Prometheus text format over HTTP.
+"""
+
+import bisect
+import math
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+__all__ = ['Histogram', 'WorkerStats', 'Metrics', 'serve_metrics']
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+SERIALIZATION_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05,
+                         0.1, 0.5, 1.0)
+
+
+class Histogram:
+    """
+    A histogram of values with fixed bucket bounds, like Prometheus'.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        __init__ Initialises the Histogram object.
+
+        Parameters
+        ----------
+        buckets : tuple
+            The upper bounds of the buckets, sorted.
+        """
+        self._bounds = tuple(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value, count=1) -> None:
+        """
+        observe Records a value.
+
+        Parameters
+        ----------
+        value : float
+            The value to record.
+        count : int
+            The number of times to record it.
+        """
+        self._counts[bisect.bisect_left(self._bounds, value)] += count
+        self._sum += value * count
+        self._count += count
+
+    def quantile(self, q) -> float:
+        """
+        quantile Estimates a quantile of the values, interpolating
+        linearly within its bucket like Prometheus' histogram_quantile.
+
+        Parameters
+        ----------
+        q : float
+            The quantile, between 0 and 1.
+
+        Returns
+        -------
+        float
+            The estimated quantile, nan if no value was recorded. Values
+            above the last bound are reported as the last bound.
+        """
+        if self._count == 0:
+            return math.nan
+        rank = q * self._count
+        below = 0
+        for i, count in enumerate(self._counts):
+            if count and below + count >= rank:
+                if i == len(self._bounds):
+                    return self._bounds[-1]
+                lower = self._bounds[i - 1] if i > 0 else 0.0
+                return lower + (self._bounds[i] - lower) * \
+                    (rank - below) / count
+            below += count
+        return self._bounds[-1]
+
+    def to_dict(self) -> dict:
+        """
+        to_dict Returns the histogram as a dict.
+
+        Returns
+        -------
+        dict
+            The cumulative count of each bucket keyed by upper bound, the
+            sum and the count of the values.
+        """
+        buckets, total = {}, 0
+        for bound, count in zip(self._bounds + (math.inf,), self._counts):
+            total += count
+            buckets[bound] = total
+        return {"buckets": buckets, "sum": self._sum, "count": self._count}
+
+
+class WorkerStats:
+    """
+    The traffic and the busy time of a worker.
+    """
+    def __init__(self):
+        """
+        __init__ Initialises the WorkerStats object.
+        """
+        self.connected = time.monotonic()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.tasks = 0
+        self._busy = 0.0
+        self._busy_since = None
+
+    def set_busy(self, busy) -> None:
+        """
+        set_busy Records whether the worker has batches in flight.
+
+        Parameters
+        ----------
+        busy : bool
+            True if the worker has batches in flight, False otherwise.
+        """
+        if busy and self._busy_since is None:
+            self._busy_since = time.monotonic()
+        elif not busy and self._busy_since is not None:
+            self._busy += time.monotonic() - self._busy_since
+            self._busy_since = None
+
+    def busy_fraction(self) -> float:
+        """
+        busy_fraction Returns the fraction of the time the worker has
+        had batches in flight since it connected.
+
+        Returns
+        -------
+        float
+            The busy fraction, between 0 and 1.
+        """
+        now = time.monotonic()
+        busy = self._busy
+        if self._busy_since is not None:
+            busy += now - self._busy_since
+        elapsed = now - self.connected
+        return min(1.0, busy / elapsed) if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        """
+        to_dict Returns the stats as a dict.
+
+        Returns
+        -------
+        dict
+            The traffic, the tasks completed and the busy fraction.
+        """
+        return {"bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "messages_sent": self.messages_sent,
+                "messages_received": self.messages_received,
+                "tasks": self.tasks,
+                "busy_fraction": self.busy_fraction()}
+
+
+class Metrics:
+    """
+    The counters and histograms of a Server.
+    """
+    COUNTERS = ('succeeded', 'failed', 'retried', 'cached', 'resumed')
+
+    def __init__(self):
+        """
+        __init__ Initialises the Metrics object.
+        """
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.encode = Histogram(SERIALIZATION_BUCKETS)
+        self.decode = Histogram(SERIALIZATION_BUCKETS)
+        self._workers = {}
+        self._totals = WorkerStats()
+
+    def add_worker(self, address) -> WorkerStats:
+        """
+        add_worker Returns the stats of a new worker.
+
+        Parameters
+        ----------
+        address : tuple
+            The address of the worker.
+
+        Returns
+        -------
+        WorkerStats
+            The stats of the worker.
+        """
+        stats = WorkerStats()
+        self._workers[address] = stats
+        return stats
+
+    def remove_worker(self, address) -> None:
+        """
+        remove_worker Folds the traffic of a worker into the totals.
+
+        Parameters
+        ----------
+        address : tuple
+            The address of the worker.
+        """
+        stats = self._workers.pop(address, None)
+        if stats is None:
+            return
+        for name in ('bytes_sent', 'bytes_received', 'messages_sent',
+                     'messages_received', 'tasks'):
+            setattr(self._totals, name,
+                    getattr(self._totals, name) + getattr(stats, name))
+
+    def to_dict(self, pending=None, in_flight=0) -> dict:
+        """
+        to_dict Returns the metrics as a dict.
+
+        Parameters
+        ----------
+        pending : int
+            The number of parameters left to dispatch, None if unknown.
+        in_flight : int
+            The number of parameters in flight.
+
+        Returns
+        -------
+        dict
+            The tasks, traffic, histograms and per-worker stats.
+        """
+        workers = list(self._workers.items())
+        traffic = {}
+        for name in ('bytes_sent', 'bytes_received', 'messages_sent',
+                     'messages_received'):
+            traffic[name] = getattr(self._totals, name) + sum(
+                getattr(stats, name) for _, stats in workers)
+        tasks = dict(self.counters, pending=pending, in_flight=in_flight)
+        return dict(traffic, tasks=tasks,
+                    latency=self.latency.to_dict(),
+                    encode=self.encode.to_dict(),
+                    decode=self.decode.to_dict(),
+                    workers={"{}:{}".format(*address): stats.to_dict()
+                             for address, stats in workers})
+
+
+def to_prometheus(stats) -> str:
+    """
+    to_prometheus Formats the stats of a server in the Prometheus text
+    exposition format.
+
+    Parameters
+    ----------
+    stats : dict
+        The stats returned by Server.stats().
+
+    Returns
+    -------
+    str
+        The metrics, one sample per line.
+    """
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append("# HELP parally_{} {}".format(name, help_text))
+        lines.append("# TYPE parally_{} {}".format(name, kind))
+
+    def sample(name, value, labels=None):
+        label = "" if labels is None else "{" + ",".join(
+            '{}="{}"'.format(k, v) for k, v in labels.items()) + "}"
+        lines.append("parally_{}{} {}".format(name, label, value))
+
+    for name, value in stats['tasks'].items():
+        if value is None:
+            continue
+        kind = 'gauge' if name in ('pending', 'in_flight') else 'counter'
+        suffix = '' if kind == 'gauge' else '_total'
+        family("tasks_{}{}".format(name, suffix), kind,
+               "Tasks {}.".format(name.replace('_', ' ')))
+        sample("tasks_{}{}".format(name, suffix), value)
+    for name in ('bytes_sent', 'bytes_received', 'messages_sent',
+                 'messages_received'):
+        family("{}_total".format(name), 'counter',
+               "{} over every connection.".format(
+                   name.replace('_', ' ').capitalize()))
+        sample("{}_total".format(name), stats[name])
+    for name, help_text in (
+            ('latency', "Time from dispatch to result of each task."),
+            ('encode', "Time spent serializing each message."),
+            ('decode', "Time spent deserializing each message.")):
+        metric = "{}_seconds".format(
+            'task_latency' if name == 'latency' else name)
+        histogram = stats[name]
+        family(metric, 'histogram', help_text)
+        for bound, count in histogram['buckets'].items():
+            le = "+Inf" if bound == math.inf else repr(bound)
+            lines.append('parally_{}_bucket{{le="{}"}} {}'.format(
+                metric, le, count))
+        lines.append("parally_{}_sum {}".format(metric, histogram['sum']))
+        lines.append("parally_{}_count {}".format(metric,
+                                                  histogram['count']))
+    # Each family is written once with the samples of every worker, as
+    # the format requires the samples of a family to be contiguous.
+    for name, field, kind, help_text in (
+            ('worker_busy_ratio', 'busy_fraction', 'gauge',
+             "Fraction of the time a worker has tasks in flight."),
+            ('worker_tasks_total', 'tasks', 'counter',
+             "Tasks completed by a worker.")):
+        family(name, kind, help_text)
+        for worker, worker_stats in stats['workers'].items():
+            sample(name, worker_stats[field], {"worker": worker})
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(function, port, host='localhost') -> ThreadingHTTPServer:
+    """
+    serve_metrics Serves stats in the Prometheus text format on
+    http://host:port/metrics, from a background thread.
+
+    Parameters
+    ----------
+    function : function
+        Called on each request to get the stats to serve.
+    port : int
+        The port to listen on.
+    host : str
+        The host to listen on.
+
+    Returns
+    -------
+    ThreadingHTTPServer
+        The HTTP server, to be shut down once done.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = to_prometheus(function()).encode()
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,576 @@
+"""Protocol module for the parally package.
+
+Every message exchanged between a Server and a Client is sent as a frame:
+a header made of a 1-byte compression codec and an 8-byte big-endian
+length, followed by the payload. The payload holds the serialized body
+followed by the raw buffers the serializer sends out-of-band, such as the
+data of NumPy arrays.
+"""
+
+import lzma
+import struct
+import zlib
+from collections import deque
+from itertools import islice
+
+from .serializers import JSONSerializer
+
+__all__ = ['Compression', 'FrameBuffer', 'FrameQueue', 'encode_message',
+           'decode_message', 'send_frame', 'send_message', 'recv_frame',
+           'recv_message']
+
+HEADER = struct.Struct('!BQ')
+COUNT = struct.Struct('!I')
+LENGTH = struct.Struct('!Q')
+ALIGNMENT = 64
+BUFFER_SIZE = 64 * 1024
+MAX_FRAME_SIZE = 1 << 34
+MAX_SEGMENTS = 64
+JSON = JSONSerializer()
+CODECS = {'zlib': 1, 'lzma': 2}
+
+
+class Compression:
+    """
+    The compression settings of the frames sent on a connection.
+
+    Only the payloads larger than the threshold are compressed, and they
+    are sent as is when compression does not make them smaller.
+    """
+    def __init__(self, codec='zlib', threshold=64 * 1024, level=None):
+        """
+        __init__ Initialises the Compression object.
+
+        Parameters
+        ----------
+        codec : str
+            The codec to use: 'zlib' or 'lzma'.
+        threshold : int
+            Size in bytes from which payloads are compressed.
+        level : int
+            The compression level of zlib or the preset of lzma,
+            None for the codec's default.
+        """
+        if codec not in CODECS:
+            raise ValueError("Unknown compression codec: {}. Available: {}."
+                             .format(codec, ", ".join(CODECS)))
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+
+    def to_dict(self) -> dict:
+        """
+        to_dict Returns the settings, to be sent to the clients.
+
+        Returns
+        -------
+        dict
+            The codec, threshold and level.
+        """
+        return {'codec': self.codec, 'threshold': self.threshold,
+                'level': self.level}
+
+    def compress(self, views) -> tuple:
+        """
+        compress Compresses the segments of a payload above the threshold.
+
+        Parameters
+        ----------
+        views : list
+            The memoryviews making up the payload.
+
+        Returns
+        -------
+        (int, list)
+            The codec flag of the header and the segments to send.
+        """
+        size = sum(len(view) for view in views)
+        if size < self.threshold:
+            return 0, views
+        if self.codec == 'zlib':
+            compressor = zlib.compressobj(
+                zlib.Z_DEFAULT_COMPRESSION if self.level is None
+                else self.level)
+        else:
+            compressor = lzma.LZMACompressor(preset=self.level)
+        compressed = [compressor.compress(view) for view in views]
+        compressed.append(compressor.flush())
+        if sum(len(part) for part in compressed) >= size:
+            return 0, views
+        return CODECS[self.codec], [memoryview(part) for part in compressed]
+
+
+def get_compression(compression):
+    """
+    get_compression Returns compression settings from a codec name.
+
+    Parameters
+    ----------
+    compression : str or dict or Compression or None
+        The name of the codec, the settings or None for no compression.
+
+    Returns
+    -------
+    Compression or None
+        The compression settings.
+    """
+    if compression is None or isinstance(compression, Compression):
+        return compression
+    if isinstance(compression, dict):
+        return Compression(**compression)
+    return Compression(compression)
+
+
+def decompress(codec, payload) -> bytearray:
+    """
+    decompress Decompresses the payload of a frame.
+
+    Parameters
+    ----------
+    codec : int
+        The codec flag of the header.
+    payload : bytes-like
+        The payload received.
+
+    Returns
+    -------
+    bytearray
+        The original payload.
+
+    Raises
+    ------
+    ValueError
+        If the codec is unknown or the payload is corrupt.
+    """
+    if codec == 0:
+        return payload
+    try:
+        if codec == CODECS['zlib']:
+            return bytearray(zlib.decompress(payload))
+        if codec == CODECS['lzma']:
+            return bytearray(lzma.decompress(payload))
+    except (zlib.error, lzma.LZMAError) as e:
+        raise ValueError("Cannot decompress frame: {}".format(e))
+    raise ValueError("Unknown compression codec flag: {}.".format(codec))
+
+
+def frame_segments(segments, compression=None) -> list:
+    """
+    frame_segments Returns the header and the segments of a frame.
+
+    Parameters
+    ----------
+    segments : list
+        The bytes-like segments making up the payload of the frame.
+    compression : Compression
+        The compression settings of the connection, if any.
+
+    Returns
+    -------
+    list
+        The memoryviews of the header and of the payload.
+    """
+    views = [memoryview(segment).cast('B') for segment in segments]
+    codec = 0
+    if compression is not None:
+        codec, views = compression.compress(views)
+    header = HEADER.pack(codec, sum(len(view) for view in views))
+    return [memoryview(header)] + views
+
+
+class FrameBuffer:
+    """
+    A reassembly buffer that splits a byte stream into frames.
+
+    Small frames are read into a preallocated buffer and copied out once
+    complete. Frames larger than the buffer are received straight into a
+    dedicated bytearray of the exact size, which is then handed over to the
+    caller without any further copies.
+    """
+    def __init__(self, size=BUFFER_SIZE, max_frame_size=MAX_FRAME_SIZE):
+        """
+        __init__ Initialises the FrameBuffer object.
+
+        Parameters
+        ----------
+        size : int
+            Size of the preallocated reassembly buffer in bytes.
+        max_frame_size : int
+            Largest frame accepted before the stream is considered corrupt.
+        """
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._frame = None
+        self._frame_view = None
+        self._frame_codec = 0
+        self._frame_received = 0
+        self._max_frame_size = max_frame_size
+
+    def recv_from(self, sock) -> int:
+        """
+        recv_from Receives the bytes available on a socket.
+
+        Parameters
+        ----------
+        sock : socket.socket
+            The socket to receive from.
+
+        Returns
+        -------
+        int
+            The number of bytes received, 0 if the peer closed the connection.
+        """
+        if self._frame is not None:
+            received = sock.recv_into(
+                self._frame_view[self._frame_received:])
+            self._frame_received += received
+            return received
+        if self._end == len(self._buffer):
+            self._compact()
+        received = sock.recv_into(self._view[self._end:])
+        self._end += received
+        return received
+
+    def next_frame(self):
+        """
+        next_frame Returns the next complete frame, if any.
+
+        Returns
+        -------
+        bytearray or None
+            The payload of the frame, None if no complete frame is buffered.
+        """
+        if self._frame is not None:
+            if self._frame_received < len(self._frame):
+                return None
+            frame = self._frame
+            self._frame = None
+            self._frame_view = None
+            self._frame_received = 0
+            return decompress(self._frame_codec, frame)
+
+        available = self._end - self._start
+        if available < HEADER.size:
+            self._compact()
+            return None
+        (codec, length) = HEADER.unpack_from(self._buffer, self._start)
+        if length > self._max_frame_size:
+            raise ValueError("Frame of {} bytes exceeds the limit of {}."
+                             .format(length, self._max_frame_size))
+
+        start = self._start + HEADER.size
+        if available - HEADER.size >= length:
+            self._start = start + length
+            if codec:
+                return decompress(codec, self._view[start:self._start])
+            return bytearray(self._view[start:self._start])
+
+        if length > len(self._buffer) - HEADER.size:
+            received = self._end - start
+            self._frame = bytearray(length)
+            self._frame_view = memoryview(self._frame)
+            self._frame_codec = codec
+            self._frame_view[:received] = self._view[start:self._end]
+            self._frame_received = received
+            self._start = self._end = 0
+        else:
+            self._compact()
+        return None
+
+    def buffered(self) -> bool:
+        """
+        buffered Checks if bytes of a frame not yet returned are buffered.
+
+        Returns
+        -------
+        bool
+            True if some bytes are buffered, False otherwise.
+        """
+        return self._frame is not None or self._end > self._start
+
+    def frames(self):
+        """
+        frames Iterates over all the complete frames buffered.
+
+        Yields
+        ------
+        bytearray
+            The payload of each frame.
+        """
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+    def _compact(self) -> None:
+        """
+        _compact Moves the unread bytes to the start of the buffer.
+        """
+        if self._start == 0:
+            return
+        remaining = self._end - self._start
+        self._view[:remaining] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = remaining
+
+
+class FrameQueue:
+    """
+    A queue of outgoing frames for a non-blocking socket.
+
+    Payloads are queued as memoryviews next to their headers and written
+    with scatter-gather sends, so they are never concatenated in memory.
+    """
+    def __init__(self, compression=None):
+        """
+        __init__ Initialises the FrameQueue object.
+
+        Parameters
+        ----------
+        compression : Compression
+            The compression settings of the connection, if any.
+        """
+        self._segments = deque()
+        self.compression = compression
+        self.sent = 0
+
+    def push(self, segments) -> None:
+        """
+        push Queues a payload to be sent as a single frame.
+
+        Parameters
+        ----------
+        segments : list
+            The bytes-like segments making up the payload of the frame.
+        """
+        self._segments.extend(frame_segments(segments, self.compression))
+
+    def pending(self) -> bool:
+        """
+        pending Checks if there are bytes left to send.
+
+        Returns
+        -------
+        bool
+            True if the queue is not empty, False otherwise.
+        """
+        return bool(self._segments)
+
+    def send_to(self, sock) -> bool:
+        """
+        send_to Sends as many queued bytes as the socket accepts.
+
+        Parameters
+        ----------
+        sock : socket.socket
+            The non-blocking socket to send on.
+
+        Returns
+        -------
+        bool
+            True if the queue has been drained, False otherwise.
+        """
+        while self._segments:
+            try:
+                if hasattr(sock, 'sendmsg'):
+                    sent = sock.sendmsg(
+                        list(islice(self._segments, MAX_SEGMENTS)))
+                else:
+                    sent = sock.send(self._segments[0])
+            except (BlockingIOError, InterruptedError):
+                return False
+            self.sent += sent
+            _consume(self._segments, sent)
+        return True
+
+
+def _consume(segments, sent) -> None:
+    """
+    _consume Drops the bytes that have been sent from a list of segments.
+
+    Parameters
+    ----------
+    segments : deque
+        The memoryviews waiting to be sent.
+    sent : int
+        The number of bytes sent.
+    """
+    while segments and sent >= len(segments[0]):
+        sent -= len(segments.popleft())
+    if sent:
+        segments[0] = segments[0][sent:]
+
+
+def encode_message(message, serializer=JSON) -> list:
+    """
+    encode_message Encodes a message into the segments of a frame payload.
+
+    The payload starts with the number of out-of-band buffers and the
+    length of the body and of each buffer, followed by the body and the
+    buffers, each aligned on 64 bytes. The buffers are not copied.
+
+    Parameters
+    ----------
+    message : dict
+        The message to encode.
+    serializer : Serializer
+        The serializer of the connection.
+
+    Returns
+    -------
+    list
+        The bytes-like segments of the payload.
+    """
+    body, buffers = serializer.dumps(message)
+    lengths = [len(body)] + [len(buffer) for buffer in buffers]
+    prefix = COUNT.pack(len(buffers)) + b''.join(
+        LENGTH.pack(length) for length in lengths)
+    segments = [prefix, body]
+    offset = len(prefix) + len(body)
+    for buffer in buffers:
+        padding = -offset % ALIGNMENT
+        if padding:
+            segments.append(bytes(padding))
+        segments.append(buffer)
+        offset += padding + len(buffer)
+    return segments
+
+
+def decode_message(payload, serializer=JSON) -> dict:
+    """
+    decode_message Decodes a frame payload into a message.
+
+    The out-of-band buffers are handed to the serializer as views of the
+    payload, so arrays are rebuilt without copying it.
+
+    Parameters
+    ----------
+    payload : bytes or bytearray
+        The payload of a frame.
+    serializer : Serializer
+        The serializer of the connection.
+
+    Returns
+    -------
+    dict
+        The decoded message.
+
+    Raises
+    ------
+    ValueError
+        If the payload is not a message of the serializer, whatever the
+        error the serializer raised.
+    """
+    try:
+        (count,) = COUNT.unpack_from(payload, 0)
+        lengths = struct.unpack_from('!{}Q'.format(count + 1), payload,
+                                     COUNT.size)
+        view = memoryview(payload)
+        offset = COUNT.size + LENGTH.size * (count + 1)
+        body = view[offset:offset + lengths[0]]
+        offset += lengths[0]
+        buffers = []
+        for length in lengths[1:]:
+            offset += -offset % ALIGNMENT
+            buffers.append(view[offset:offset + length])
+            offset += length
+        message = serializer.loads(body, buffers)
+    except Exception as e:
+        raise ValueError("Cannot decode message: {}".format(e)) from e
+    if not isinstance(message, dict):
+        raise ValueError("Message is not a dict.")
+    return message
+
+
+def send_frame(sock, segments, compression=None) -> None:
+    """
+    send_frame Sends a payload as a single frame on a blocking socket.
+
+    The header and the segments of the payload are handed to the kernel
+    together, so large payloads are never concatenated in memory.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        The socket to send on.
+    segments : list
+        The bytes-like segments making up the payload of the frame.
+    compression : Compression
+        The compression settings of the connection, if any.
+    """
+    segments = deque(frame_segments(segments, compression))
+    if not hasattr(sock, 'sendmsg'):
+        for segment in segments:
+            sock.sendall(segment)
+        return
+    while segments:
+        _consume(segments, sock.sendmsg(
+            list(islice(segments, MAX_SEGMENTS))))
+
+
+def send_message(sock, message, serializer=JSON, compression=None) -> None:
+    """
+    send_message Encodes and sends a message on a blocking socket.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        The socket to send on.
+    message : dict
+        The message to send.
+    serializer : Serializer
+        The serializer of the connection.
+    compression : Compression
+        The compression settings of the connection, if any.
+    """
+    send_frame(sock, encode_message(message, serializer), compression)
+
+
+def recv_frame(sock, buffer):
+    """
+    recv_frame Receives the next frame from a blocking socket.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        The socket to receive from.
+    buffer : FrameBuffer
+        The reassembly buffer of the connection.
+
+    Returns
+    -------
+    bytearray or None
+        The payload of the frame, None if the peer closed the connection.
+    """
+    frame = buffer.next_frame()
+    while frame is None:
+        if buffer.recv_from(sock) == 0:
+            return None
+        frame = buffer.next_frame()
+    return frame
+
+
+def recv_message(sock, buffer, serializer=JSON):
+    """
+    recv_message Receives and decodes the next message from a blocking socket.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        The socket to receive from.
+    buffer : FrameBuffer
+        The reassembly buffer of the connection.
+    serializer : Serializer
+        The serializer of the connection.
+
+    Returns
+    -------
+    dict or None
+        The decoded message, None if the peer closed the connection.
+    """
+    frame = recv_frame(sock, buffer)
+    if frame is None:
+        return None
+    return decode_message(frame, serializer)
@@ -0,0 +1,407 @@
+"""Reducers module for the parally package.
+
+A reducer folds the outputs of the tasks of a job into a single value as
+they arrive, so the Server does not keep every result when only an
+aggregate of them is needed. Reducers are associative: two partial values
+can be merged, whatever the outputs they were folded from, so clients can
+fold their own outputs and send the server partial values instead.
+"""
+
+import bisect
+import copy
+import math
+
+from .functions import load_function, pack_function
+
+__all__ = ['Reducer', 'Sum', 'Count', 'Min', 'Max', 'Mean', 'Histogram',
+           'Top', 'Fold', 'get_reducer']
+
+
+class Reducer:
+    """
+    The interface of a reducer. Outputs are added one at a time to a
+    state, which is turned into the value of the reduction at the end.
+    """
+    name = None
+
+    def initial(self):
+        """
+        initial Returns the state before any output is added.
+
+        Returns
+        -------
+        object
+            The initial state.
+        """
+        return None
+
+    def add(self, state, output):
+        """
+        add Adds an output to a state.
+
+        Parameters
+        ----------
+        state : object
+            The state.
+        output : object
+            The output of a task.
+
+        Returns
+        -------
+        object
+            The new state.
+        """
+        raise NotImplementedError
+
+    def merge(self, state, other):
+        """
+        merge Merges two states.
+
+        Parameters
+        ----------
+        state : object
+            A state.
+        other : object
+            Another state.
+
+        Returns
+        -------
+        object
+            The state holding the outputs of both.
+        """
+        raise NotImplementedError
+
+    def result(self, state):
+        """
+        result Returns the value of the reduction of a state.
+
+        Parameters
+        ----------
+        state : object
+            The state.
+
+        Returns
+        -------
+        object
+            The value of the reduction.
+        """
+        return state
+
+    def to_dict(self) -> dict:
+        """
+        to_dict Returns the reducer as sent to the clients.
+
+        Returns
+        -------
+        dict
+            The name and the settings of the reducer, None if it cannot
+            be sent.
+        """
+        if REDUCERS.get(self.name) is not type(self):
+            return None
+        return {"name": self.name}
+
+
+class Sum(Reducer):
+    """
+    The sum of the outputs, numbers or NumPy arrays.
+    """
+    name = 'sum'
+
+    def initial(self):
+        return 0
+
+    def add(self, state, output):
+        return state + output
+
+    def merge(self, state, other):
+        return state + other
+
+
+class Count(Reducer):
+    """
+    The number of outputs.
+    """
+    name = 'count'
+
+    def initial(self):
+        return 0
+
+    def add(self, state, output):
+        return state + 1
+
+    def merge(self, state, other):
+        return state + other
+
+
+class Min(Reducer):
+    """
+    The smallest output, None if there is none.
+    """
+    name = 'min'
+
+    def add(self, state, output):
+        return output if state is None else min(state, output)
+
+    def merge(self, state, other):
+        if state is None or other is None:
+            return other if state is None else state
+        return min(state, other)
+
+
+class Max(Reducer):
+    """
+    The largest output, None if there is none.
+    """
+    name = 'max'
+
+    def add(self, state, output):
+        return output if state is None else max(state, output)
+
+    def merge(self, state, other):
+        if state is None or other is None:
+            return other if state is None else state
+        return max(state, other)
+
+
+class Mean(Reducer):
+    """
+    The count, mean and variance of the outputs, updated with Welford's
+    algorithm and merged with Chan's, so they stay accurate over millions
+    of outputs.
+    """
+    name = 'mean'
+
+    def initial(self):
+        return [0, 0.0, 0.0]
+
+    def add(self, state, output):
+        (count, mean, m2) = state
+        count += 1
+        delta = output - mean
+        mean = mean + delta / count
+        return [count, mean, m2 + delta * (output - mean)]
+
+    def merge(self, state, other):
+        if not other[0] or not state[0]:
+            return state if not other[0] else other
+        count = state[0] + other[0]
+        delta = other[1] - state[1]
+        mean = state[1] + delta * other[0] / count
+        m2 = state[2] + other[2] + delta ** 2 * state[0] * other[0] / count
+        return [count, mean, m2]
+
+    def result(self, state):
+        (count, mean, m2) = state
+        return {"count": count,
+                "mean": mean if count else math.nan,
+                "variance": m2 / count if count else math.nan}
+
+
+class Histogram(Reducer):
+    """
+    The number of outputs in each bucket of fixed upper bounds, plus one
+    for the outputs above the last bound.
+    """
+    name = 'histogram'
+
+    def __init__(self, bounds):
+        """
+        __init__ Initialises the Histogram object.
+
+        Parameters
+        ----------
+        bounds : list
+            The upper bounds of the buckets, sorted.
+        """
+        self.bounds = sorted(bounds)
+
+    def initial(self):
+        return [0] * (len(self.bounds) + 1)
+
+    def add(self, state, output):
+        state[bisect.bisect_left(self.bounds, output)] += 1
+        return state
+
+    def merge(self, state, other):
+        return [a + b for a, b in zip(state, other)]
+
+    def result(self, state):
+        return {"bounds": list(self.bounds), "counts": list(state)}
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "bounds": list(self.bounds)}
+
+
+class Top(Reducer):
+    """
+    The k largest outputs, or the k smallest, largest first.
+    """
+    name = 'top'
+
+    def __init__(self, k, key=None, largest=True):
+        """
+        __init__ Initialises the Top object.
+
+        Parameters
+        ----------
+        k : int
+            The number of outputs kept.
+        key : function
+            Called on each output to get the value it is ranked by.
+            None to rank the outputs themselves.
+        largest : bool
+            Whether to keep the largest outputs, or the smallest.
+        """
+        if not isinstance(k, int) or k < 1:
+            raise ValueError("k must be a positive int.")
+        self.k = k
+        self.key = key
+        self.largest = largest
+
+    def initial(self):
+        return []
+
+    def add(self, state, output):
+        if state:
+            # Ranks the output against a kept one first, so an output
+            # that cannot be ranked is refused before it is kept.
+            sorted((state[0], output), key=self.key)
+        state.append(output)
+        if len(state) >= 2 * self.k:
+            state = self._trim(state)
+        return state
+
+    def merge(self, state, other):
+        return self._trim(state + other)
+
+    def result(self, state):
+        return self._trim(state)
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "k": self.k, "largest": self.largest,
+                "key": None if self.key is None
+                else pack_function(self.key)}
+
+    def _trim(self, state) -> list:
+        """
+        _trim Keeps the k first outputs of a state.
+
+        Parameters
+        ----------
+        state : list
+            The outputs.
+
+        Returns
+        -------
+        list
+            The k first outputs, in order.
+        """
+        return sorted(state, key=self.key, reverse=self.largest)[:self.k]
+
+
+class Fold(Reducer):
+    """
+    A reduction by a function folding each output into an accumulator,
+    starting from an initial value.
+    """
+    name = 'fold'
+
+    def __init__(self, combine, initial=None, merge=None):
+        """
+        __init__ Initialises the Fold object.
+
+        Parameters
+        ----------
+        combine : function
+            Called with the accumulator and an output, returns the new
+            accumulator.
+        initial : object
+            The accumulator before any output is folded.
+        merge : function
+            Called with two accumulators, returns the accumulator
+            holding both. None if accumulators cannot be merged, in
+            which case the outputs cannot be folded on the clients.
+        """
+        if not callable(combine) or (merge is not None
+                                     and not callable(merge)):
+            raise TypeError("Combine and merge must be functions.")
+        self.combine = combine
+        self.start = initial
+        self.merger = merge
+
+    def initial(self):
+        # A copy, so an accumulator updated in place is not shared
+        # between the server and the windows of the clients.
+        return copy.deepcopy(self.start)
+
+    def add(self, state, output):
+        return self.combine(state, output)
+
+    def merge(self, state, other):
+        if self.merger is None:
+            raise ValueError("Fold has no merge function.")
+        return self.merger(state, other)
+
+    def to_dict(self) -> dict:
+        if self.merger is None:
+            return None
+        return {"name": self.name, "initial": self.start,
+                "combine": pack_function(self.combine),
+                "merge": pack_function(self.merger)}
+
+
+REDUCERS = {
+    reducer.name: reducer for reducer in (Sum, Count, Min, Max, Mean)
+}
+
+
+def get_reducer(reducer) -> Reducer:
+    """
+    get_reducer Returns a reducer from its name, or from the dict it
+    was sent to the clients as.
+
+    Parameters
+    ----------
+    reducer : str, dict or Reducer
+        The name of the reducer: 'sum', 'count', 'min', 'max' or 'mean',
+        the dict returned by Reducer.to_dict, or the reducer itself.
+
+    Returns
+    -------
+    Reducer
+        The reducer.
+    """
+    if isinstance(reducer, Reducer):
+        return reducer
+    if isinstance(reducer, dict):
+        if reducer['name'] == Histogram.name:
+            return Histogram(reducer['bounds'])
+        if reducer['name'] == Top.name:
+            return Top(reducer['k'], _load(reducer['key']),
+                       reducer['largest'])
+        if reducer['name'] == Fold.name:
+            return Fold(load_function(reducer['combine']),
+                        reducer['initial'], load_function(reducer['merge']))
+        reducer = reducer['name']
+    if reducer not in REDUCERS:
+        raise ValueError("Unknown reducer: {}. Available: {}.".format(
+            reducer, ", ".join(REDUCERS)))
+    return REDUCERS[reducer]()
+
+
+def _load(spec):
+    """
+    _load Loads a function sent along with a reducer.
+
+    Parameters
+    ----------
+    spec : dict
+        The function, as returned by pack_function, or None.
+
+    Returns
+    -------
+    function
+        The function, None if there is none.
+    """
+    return None if spec is None else load_function(spec)
@@ -0,0 +1,333 @@
+"""Scheduling module for the parally package.
+
+A scheduler decides which idle worker gets the next batch and how many
+parameters it holds. It is told when workers join or leave and how long
+each batch took, so it can size batches from the measured throughput of
+every machine.
+"""
+
+import math
+import time
+
+__all__ = ['Scheduler', 'FixedScheduler', 'GuidedScheduler',
+           'ThroughputScheduler', 'LeastLoadedScheduler', 'get_scheduler']
+
+
+class Scheduler:
+    """
+    The interface of a scheduler. It keeps the capacity, the load and an
+    exponentially weighted moving average of the throughput of every
+    worker, in parameters per second.
+    """
+    name = None
+
+    def __init__(self, chunksize=1, alpha=0.3):
+        """
+        __init__ Initialises the Scheduler object.
+
+        Parameters
+        ----------
+        chunksize : int
+            The smallest number of parameters in a batch.
+        alpha : float
+            The weight of the latest measure in the throughput average.
+        """
+        self._chunksize = max(1, chunksize)
+        self._alpha = alpha
+        self._capacity = {}
+        self._load = {}
+        self._throughput = {}
+        self._last = {}
+
+    def add_worker(self, worker, capacity) -> None:
+        """
+        add_worker Adds a worker, or more capacity to a worker.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker.
+        capacity : int
+            The number of tasks the worker can run at the same time.
+        """
+        self._capacity[worker] = self._capacity.get(worker, 0) + capacity
+        self._load.setdefault(worker, 0)
+
+    def remove_worker(self, worker) -> None:
+        """
+        remove_worker Forgets a worker.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker.
+        """
+        for stats in (self._capacity, self._load, self._throughput,
+                      self._last):
+            stats.pop(worker, None)
+
+    def dispatched(self, worker, size) -> None:
+        """
+        dispatched Records a batch sent to a worker.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker.
+        size : int
+            The number of parameters in the batch.
+        """
+        if worker in self._load:
+            self._load[worker] += size
+
+    def cancelled(self, worker, size) -> None:
+        """
+        cancelled Records a batch taken back from a worker.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker.
+        size : int
+            The number of parameters in the batch.
+        """
+        if worker in self._load:
+            self._load[worker] = max(0, self._load[worker] - size)
+
+    def completed(self, worker, size, started) -> None:
+        """
+        completed Records a batch completed by a worker and updates its
+        throughput. A batch queued behind another one on the client is
+        timed from the completion of the previous one.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker.
+        size : int
+            The number of parameters in the batch.
+        started : float
+            The time.monotonic() the batch was dispatched at.
+        """
+        if worker not in self._load:
+            return
+        now = time.monotonic()
+        self._load[worker] = max(0, self._load[worker] - size)
+        elapsed = now - max(started, self._last.get(worker, started))
+        self._last[worker] = now
+        if elapsed <= 0:
+            return
+        throughput = size / elapsed
+        previous = self._throughput.get(worker)
+        self._throughput[worker] = throughput if previous is None else \
+            self._alpha * throughput + (1 - self._alpha) * previous
+
+    def pick(self, idle):
+        """
+        pick Takes the idle slot of the worker to dispatch to next.
+
+        Parameters
+        ----------
+        idle : collections.deque
+            The addresses of the workers, once per free slot.
+
+        Returns
+        -------
+        tuple
+            The address of the worker.
+        """
+        return idle.popleft()
+
+    def chunk_size(self, worker, remaining) -> int:
+        """
+        chunk_size Returns the number of parameters of the next batch.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker the batch is for.
+        remaining : int
+            The number of parameters left, or a lower bound.
+
+        Returns
+        -------
+        int
+            The size of the batch.
+        """
+        raise NotImplementedError
+
+    def get_throughput(self) -> dict:
+        """
+        get_throughput Returns the measured throughput of the workers.
+
+        Returns
+        -------
+        dict
+            The parameters per second of each worker, keyed by address.
+        """
+        return dict(self._throughput)
+
+    def _total_capacity(self) -> int:
+        """
+        _total_capacity Returns the number of tasks all the workers can
+        run at the same time.
+
+        Returns
+        -------
+        int
+            The total capacity, at least 1.
+        """
+        return max(1, sum(self._capacity.values()))
+
+
+class FixedScheduler(Scheduler):
+    """
+    Sends the idle slots batches of chunksize parameters, in turn. With
+    chunksize='auto', batches are sized from the parameters left and the
+    capacity of the workers, like multiprocessing.Pool.map.
+    """
+    name = 'fixed'
+
+    def __init__(self, chunksize=1, alpha=0.3):
+        self._auto = chunksize == 'auto'
+        super().__init__(1 if self._auto else chunksize, alpha)
+
+    def chunk_size(self, worker, remaining) -> int:
+        if not self._auto:
+            return self._chunksize
+        return max(1, math.ceil(remaining / (self._total_capacity() * 4)))
+
+
+class GuidedScheduler(Scheduler):
+    """
+    Guided self-scheduling: each batch holds the parameters left divided
+    by the total capacity, so batches shrink as the job ends.
+    """
+    name = 'guided'
+
+    def chunk_size(self, worker, remaining) -> int:
+        return max(self._chunksize,
+                   math.ceil(remaining / self._total_capacity()))
+
+
+class ThroughputScheduler(Scheduler):
+    """
+    Sizes each batch from the share of the measured throughput of its
+    worker, so faster machines get larger batches and every worker
+    finishes at about the same time. Workers not measured yet are
+    weighted by their capacity.
+    """
+    name = 'throughput'
+
+    def __init__(self, chunksize=1, alpha=0.3, factor=2):
+        """
+        __init__ Initialises the ThroughputScheduler object.
+
+        Parameters
+        ----------
+        chunksize : int
+            The smallest number of parameters in a batch.
+        alpha : float
+            The weight of the latest measure in the throughput average.
+        factor : float
+            The number of batches each worker should still get from the
+            parameters left; larger values give smaller batches.
+        """
+        super().__init__(chunksize, alpha)
+        self._factor = max(1, factor)
+
+    def chunk_size(self, worker, remaining) -> int:
+        share = self._share(worker)
+        slots = max(1, self._capacity.get(worker, 1))
+        return max(self._chunksize,
+                   math.ceil(remaining * share / (self._factor * slots)))
+
+    def _share(self, worker) -> float:
+        """
+        _share Returns the share of the throughput of a worker.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker.
+
+        Returns
+        -------
+        float
+            The share of the worker, between 0 and 1.
+        """
+        measured = [self._throughput[key] for key in self._capacity
+                    if key in self._throughput]
+        if worker not in self._throughput or not measured:
+            return self._capacity.get(worker, 1) / self._total_capacity()
+        mean = sum(measured) / len(measured)
+        total = sum(self._throughput.get(key, mean)
+                    for key in self._capacity)
+        return self._throughput[worker] / total
+
+
+class LeastLoadedScheduler(Scheduler):
+    """
+    Sends each batch of chunksize parameters to the idle worker with the
+    fewest parameters in flight per unit of capacity.
+    """
+    name = 'least-loaded'
+
+    def pick(self, idle):
+        worker = min(set(idle), key=self._relative_load)
+        idle.remove(worker)
+        return worker
+
+    def _relative_load(self, worker) -> float:
+        """
+        _relative_load Returns the load of a worker per unit of capacity.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker.
+
+        Returns
+        -------
+        float
+            The parameters in flight per task it can run at once.
+        """
+        capacity = max(1, self._capacity.get(worker, 1))
+        return self._load.get(worker, 0) / capacity
+
+    def chunk_size(self, worker, remaining) -> int:
+        return self._chunksize
+
+
+SCHEDULERS = {
+    scheduler.name: scheduler for scheduler in
+    (FixedScheduler, GuidedScheduler, ThroughputScheduler,
+     LeastLoadedScheduler)
+}
+
+
+def get_scheduler(scheduler, chunksize=1) -> Scheduler:
+    """
+    get_scheduler Returns a scheduler from its name.
+
+    Parameters
+    ----------
+    scheduler : str or Scheduler
+        The name of the scheduler, or the scheduler itself.
+    chunksize : int or str
+        The size of the batches of the fixed scheduler, the smallest
+        size for the others.
+
+    Returns
+    -------
+    Scheduler
+        The scheduler.
+    """
+    if isinstance(scheduler, Scheduler):
+        return scheduler
+    if scheduler not in SCHEDULERS:
+        raise ValueError("Unknown scheduler: {}. Available: {}.".format(
+            scheduler, ", ".join(SCHEDULERS)))
+    if scheduler != 'fixed' and chunksize == 'auto':
+        chunksize = 1
+    return SCHEDULERS[scheduler](chunksize)
@@ -0,0 +1,224 @@
+"""Serializers module for the parally package.
+
+A serializer turns a message into a body and a list of buffers sent
+out-of-band, and back. The Server picks one and tells it to its clients
+when they connect.
+"""
+
+import json
+import marshal
+import pickle
+from functools import partial
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+__all__ = ['Serializer', 'JSONSerializer', 'PickleSerializer',
+           'MarshalSerializer', 'MsgpackSerializer', 'get_serializer']
+
+
+class Serializer:
+    """
+    The interface of a serializer.
+    """
+    name = None
+
+    def dumps(self, message) -> tuple:
+        """
+        dumps Serializes a message.
+
+        Parameters
+        ----------
+        message : dict
+            The message to serialize.
+
+        Returns
+        -------
+        (bytes, list)
+            The body and the buffers to send out-of-band.
+        """
+        raise NotImplementedError
+
+    def loads(self, body, buffers) -> dict:
+        """
+        loads Deserializes a message.
+
+        Parameters
+        ----------
+        body : memoryview
+            The body of the message.
+        buffers : list
+            The buffers received out-of-band, as memoryviews.
+
+        Returns
+        -------
+        dict
+            The message. Any error raised on a corrupt body is turned
+            into a ValueError by decode_message.
+        """
+        raise NotImplementedError
+
+
+class JSONSerializer(Serializer):
+    """
+    A serializer using the json module, with NumPy arrays sent
+    out-of-band.
+    """
+    name = 'json'
+
+    def dumps(self, message) -> tuple:
+        buffers = []
+        body = json.dumps(message, default=partial(encode_array, buffers))
+        return body.encode(), buffers
+
+    def loads(self, body, buffers) -> dict:
+        if not buffers:
+            return json.loads(bytes(body))
+        return json.loads(bytes(body),
+                          object_hook=partial(decode_array, buffers))
+
+
+class PickleSerializer(Serializer):
+    """
+    A serializer using pickle protocol 5, with every buffer that supports
+    it (NumPy arrays included) sent out-of-band.
+
+    Only use it between machines that trust each other: unpickling can
+    run arbitrary code.
+    """
+    name = 'pickle'
+
+    def dumps(self, message) -> tuple:
+        buffers = []
+        body = pickle.dumps(message, protocol=5,
+                            buffer_callback=buffers.append)
+        return body, [buffer.raw() for buffer in buffers]
+
+    def loads(self, body, buffers) -> dict:
+        return pickle.loads(body, buffers=buffers)
+
+
+class MarshalSerializer(Serializer):
+    """
+    A serializer using the marshal module, the fastest one for messages
+    made of built-in types only.
+    """
+    name = 'marshal'
+
+    def dumps(self, message) -> tuple:
+        return marshal.dumps(message), []
+
+    def loads(self, body, buffers) -> dict:
+        return marshal.loads(body)
+
+
+class MsgpackSerializer(Serializer):
+    """
+    A serializer using msgpack, with NumPy arrays sent out-of-band.
+    Requires the msgpack package.
+    """
+    name = 'msgpack'
+
+    def dumps(self, message) -> tuple:
+        buffers = []
+        body = msgpack.packb(message, default=partial(encode_array, buffers))
+        return body, buffers
+
+    def loads(self, body, buffers) -> dict:
+        return msgpack.unpackb(body, strict_map_key=False,
+                               object_hook=partial(decode_array, buffers))
+
+
+SERIALIZERS = {
+    serializer.name: serializer for serializer in
+    (JSONSerializer, PickleSerializer, MarshalSerializer, MsgpackSerializer)
+}
+
+
+def get_serializer(serializer) -> Serializer:
+    """
+    get_serializer Returns a serializer from its name.
+
+    Parameters
+    ----------
+    serializer : str or Serializer
+        The name of the serializer, or the serializer itself.
+
+    Returns
+    -------
+    Serializer
+        The serializer.
+    """
+    if isinstance(serializer, Serializer):
+        return serializer
+    if serializer not in SERIALIZERS:
+        raise ValueError("Unknown serializer: {}. Available: {}.".format(
+            serializer, ", ".join(SERIALIZERS)))
+    if serializer == 'msgpack' and msgpack is None:
+        raise ValueError("The msgpack serializer requires msgpack.")
+    return SERIALIZERS[serializer]()
+
+
+def encode_array(buffers, obj):
+    """
+    encode_array Replaces a NumPy object by a serializable one.
+
+    Parameters
+    ----------
+    buffers : list
+        The buffers sent out-of-band, the array's buffer is appended to it.
+    obj : object
+        The object the serializer could not serialize.
+
+    Returns
+    -------
+    object
+        A placeholder carrying the dtype and shape of an array, or the
+        Python equivalent of a NumPy scalar.
+    """
+    if np is not None:
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+            array = np.ascontiguousarray(obj)
+            buffers.append(memoryview(array.reshape(-1).view(np.uint8)))
+            return {'__ndarray__': len(buffers) - 1,
+                    'dtype': np.lib.format.dtype_to_descr(array.dtype),
+                    'shape': list(array.shape)}
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+    raise TypeError("Object of type {} is not serializable."
+                    .format(type(obj).__name__))
+
+
+def decode_array(buffers, obj):
+    """
+    decode_array Rebuilds the arrays replaced by encode_array, on top of
+    the buffers received and without copying them.
+
+    Parameters
+    ----------
+    buffers : list
+        The buffers received out-of-band.
+    obj : dict
+        An object of the body.
+
+    Returns
+    -------
+    object
+        The array if obj is a placeholder, obj otherwise.
+    """
+    if '__ndarray__' not in obj:
+        return obj
+    if np is None:
+        raise ValueError("NumPy is required to decode arrays.")
+    dtype = np.lib.format.descr_to_dtype(obj['dtype'])
+    return np.frombuffer(buffers[obj['__ndarray__']],
+                         dtype=dtype).reshape(obj['shape'])
@@ -1,12 +1,31 @@
 """Server module for the parally package."""
 
-from datetime import datetime
-import random
+import logging
+import selectors
 import socket
-import json
-from threading import Thread
+import pickle
+import queue
+import time
+from collections import deque
+from concurrent.futures import Future
+from itertools import count
+from threading import Lock, Thread
+from weakref import WeakKeyDictionary
 from typing import Tuple
 from colorama import Fore, Style, just_fix_windows_console
+
+from .protocol import FrameBuffer, FrameQueue, encode_message, \
+    decode_message, get_compression
+from .serializers import get_serializer
+from .sources import ParameterSource, ParameterQueue
+from .tasks import TaskStore
+from .scheduling import get_scheduler
+from .journal import Journal
+from .metrics import Metrics, serve_metrics
+from .functions import pack_function
+from .jobs import Job
+from .reducers import Fold, Reducer, get_reducer
+
 just_fix_windows_console()
 
 __all__ = ['Server']
@@ -15,12 +34,38 @@ __all__ = ['Server']
 class Logs:
     """
     A simple logs class that handles the logs of the server.
+
+    Messages below the level are dropped before being formatted, and only
+    the last history messages are kept. Messages may be handed to a
+    logging.Logger instead of being printed. The logging methods return
+    None: get_logs() returns the messages kept.
     """
-    def __init__(self):
+    LEVELS = {"debug": 10, "output": 15, "info": 20, "warning": 30,
+              "error": 40}
+
+    def __init__(self, level='info', history=10000, logger=None):
         """
         __init__ Initialises the Logs object.
-        """
-        self._logs = []
+
+        Parameters
+        ----------
+        level : str
+            The lowest level of the messages kept: 'debug', 'output',
+            'info', 'warning' or 'error'.
+        history : int
+            Largest number of messages kept. None for no limit.
+        logger : logging.Logger or str
+            A logger, or the name of one, every message kept is passed
+            to instead of being printed. None to print them.
+        """
+        if level not in self.LEVELS:
+            raise ValueError("Log level must be one of {}.".format(
+                ", ".join(self.LEVELS)))
+        self._level = self.LEVELS[level]
+        self._logs = deque(maxlen=history)
+        if isinstance(logger, str):
+            logger = logging.getLogger(logger)
+        self._logger = logger
         self.colors = {
             "info": Fore.GREEN,
             "error": Fore.RED,
@@ -31,131 +76,130 @@ class Logs:
             "reset": Style.RESET_ALL
         }
 
-    def info(self, msg, verbose=False) -> list:
+    def is_enabled(self, level) -> bool:
+        """
+        is_enabled Checks if messages of a level are kept.
+
+        Parameters
+        ----------
+        level : str
+            The level of the messages.
+
+        Returns
+        -------
+        bool
+            True if they are kept, False if they are dropped.
+        """
+        return self.LEVELS[level] >= self._level
+
+    def info(self, msg, *args, verbose=False) -> None:
         """
         info Logs an info message.
 
         Parameters
         ----------
         msg : str
-            The message to be logged.
+            The message to be logged, formatted with args if any.
+        *args
+            The values of the fields of the message.
         verbose : bool
             Whether to print the message to the console or not.
         """
-        if verbose:
-            print("{}{}: {}info-> {}{}".format(
-                self.colors['timestamp'],
-                datetime.now().strftime("%H:%M:%S"),
-                self.colors['info'],
-                self.colors['reset'],
-                msg))
-        self._logs.append({
-            "timestamp": datetime.now().strftime("%H:%M:%S"),
-            "type": "info",
-            "message": msg
-        })
-        return self.get_logs()
-
-    def error(self, msg, verbose=False) -> list:
+        if self._level <= self.LEVELS['info']:
+            self._log("info", msg, args, verbose)
+
+    def error(self, msg, *args, verbose=False) -> None:
         """
         error Logs an error message.
 
         Parameters
         ----------
         msg : str
-            The message to be logged.
+            The message to be logged, formatted with args if any.
+        *args
+            The values of the fields of the message.
         verbose : bool
             Whether to print the message to the console or not.
         """
-        if verbose:
-            print("{}{}: {}error-> {}{}".format(
-                self.colors['timestamp'],
-                datetime.now().strftime("%H:%M:%S"),
-                self.colors['error'],
-                self.colors['reset'],
-                msg))
-        self._logs.append({
-            "timestamp": datetime.now().strftime("%H:%M:%S"),
-            "type": "error",
-            "message": msg
-        })
-        return self.get_logs()
-
-    def warning(self, msg, verbose=False) -> list:
+        if self._level <= self.LEVELS['error']:
+            self._log("error", msg, args, verbose)
+
+    def warning(self, msg, *args, verbose=False) -> None:
         """
         warning Logs a warning message.
 
         Parameters
         ----------
         msg : str
-            The message to be logged.
+            The message to be logged, formatted with args if any.
+        *args
+            The values of the fields of the message.
         verbose : bool
             Whether to print the message to the console or not.
         """
-        if verbose:
-            print("{}{}: {}warning-> {}{}".format(
-                self.colors['timestamp'],
-                datetime.now().strftime("%H:%M:%S"),
-                self.colors['warning'],
-                self.colors['reset'],
-                msg))
-        self._logs.append({
-            "timestamp": datetime.now().strftime("%H:%M:%S"),
-            "type": "warning",
-            "message": msg
-        })
-        return self.get_logs()
-
-    def debug(self, msg, verbose=False) -> list:
+        if self._level <= self.LEVELS['warning']:
+            self._log("warning", msg, args, verbose)
+
+    def debug(self, msg, *args, verbose=False) -> None:
         """
         debug Logs a debug message.
 
         Parameters
         ----------
         msg : str
-            The message to be logged.
+            The message to be logged, formatted with args if any.
+        *args
+            The values of the fields of the message.
         verbose : bool
             Whether to print the message to the console or not.
         """
-        if verbose:
-            print("{}{}: {}debug-> {}{}".format(
-                self.colors['timestamp'],
-                datetime.now().strftime("%H:%M:%S"),
-                self.colors['debug'],
-                self.colors['reset'],
-                msg))
-        self._logs.append({
-            "timestamp": datetime.now().strftime("%H:%M:%S"),
-            "type": "debug",
-            "message": msg
-        })
-        return self.get_logs()
-
-    def output(self, msg, verbose=False) -> list:
+        if self._level <= self.LEVELS['debug']:
+            self._log("debug", msg, args, verbose)
+
+    def output(self, msg, verbose=False) -> None:
         """
         output Logs an output message.
 
         Parameters
         ----------
-        msg : str
-            The message to be logged.
+        msg : object
+            The output to be logged.
         verbose : bool
             Whether to print the message to the console or not.
         """
-        if verbose:
-            print("{}{}: {}output-> {}{}{}".format(
+        if self._level <= self.LEVELS['output']:
+            self._log("output", msg, None, verbose)
+
+    def _log(self, kind, msg, args, verbose) -> None:
+        """
+        _log Keeps a message, and prints it or passes it to the logger.
+
+        Parameters
+        ----------
+        kind : str
+            The level of the message.
+        msg : object
+            The message, or the output of an output message.
+        args : tuple
+            The values of the fields of the message, None for an output.
+        verbose : bool
+            Whether to print the message to the console or not.
+        """
+        now = time.time()
+        self._logs.append((now, kind, msg, args))
+        if self._logger is not None:
+            level = logging.DEBUG if kind == "output" else self.LEVELS[kind]
+            if self._logger.isEnabledFor(level):
+                self._logger.log(level, "%s", _LazyMessage(msg, args))
+        elif verbose:
+            print("{}{}: {}{}-> {}{}{}".format(
                 self.colors['timestamp'],
-                datetime.now().strftime("%H:%M:%S"),
-                self.colors['debug'],
-                self.colors['output'],
-                json.dumps(msg, indent=2),
+                time.strftime("%H:%M:%S", time.localtime(now)),
+                self.colors['debug' if kind == "output" else kind],
+                kind,
+                self.colors['output' if kind == "output" else 'reset'],
+                _format(msg, args),
                 self.colors['reset']))
-        self._logs.append({
-            "timestamp": datetime.now().strftime("%H:%M:%S"),
-            "type": "output",
-            "message": msg
-        })
-        return self.get_logs()
 
     def get_logs(self) -> list:
         """
@@ -164,268 +208,462 @@ class Logs:
         Returns
         -------
         list
-            The logs.
+            The logs kept, oldest first, each with its timestamp, type
+            and message.
         """
-        return self._logs
+        return [{"timestamp": time.strftime("%H:%M:%S", time.localtime(now)),
+                 "type": kind,
+                 "message": _format(msg, args) if args else msg}
+                for (now, kind, msg, args) in self._logs]
 
     def clear_logs(self) -> None:
         """
         clear_logs Clears the logs.
         """
-        self._logs = []
+        self._logs.clear()
+
+
+class _LazyMessage:
+    """
+    A message formatted only once a logging handler needs it.
+    """
+    __slots__ = ('msg', 'args')
+
+    def __init__(self, msg, args):
+        self.msg = msg
+        self.args = args
+
+    def __str__(self):
+        return _format(self.msg, self.args)
+
+
+def _format(msg, args) -> str:
+    """
+    _format Formats a message with the values of its fields.
+
+    Parameters
+    ----------
+    msg : object
+        The message, or the output of an output message.
+    args : tuple
+        The values of the fields of the message, None for an output.
+
+    Returns
+    -------
+    str
+        The message.
+    """
+    if args is None:
+        return repr(msg)
+    if args:
+        return str(msg).format(*args)
+    return str(msg)
 
 
-class State:
+class Worker:
     """
-    A simple state class that handles the state of a worker.
+    A simple worker class that handles the connection to a client.
+
+    A worker can have several batches in flight at once, each identified
+    by a task ID, so results can come back in any order.
     """
-    def __init__(self):
+    def __init__(self, conn, addr, serializer, compression=None,
+                 heartbeat=None, metrics=None, function=None,
+                 combiner=None):
         """
-        __init__ Initialises the State object.
+        __init__ Initialises the Worker object and queues the handshake
+        telling the client which serializer and compression to use, and
+        how often to send heartbeats.
+
+        Parameters
+        ----------
+        conn : socket.socket
+            Socket connection to the client.
+        addr : tuple
+            Address of the client.
+        serializer : Serializer
+            The serializer of the server.
+        compression : Compression
+            The compression settings of the server, if any.
+        heartbeat : float
+            Seconds between two heartbeats of the client, None to
+            disable them.
+        metrics : Metrics
+            The metrics of the server, the traffic of the worker is
+            recorded in.
+        function : dict
+            The function the client runs, as returned by pack_function,
+            None to let the client use its own.
+        combiner : dict
+            The reducer, as returned by Reducer.to_dict, and the window
+            the client folds the outputs of the bound parameters over,
+            None to have it send every output.
         """
-        self._running = False
-        self._assigned = False
-        self._done = False
+        self._socket = (conn, addr)
+        self._metrics = Metrics() if metrics is None else metrics
+        self._stats = self._metrics.add_worker(addr)
+        self._serializer = serializer
+        self._compression = compression
+        self._capacity = 0
+        self._granted = 0
+        self._tasks = {}
+        self._jobs = set()
+        self._abandoned = set()
+        self._finished = []
+        self._last_seen = time.monotonic()
+        self._buffer = FrameBuffer()
+        self._outbox = FrameQueue()
+        self._outbox.push(encode_message({
+            'action': 'hello',
+            'serializer': serializer.name,
+            'compression': None if compression is None
+            else compression.to_dict(),
+            'heartbeat': heartbeat,
+            'function': function
+        }))
+        self._stats.messages_sent += 1
+        self._outbox.compression = compression
+        if combiner is not None:
+            self._push(dict(combiner, action='combine'))
 
-    def set_running(self, running) -> None:
+    def terminate(self) -> None:
         """
-        set_running Sets the running state of the worker.
+        terminate Clears the tasks that have been collected.
+        """
+        self._finished = []
+
+    def assign_task(self, task_id, parameters, job_id=None,
+                    function=None) -> None:
+        """
+        assign_task Assigns a batch of tasks to the worker and queues
+        it to be sent to the client as a single message.
+
+        Parameters
+        ----------
+        task_id : int
+            The ID of the batch.
+        parameters : list
+            Parameters to be passed to the worker, one dict per task.
+        job_id : int
+            The ID of the job of the batch, None for the parameters
+            bound to the server.
+        function : dict
+            The function of the job, sent along with its first batch.
+            None to let the client use its own.
+        """
+        message = {'action': 'run', 'id': task_id, 'batch': parameters}
+        if job_id is not None:
+            if job_id not in self._jobs and function is not None:
+                self._push({'action': 'function', 'job': job_id,
+                            'function': function})
+            self._jobs.add(job_id)
+            message['job'] = job_id
+        self._tasks[task_id] = parameters
+        self._push(message)
+        self._stats.set_busy(True)
+
+    def forget_job(self, job_id) -> None:
+        """
+        forget_job Tells the client a job is over, so it can drop the
+        function of the job.
 
         Parameters
         ----------
-        running : bool
-            The running state of the worker.
+        job_id : int
+            The ID of the job.
         """
-        self._running = running
+        if job_id in self._jobs:
+            self._jobs.discard(job_id)
+            self._push({'action': 'forget', 'job': job_id})
 
-    def set_assigned(self, assigned) -> None:
+    def abandon(self, task_id) -> None:
         """
-        set_assigned Sets the assigned state of the worker.
+        abandon Forgets a batch in flight, whose results will be
+        dropped when they arrive.
 
         Parameters
         ----------
-        assigned : bool
-            The assigned state of the worker.
+        task_id : int
+            The ID of the batch.
         """
-        self._assigned = assigned
+        if self._tasks.pop(task_id, None) is not None:
+            self._abandoned.add(task_id)
 
-    def set_done(self, done) -> None:
+    def cancel(self, task_id) -> None:
         """
-        set_done Sets the done state of the worker.
+        cancel Abandons a batch in flight and tells the client to skip
+        it if it has not started it yet.
 
         Parameters
         ----------
-        done : bool
-            The done state of the worker.
+        task_id : int
+            The ID of the batch.
         """
-        self._done = done
+        if task_id not in self._tasks:
+            return
+        self.abandon(task_id)
+        self._push({'action': 'cancel', 'id': task_id})
 
-    def is_running(self) -> bool:
+    def _push(self, message) -> None:
         """
-        is_running Checks if the worker is running.
+        _push Serializes a message and queues it to be sent.
 
-        Returns
-        -------
-        bool
-            True if the worker is running, False otherwise.
+        Parameters
+        ----------
+        message : dict
+            The message to send.
         """
-        return self._running
+        start = time.perf_counter()
+        segments = encode_message(message, self._serializer)
+        self._metrics.encode.observe(time.perf_counter() - start)
+        self._outbox.push(segments)
+        self._stats.messages_sent += 1
 
-    def is_assigned(self) -> bool:
+    def get_last_seen(self) -> float:
         """
-        is_assigned Checks if the worker is assigned.
+        get_last_seen Returns when the client last sent something.
 
         Returns
         -------
-        bool
-            True if the worker is assigned, False otherwise.
+        float
+            The time.monotonic() of the last bytes received.
         """
-        return self._assigned
+        return self._last_seen
 
-    def is_done(self) -> bool:
+    def is_assigned(self) -> bool:
         """
-        is_done Checks if the worker is done.
+        is_assigned Checks if the worker has tasks in flight.
 
         Returns
         -------
         bool
-            True if the worker is done, False otherwise.
+            True if the worker has been assigned a task, False otherwise.
         """
-        return self._done
+        return len(self._tasks) > 0 or len(self._abandoned) > 0
 
-
-class Worker:
-    """
-    A simple worker class that handles the connection to a client.
-    """
-    def __init__(self, conn, addr):
+    def get_tasks(self) -> dict:
         """
-        __init__ Initialises the Worker object.
+        get_tasks Returns the batches in flight on the worker.
 
-        Parameters
-        ----------
-        conn : socket.socket
-            Socket connection to the client.
-        addr : tuple
-            Address of the client.
+        Returns
+        -------
+        dict
+            The parameters of each batch, keyed by task ID.
         """
-        self._socket = (conn, addr)
-        self._state = State()
-        self._input_parameters = {}
-        self._result = None
-        self._received_data = bytes()
-        self._error = None
+        return self._tasks
 
-    def terminate(self) -> None:
+    def get_capacity(self) -> int:
         """
-        terminate Terminates the worker.
+        get_capacity Returns the number of tasks the client can run
+        at the same time.
+
+        Returns
+        -------
+        int
+            The capacity announced by the client, 0 until it is ready.
         """
-        self._state = State()
-        self._input_parameters = {}
-        self._result = None
-        self._received_data = bytes()
-        self._error = None
+        return self._capacity
 
-    def assign_task(self, parameters) -> None:
+    def grant_capacity(self) -> int:
         """
-        assign_task Assigns a task to the worker.
+        grant_capacity Returns the capacity announced by the client
+        since the last call.
 
-        Parameters
-        ----------
-        parameters : dict
-            Parameters to be passed to the worker.
+        Returns
+        -------
+        int
+            The capacity not yet granted by the server.
         """
-        self._state.set_assigned(True)
-        self._input_parameters = parameters
+        new = self._capacity - self._granted
+        self._granted = self._capacity
+        return new
 
-    def is_assigned(self) -> bool:
+    def is_done(self) -> bool:
         """
-        is_assigned Checks if the worker has been assigned a task.
+        is_done Checks if the worker has finished tasks to collect.
 
         Returns
         -------
         bool
-            True if the worker has been assigned a task, False otherwise.
+            True if the worker is done, False otherwise.
         """
-        return self._state.is_assigned()
+        return len(self._finished) > 0
 
-    def unassign_task(self) -> None:
+    def get_finished(self) -> list:
         """
-        unassign_task Unassigns the task from the worker.
+        get_finished Returns the batches finished since the last
+        collection.
+
+        Returns
+        -------
+        list
+            The ID of each finished batch, with the output or the error
+            message of each of its tasks, or None if it was abandoned.
         """
-        self._state.set_assigned(False)
-        self._input_parameters = {}
+        return self._finished
 
-    def get_parameters(self) -> dict:
+    def get_address(self) -> tuple:
         """
-        get_parameters Returns the parameters assigned to the worker.
+        get_address Returns the address of the client.
 
         Returns
         -------
-        dict
-            The parameters assigned to the worker.
+        tuple
+            The address of the client.
         """
-        return self._input_parameters
+        return self._socket[1]
 
-    def is_running(self) -> bool:
+    def get_socket(self) -> socket.socket:
         """
-        is_running Checks if the worker is running.
+        get_socket Returns the socket connection to the client.
 
         Returns
         -------
-        bool
-            True if the worker is running, False otherwise.
+        socket.socket
+            The socket connection to the client.
         """
-        return self._state.is_running()
+        return self._socket[0]
 
-    def is_done(self) -> bool:
+    def wants_write(self) -> bool:
         """
-        is_done Checks if the worker is done.
+        wants_write Checks if there are bytes waiting to be sent.
 
         Returns
         -------
         bool
-            True if the worker is done, False otherwise.
+            True if the outgoing queue is not empty, False otherwise.
         """
-        return self._state.is_done()
+        return self._outbox.pending()
 
-    def get_error(self) -> str:
+    def flush(self) -> bool:
         """
-        get_error Returns the error message of the worker.
+        flush Sends as many queued bytes as the socket accepts.
 
         Returns
         -------
-        str
-            The error message of the worker.
+        bool
+            True if everything has been sent, False otherwise.
         """
-        return self._error
+        sent = self._outbox.sent
+        try:
+            return self._outbox.send_to(self._socket[0])
+        finally:
+            self._stats.bytes_sent += self._outbox.sent - sent
 
-    def get_result(self) -> dict:
+    def get_stats(self):
         """
-        get_result Returns the result of the worker.
+        get_stats Returns the traffic and busy time of the worker.
 
         Returns
         -------
-        dict
-            The result of the worker.
+        WorkerStats
+            The stats of the worker.
         """
-        return self._result
+        return self._stats
 
-    def run(self) -> bool:
+    def check_status(self) -> bool:
         """
-        run Runs the worker.
+        check_status Reads the bytes available on the socket and
+        processes every complete message received.
 
         Returns
         -------
         bool
-            True if the worker has been run, False otherwise.
-        """
-        to_send = json.dumps({
-            'action': 'run',
-            'parameters': self._input_parameters
-        })
-        self._socket[0].send(to_send.encode())
-        self._state.set_running(True)
+            True if the connection is still usable, False otherwise.
+        """
+        try:
+            received = self._buffer.recv_from(self._socket[0])
+            if received == 0:
+                return False
+            self._stats.bytes_received += received
+            self._last_seen = time.monotonic()
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+
+        try:
+            for frame in self._buffer.frames():
+                start = time.perf_counter()
+                data = decode_message(frame, self._serializer)
+                self._metrics.decode.observe(time.perf_counter() - start)
+                self._stats.messages_received += 1
+                if data['action'] == 'result':
+                    self._collect(data['id'], data['batch'])
+                elif data['action'] == 'partial':
+                    self._collect_partial(data)
+                elif data['action'] == 'ready':
+                    self._capacity = max(1, int(data.get('capacity', 1)))
+        except (ValueError, KeyError):
+            return False
         return True
 
-    def check_status(self) -> bool:
+    def _collect(self, task_id, batch) -> None:
         """
-        check_status Checks the status of the worker.
+        _collect Marks a batch in flight as finished.
+
+        Parameters
+        ----------
+        task_id : int
+            The ID of the batch.
+        batch : list
+            The output or the error message of each task.
+        """
+        if self._tasks.pop(task_id, None) is not None:
+            self._finished.append((task_id, batch))
+        elif task_id in self._abandoned:
+            self._abandoned.discard(task_id)
+            self._finished.append((task_id, None))
+
+    def _collect_partial(self, partial) -> None:
+        """
+        _collect_partial Marks the batches folded into a partial value
+        by the client as finished.
+
+        Parameters
+        ----------
+        partial : dict
+            The IDs of the batches, the partial value of their outputs,
+            the number of outputs and the error message of each task
+            that failed.
+        """
+        for task_id in partial['ids']:
+            if self._tasks.pop(task_id, None) is None:
+                self._abandoned.discard(task_id)
+        self._finished.append((tuple(partial['ids']), partial))
+
+    def close(self) -> None:
+        """
+        close Closes the connection to the client.
         """
         try:
-            data = self._socket[0].recv(1024)
-            if not data:
-                return False
-            data += self._received_data
-            try:
-                data = json.loads(data.decode())
-                if data['action'] == 'result':
-                    self._result = {
-                        "input": self._input_parameters,
-                        "output": data['data']
-                    }
-                    self._state.set_done(True)
-                    return True
-                if data['action'] == 'error':
-                    self._error = data['error']
-                    self._state.set_done(True)
-                    return False
-                if data['action'] == 'received':
-                    return False
-            except json.decoder.JSONDecodeError:
-                self._error = 'Invalid JSON received.'
-                self._state.set_done(True)
-                return False
-        except Exception:
-            self._state.set_done(True)
-        return False
+            self._socket[0].shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self._socket[0].close()
+        except OSError:
+            pass
 
 
 class Server:
     """
     A simple server class that listens on a given host and port.
+
+    All the connections are multiplexed on a single selector, so reads,
+    writes, accepts and dispatch only happen when a socket is ready.
+
+    Started with parameters bound, the server stops once they have all
+    completed. Started without, it keeps its clients connected and runs
+    the jobs given to submit() and map() until it is stopped. Jobs run at
+    the same time share the clients, each getting an equal number of
+    batches in flight.
     """
-    def __init__(self, host, port, verbose=False):
+    def __init__(self, host, port, verbose=False, prefetch=2,
+                 serializer='json', compression=None, keep_results=True,
+                 heartbeat=5.0, timeout=None, retries=2, speculative=False,
+                 cache=None, metrics_port=None, log_level='info',
+                 logger=None):
         """
         __init__ Initialises the Server object.
 
@@ -435,41 +673,124 @@ class Server:
             Host address to listen on.
         port : int
             Port to listen on. Must be between 1024 and 65535.
+        prefetch : int
+            Number of batches kept in flight on each client per task it
+            can run at once, so the next one is already there when the
+            current one finishes.
+        serializer : str or Serializer
+            The serializer used for every message after the handshake:
+            'json', 'pickle', 'marshal' or 'msgpack'.
+        compression : str or Compression
+            The codec used to compress large messages in both directions,
+            'zlib' or 'lzma', or a Compression object to also set the size
+            threshold and the level. None to disable compression.
+        keep_results : bool
+            Whether to keep every result until the end of the job, to be
+            passed to the on_completed callback. Disable it to run long
+            jobs in constant memory with on_result or results(), or
+            fold the outputs with on_reduce, which keeps none of them.
+        heartbeat : float
+            Seconds between two heartbeats of each client. A client
+            silent for three of them is dropped. None to disable.
+        timeout : float
+            Seconds a batch may stay in flight on a client, queued time
+            included, before it is sent to another one. None to disable.
+        retries : int
+            Number of times a batch is sent again after its client was
+            lost or timed out, before it is reported as failed.
+        speculative : bool
+            Whether to send copies of the longest running batches to
+            the clients left idle once every batch is dispatched. The
+            first result wins and the other copies are cancelled.
+        cache : ResultCache
+            The cache the outputs are stored in. Parameters found in it
+            are answered from it instead of being sent to a client.
+        metrics_port : int
+            The local port to serve the stats on in the Prometheus text
+            format, at /metrics. None to disable.
+        log_level : str
+            The lowest level of the messages logged: 'debug', 'output',
+            'info', 'warning' or 'error'. Per-task messages are 'debug'
+            and results are 'output'.
+        logger : logging.Logger or str
+            A logger, or the name of one, to pass the messages to
+            instead of printing them when verbose.
         """
         self.host = host
         self.port = port
         self._sock = None
+        self._selector = None
+        self._waker = None
         self._process = None
-        self._client_process = None
         self.running = False
         self._workers = {}
-        self._new_workers = []
-        self._parameters = []
-        self._assigned = {}
+        self._idle = deque()
+        self._prefetch = max(1, prefetch)
+        self._serializer = serializer
+        self._compression = compression
+        self._job = None
+        self._jobs = {}
+        self._new_jobs = deque()
+        self._function_jobs = {}
+        self._packed = WeakKeyDictionary()
+        self._jobs_lock = Lock()
+        self._job_ids = count()
+        self._task_ids = count()
+        self._accepting = True
         self._completed = []
-        self._to_complete = 0
+        self._keep_results = keep_results
+        self._reducer = None
+        self._reduced = None
+        self._combiner = None
+        self._result_queues = []
+        self._results_lock = Lock()
+        self._closed = False
+        self._metrics = Metrics()
+        self._metrics_port = metrics_port
+        self._metrics_server = None
+        self._heartbeat = heartbeat
+        self._timeout = timeout
+        self._retries = max(0, retries)
+        self._speculative = speculative
+        self._cache = cache
+        self._journal = None
+        self._replay = {}
+        self._interval = None
+        self._next_check = 0
+        self._function = None
         self._callback = None
+        self._callback_result = None
         self._callback_error = None
         self._verbose = verbose
-        self._logs = Logs()
+        self._logs = Logs(log_level, logger=logger)
 
-    def start(self) -> None:
+    def start(self, resume=None) -> None:
         """
-        start Starts the server.
+        start Starts the server. Without parameters bound, it runs until
+        Server.stop() is called.
+
+        Parameters
+        ----------
+        resume : str
+            The path of a journal the results are written to as tasks
+            complete. If it already holds results from an interrupted
+            run of the same parameters, these are not run again but
+            replayed to the callbacks.
         """
         try:
-            if self._to_complete == 0:
-                raise ValueError(
-                    "No parameters to bind. Make sure you run \
-                        Server.bind_parameters() first.")
-            if self._callback is None:
-                self.on_completed(self._default_callback)
-                raise ValueError(
-                    "No callback function initialized. Default callback used.")
-            if self._callback_error is None:
-                self.on_error(self._default_callback)
-                raise ValueError(
-                    "No error function initialized. Default callback used.")
+            if self._job is not None:
+                if self._job.tasks.get_source().get_total() == 0:
+                    raise ValueError(
+                        "No parameters to bind. Make sure you run \
+                            Server.bind_parameters() first.")
+                if self._callback is None:
+                    self.on_completed(self._default_callback)
+                    raise ValueError(
+                        "No callback function initialized. Default callback used.")
+                if self._callback_error is None:
+                    self.on_error(self._default_callback)
+                    raise ValueError(
+                        "No error function initialized. Default callback used.")
             if self.running:
                 raise ValueError("Server is already running.")
             if self.port < 1024 or self.port > 65535:
@@ -483,8 +804,21 @@ class Server:
                 raise ValueError("Host must be a valid address.\
                                     Default used: localhost.")
 
-            self._logs.info("Starting server on {}:{}".format(
-                self.host, self.port), verbose=self._verbose)
+            self._serializer = get_serializer(self._serializer)
+            self._compression = get_compression(self._compression)
+            deadlines = [d for d in (self._heartbeat, self._timeout) if d]
+            if resume is not None:
+                try:
+                    self._journal = Journal(resume)
+                    self._replay = self._journal.load()
+                except OSError as e:
+                    raise ValueError("Cannot read journal {}. {}".format(
+                        resume, e))
+                deadlines.append(1.0)
+            self._interval = min(deadlines) / 2 if deadlines else None
+
+            self._logs.info("Starting server on {}:{}", self.host,
+                            self.port, verbose=self._verbose)
 
             self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -495,17 +829,38 @@ class Server:
                 raise ValueError("Cannot bind to {}:{}. {}".format(
                     self.host, self.port, e))
             self._sock.listen()
+            self._sock.setblocking(False)
+
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self._sock, selectors.EVENT_READ)
+            self._waker = socket.socketpair()
+            self._waker[0].setblocking(False)
+            self._waker[1].setblocking(False)
+            self._selector.register(self._waker[0], selectors.EVENT_READ,
+                                    self._waker)
+
+            if self._job is not None and (self._cache is not None
+                                          or self._journal is not None):
+                self._job.tasks.get_source().skip(self._skip_known)
+            if self._metrics_port is not None:
+                try:
+                    self._metrics_server = serve_metrics(
+                        self.stats, self._metrics_port, self.host)
+                except OSError as e:
+                    raise ValueError("Cannot serve metrics on port {}. {}"
+                                     .format(self._metrics_port, e))
 
             self._logs.info("Server started.", verbose=self._verbose)
 
+            if self._job is not None:
+                self._add_job(self._job)
             self.running = True
+            self._closed = False
+            self._accepting = True
             self._process = Thread(target=self._update)
             self._process.start()
             self._logs.info("Server process started.", verbose=self._verbose)
 
-            self._client_process = Thread(target=self._update_clients)
-            self._client_process.start()
-
         except ValueError as e:
             self._logs.error(e, verbose=self._verbose)
 
@@ -538,33 +893,210 @@ class Server:
         Returns
         -------
         (socket.socket, tuple)
-            The socket connection and the address of the client.
+            The socket connection and the address of the client,
+            (None, None) if no connection is pending or it could not be
+            accepted.
         """
         try:
             client, address = self._sock.accept()
             return (client, address)
-        except socket.timeout:
-            return (socket.socket(socket.AF_INET, socket.SOCK_STREAM), ('', 0))
+        except (BlockingIOError, InterruptedError):
+            return (None, None)
+        except OSError as e:
+            # A client reset before being accepted, or a transient error
+            # such as too many open files: the server keeps serving.
+            self._logs.warning("Cannot accept a connection: {}", e,
+                               verbose=self._verbose)
+            return (None, None)
 
-    def bind_parameters(self, parameters) -> None:
+    def bind_parameters(self, parameters, chunksize=1,
+                        scheduler='fixed') -> None:
         """
-        bind_parameters Binds a list of parameters to the server.
+        bind_parameters Binds the parameters of a job to the server.
 
         Parameters
         ----------
-        parameters : list
-            A list of parameters to be bound to the server.
+        parameters : iterable or ParameterSource
+            The parameters to be bound to the server: a list, or any
+            iterable such as a generator or read_ndjson(path), which is
+            then read lazily as clients need more tasks.
+        chunksize : int or str
+            Number of parameters sent to a client in a single message.
+            'auto' sizes each chunk from the parameters left and the
+            number of connected clients, like multiprocessing.Pool.map.
+            The smallest number of parameters per message for the other
+            schedulers.
+        scheduler : str or Scheduler
+            The policy choosing the client and the size of each message:
+            'fixed', 'guided', 'throughput' or 'least-loaded'.
         """
         try:
-            if not isinstance(parameters, list):
-                raise TypeError("Parameters must be a list.")
-            self._to_complete = len(parameters)
-            self._parameters = parameters
+            if self.running:
+                raise ValueError("Cannot bind parameters to a running "
+                                 "server. Use Server.map() instead.")
+            (source, scheduler) = _check_parameters(parameters, chunksize,
+                                                    scheduler)
+            self._job = Job(TaskStore(source, self._task_ids), scheduler)
+            self._metrics = Metrics()
 
             self._logs.info("Parameters bound.", verbose=self._verbose)
-        except TypeError as e:
+        except (TypeError, ValueError) as e:
+            self._logs.error(e, verbose=self._verbose)
+
+    def bind_function(self, function) -> None:
+        """
+        bind_function Sets the function the clients run, sent to each of
+        them when it connects. Clients then need no function of their
+        own, and always run the same version as the server.
+
+        A function defined at the top level of a module is sent with the
+        source of the module, which the clients run under another name,
+        so scripts must guard their own code with
+        if __name__ == "__main__". Any other function is sent as a code
+        object and must import what it uses in its body.
+
+        Parameters
+        ----------
+        function : function
+            The function the clients run.
+        """
+        try:
+            if not callable(function):
+                raise TypeError("Function must be callable.")
+            self._function = pack_function(function)
+
+            self._logs.info("Function {} bound.", self._function['name'],
+                            verbose=self._verbose)
+        except (TypeError, ValueError) as e:
             self._logs.error(e, verbose=self._verbose)
 
+    def submit(self, function, parameters) -> Future:
+        """
+        submit Runs a function on a set of parameters on the clients.
+
+        The tasks submitted with the same function make up a job, which
+        shares the clients with the other jobs of the server.
+
+        Parameters
+        ----------
+        function : function or dict
+            The function to run, sent to the clients as with
+            Server.bind_function(), or as packed by pack_function. None
+            to run the function of the clients.
+        parameters : dict
+            The parameters of the task.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future of the output of the task. If the task fails, it
+            raises the exception of the task with the pickle serializer,
+            or a RuntimeError with the error message.
+        """
+        future = Future()
+        try:
+            spec = self._pack(function)
+            key = None if spec is None else spec['hash']
+            with self._jobs_lock:
+                if not self._accepting:
+                    raise ValueError("Server is stopped.")
+                job = self._function_jobs.get(key)
+                if job is None:
+                    job = Job(TaskStore(ParameterQueue(), self._task_ids),
+                              get_scheduler('guided'), next(self._job_ids),
+                              spec, open=True)
+                    self._function_jobs[key] = job
+                    self._new_jobs.append(job)
+                future = job.submit(parameters)
+            self._wake()
+        except (TypeError, ValueError) as e:
+            self._logs.error(e, verbose=self._verbose)
+            future.set_exception(e)
+        return future
+
+    def map(self, function, parameters, chunksize=1, scheduler='fixed'):
+        """
+        map Runs a function on every set of parameters of an iterable on
+        the clients, as a job sharing the clients with the other jobs of
+        the server.
+
+        Parameters
+        ----------
+        function : function or dict
+            The function to run, sent to the clients as with
+            Server.bind_function(), or as packed by pack_function. None
+            to run the function of the clients.
+        parameters : iterable or ParameterSource
+            The parameters of the job, read lazily as clients need more
+            tasks.
+        chunksize : int or str
+            Number of parameters sent to a client in a single message,
+            as in Server.bind_parameters().
+        scheduler : str or Scheduler
+            The policy choosing the size of each message, as in
+            Server.bind_parameters().
+
+        Returns
+        -------
+        generator
+            The output of each task, in the order of the parameters. It
+            raises the exception of a task that failed at its position,
+            as with submit().
+        """
+        try:
+            (source, scheduler) = _check_parameters(parameters, chunksize,
+                                                    scheduler)
+            spec = self._pack(function)
+            with self._jobs_lock:
+                if not self._accepting:
+                    raise ValueError("Server is stopped.")
+                job = Job(TaskStore(source, self._task_ids), scheduler,
+                          next(self._job_ids), spec, ordered=True)
+                self._new_jobs.append(job)
+            self._wake()
+            return job.results()
+        except (TypeError, ValueError) as e:
+            self._logs.error(e, verbose=self._verbose)
+            return _failed(e)
+
+    def _pack(self, function):
+        """
+        _pack Packs a function to be sent to the clients, once.
+
+        Parameters
+        ----------
+        function : function or dict
+            The function, already packed if a dict, None for the
+            function of the clients.
+
+        Returns
+        -------
+        dict or None
+            The function, as returned by pack_function.
+        """
+        if function is None or isinstance(function, dict):
+            return function
+        if not callable(function):
+            raise TypeError("Function must be callable.")
+        try:
+            spec = self._packed.get(function)
+        except TypeError:
+            spec = None
+        if spec is None:
+            spec = pack_function(function)
+            self._packed[function] = spec
+        return spec
+
+    def _wake(self) -> None:
+        """
+        _wake Wakes up the event loop, to pick up new jobs.
+        """
+        if self.running and self._waker is not None:
+            try:
+                self._waker[1].send(b'\0')
+            except OSError:
+                pass
+
     def on_completed(self, callback) -> None:
         """
         on_completed Sets the callback function to be called
@@ -585,6 +1117,225 @@ class Server:
         except TypeError as e:
             self._logs.error(e, verbose=self._verbose)
 
+    def on_reduce(self, combine, initial=None, window=None,
+                  merge=None) -> None:
+        """
+        on_reduce Folds the output of each task into a single value as
+        it completes, instead of keeping the results. The value is
+        passed to the on_completed callback in place of the results.
+
+        With a window, the clients fold the outputs of the bound
+        parameters themselves and send one partial value per window,
+        which the server merges. Those outputs are then not passed to
+        on_result, results(), the journal or the cache.
+
+        Parameters
+        ----------
+        combine : function, str or Reducer
+            A function called with the value so far and an output,
+            returning the new value, or a reducer: 'sum', 'count',
+            'min', 'max' or 'mean', or a Reducer object.
+        initial : object
+            The value before any output is folded, with a function.
+        window : float
+            Seconds each client folds its outputs over before sending
+            them as one partial value, 0 to send one per batch. None to
+            send every output. Keep it well below the timeout.
+        merge : function
+            Called with two values folded from different outputs,
+            returning the value holding both, with a function. Without
+            it, the clients cannot fold outputs and send every one.
+        """
+        try:
+            if self.running:
+                raise ValueError("Cannot set a reducer while running.")
+            if callable(combine) and not isinstance(combine, Reducer):
+                reducer = Fold(combine, initial, merge)
+            elif isinstance(combine, (str, Reducer)):
+                reducer = get_reducer(combine)
+            else:
+                raise TypeError("Reducer must be a function, a name or a "
+                                "Reducer.")
+            self._reducer = reducer
+            self._reduced = reducer.initial()
+            self._combiner = None
+            if window is not None:
+                try:
+                    self._combiner = {"reducer": reducer.to_dict(),
+                                      "window": max(0.0, window)}
+                except (TypeError, ValueError) as e:
+                    self._logs.warning("Reducer cannot be sent to the "
+                                       "clients. {}", e,
+                                       verbose=self._verbose)
+                if self._combiner is not None and \
+                        self._combiner['reducer'] is None:
+                    self._logs.warning("Reducer cannot be sent to the "
+                                       "clients.", verbose=self._verbose)
+                    self._combiner = None
+
+            self._logs.info("Reducer set.", verbose=self._verbose)
+        except (TypeError, ValueError) as e:
+            self._logs.error(e, verbose=self._verbose)
+
+    def get_reduced(self):
+        """
+        get_reduced Returns the value the outputs completed so far were
+        folded into by the reducer.
+
+        Returns
+        -------
+        object
+            The value of the reduction, None without a reducer.
+        """
+        if self._reducer is None:
+            return None
+        with self._results_lock:
+            return self._reducer.result(self._reduced)
+
+    def stats(self) -> dict:
+        """
+        stats Returns the metrics of the server.
+
+        Returns
+        -------
+        dict
+            The tasks pending, in flight, succeeded, failed, retried,
+            cached and resumed, the bytes and messages sent and received,
+            histograms of the task latency and of the serialization time,
+            and the traffic, tasks and busy fraction of each worker.
+        """
+        pending, in_flight = 0, 0
+        for job in list(self._jobs.values()) or [self._job]:
+            if job is None:
+                continue
+            estimate = job.tasks.pending_estimate()
+            pending = None if estimate is None or pending is None \
+                else pending + estimate
+            in_flight += sum(len(task.parameters) for task in
+                             list(job.tasks.get_in_flight().values()))
+        return self._metrics.to_dict(pending, in_flight)
+
+    def get_progress(self) -> dict:
+        """
+        get_progress Returns the progress of the job.
+
+        Returns
+        -------
+        dict
+            The number of parameters dispatched, succeeded and failed,
+            and the total number of parameters if known.
+        """
+        if self._job is None:
+            return {"dispatched": 0, "succeeded": 0, "failed": 0,
+                    "total": None}
+        source = self._job.tasks.get_source()
+        return {"dispatched": source.get_taken(),
+                "succeeded": self._metrics.counters['succeeded'],
+                "failed": self._metrics.counters['failed'],
+                "total": source.get_total()}
+
+    def on_result(self, callback) -> None:
+        """
+        on_result Sets the callback function to be called
+        with each result as soon as its task has completed.
+
+        Parameters
+        ----------
+        callback : function
+            The callback function to be called with the input
+            parameters and the output of each task.
+        """
+        try:
+            if not callable(callback):
+                raise TypeError("Callback must be a function.")
+            self._callback_result = callback
+
+            self._logs.info("Result function set.", verbose=self._verbose)
+        except TypeError as e:
+            self._logs.error(e, verbose=self._verbose)
+
+    def results(self):
+        """
+        results Iterates over the results in completion order, blocking
+        until the next one arrives, until the server stops.
+
+        The results already completed and kept are yielded first. With
+        keep_results disabled, call it before Server.start() so no
+        result is missed.
+
+        Returns
+        -------
+        generator
+            The input parameters and the output of each task.
+        """
+        with self._results_lock:
+            completed = list(self._completed)
+            results = None
+            if not self._closed:
+                results = queue.Queue()
+                self._result_queues.append(results)
+        return self._iterate_results(completed, results)
+
+    def _iterate_results(self, completed, results):
+        """
+        _iterate_results Yields the results kept, then the results
+        published on a queue until the server stops.
+
+        Parameters
+        ----------
+        completed : list
+            The results already completed.
+        results : queue.Queue
+            The queue the next results are published on, if any.
+
+        Yields
+        ------
+        dict
+            The input parameters and the output of each task.
+        """
+        yield from completed
+        if results is None:
+            return
+        result = results.get()
+        while result is not None:
+            yield result
+            result = results.get()
+
+    def _publish(self, result) -> None:
+        """
+        _publish Keeps a result and hands it to the results iterators
+        and to the on_result callback. A result the reducer fails on
+        is reported as failed instead.
+
+        Parameters
+        ----------
+        result : dict
+            The input parameters and the output of a task.
+        """
+        error = None
+        with self._results_lock:
+            if self._reducer is not None:
+                try:
+                    self._reduced = self._reducer.add(self._reduced,
+                                                      result['output'])
+                except Exception as e:
+                    error = "Cannot reduce output: {}".format(e)
+            elif self._keep_results:
+                self._completed.append(result)
+            if error is None:
+                for results in self._result_queues:
+                    results.put(result)
+        if error is not None:
+            self._metrics.counters['failed'] += 1
+            self._report(error)
+            return
+        self._metrics.counters['succeeded'] += 1
+        if self._callback_result is not None:
+            try:
+                self._callback_result(result)
+            except Exception as e:
+                self._report("Result callback failed: {}".format(e))
+
     def on_error(self, callback):
         """
         on_error Sets the callback function to be called
@@ -607,90 +1358,756 @@ class Server:
 
     def _update(self) -> None:
         """
-        update Updates the server.
+        update Runs the event loop of the server until it is stopped,
+        then closes it, even if a callback raised.
+        """
+        try:
+            self._loop()
+        finally:
+            self.running = False
+            self._close()
+
+    def _loop(self) -> None:
+        """
+        _loop Handles the events of the server until it is stopped.
         """
         while self.running:
-            if len(self._new_workers) > 0:
-                client, address = self._new_workers.pop()
-                self._workers[address] = Worker(client, address)
-
-            for key, _ in self._workers.items():
-                if not self._workers[key].is_assigned():
-                    try:
-                        # input_p = random.choice(self._parameters)
-                        input_p = self._parameters.pop(0)
-                        self._workers[key].assign_task(input_p)
-                        self._assigned[key] = {
-                            "status": "assigned",
-                            "parameters": input_p
-                        }
-                        self._workers[key].run()
-                        self._logs.info("Assigned parameters: {} to {}".format(
-                            self._workers[key].get_parameters(), key),
+            self._add_submitted()
+            self._dispatch()
+
+            if self._finish_jobs():
+                if self._callback is not None and self._reducer is not None:
+                    self._logs.info("All tasks completed: {} results "
+                                    "reduced.",
+                                    self._metrics.counters['succeeded'],
+                                    verbose=self._verbose)
+                    self._callback(self.get_reduced())
+                elif self._callback is not None:
+                    self._logs.info("All tasks completed: {} results.",
+                                    len(self._completed),
+                                    verbose=self._verbose)
+                    self._callback(self._completed)
+                self._logs.info("Stopping server...", verbose=self._verbose)
+                self.stop()
+                break
+
+            for key, mask in self._selector.select(self._interval):
+                if key.data is None:
+                    self._update_clients()
+                elif key.data is self._waker:
+                    self._drain_waker()
+                else:
+                    self._handle(key.data, mask)
+
+            self._check_deadlines()
+            if self._journal is not None:
+                self._journal.sync_if_due()
+
+    def _add_submitted(self) -> None:
+        """
+        _add_submitted Starts the jobs submitted since the last call.
+        """
+        with self._jobs_lock:
+            jobs = list(self._new_jobs)
+            self._new_jobs.clear()
+        for job in jobs:
+            self._add_job(job)
+            self._logs.info("Job {} started.", job.job_id,
                             verbose=self._verbose)
-                    except IndexError:
-                        continue
 
-                elif (self._workers[key].is_assigned() and not
-                      self._workers[key].is_running()):
-                    self._workers[key].run()
-
-                if self._workers[key].is_running():
-                    self._workers[key].check_status()
-
-                if self._workers[key].is_done():
-                    if self._workers[key].get_error() is not None:
-                        if self._callback_error is not None:
-                            self._callback_error(
-                                self._workers[key].get_error())
-                        else:
-                            self._logs.error(
-                                self._workers[key].get_error(),
+    def _add_job(self, job) -> None:
+        """
+        _add_job Starts a job on the workers connected.
+
+        Parameters
+        ----------
+        job : Job
+            The job.
+        """
+        self._jobs[job.job_id] = job
+        for worker in self._workers.values():
+            if worker.get_capacity():
+                job.scheduler.add_worker(worker.get_address(),
+                                         worker.get_capacity())
+
+    def _finish_jobs(self) -> bool:
+        """
+        _finish_jobs Closes the jobs that are done, other than the one
+        bound to the server, and fails the jobs whose parameters could
+        not be read.
+
+        Returns
+        -------
+        bool
+            True if the server has parameters bound and every job is
+            done, so it should stop, False otherwise.
+        """
+        for job in list(self._jobs.values()):
+            done = job.is_done()
+            error = job.tasks.get_source().take_error()
+            if error is not None:
+                self._fail_job(job, "Cannot read parameters: {}".format(
+                    error))
+            elif job is not self._job and done:
+                self._remove_job(job)
+                self._logs.info("Job {} completed.", job.job_id,
                                 verbose=self._verbose)
-                            continue
-                    else:
-                        self._completed.append(self._workers[key].get_result())
+        return self._job is not None and \
+            all(job.tasks.is_done() for job in self._jobs.values())
 
-                        self._logs.info(
-                            "Completed parameters: {} from {}".format(
-                                self._workers[key].get_parameters(), key),
-                            verbose=self._verbose)
+    def _remove_job(self, job, error=None) -> None:
+        """
+        _remove_job Closes a job, failing its tasks left if any, and
+        tells the workers to forget it.
 
-                        self._logs.output(self._workers[key].get_result(),
-                                          verbose=self._verbose)
+        Parameters
+        ----------
+        job : Job
+            The job.
+        error : str
+            Why the job was closed, None if it completed.
+        """
+        self._jobs.pop(job.job_id, None)
+        job.close(error)
+        for worker in list(self._workers.values()):
+            worker.forget_job(job.job_id)
+            self._flush(worker)
 
-                        try:
-                            self._parameters.remove(
-                                self._workers[key].get_parameters())
-                        except ValueError:
-                            pass
+    def _next_job(self):
+        """
+        _next_job Returns the job to dispatch a batch of next: the one
+        with parameters left and the fewest batches in flight.
 
-                    self._workers[key].terminate()
+        Returns
+        -------
+        Job or None
+            The job, None if no job has parameters left.
+        """
+        best = None
+        for job in self._jobs.values():
+            if (best is None or job.share() < best.share()) and \
+                    job.tasks.has_pending():
+                best = job
+        return best
 
-            if len(self._completed) == self._to_complete or len(
-                    self._parameters) == 0:
-                if self._callback is not None:
-                    self._logs.info("All tasks completed.",
-                                    verbose=self._verbose)
-                    self._logs.output(self._completed, verbose=self._verbose)
-                    self._callback(self._completed)
-                self._logs.info("Stopping server...", verbose=self._verbose)
-                self.stop()
+    def _find_task(self, task_id) -> tuple:
+        """
+        _find_task Returns a batch in flight and its job.
 
-    def _update_clients(self) -> None:
+        Parameters
+        ----------
+        task_id : int
+            The ID of the batch.
+
+        Returns
+        -------
+        (Job, Task) or (None, None)
+            The job and the batch, (None, None) if it is not in flight.
+        """
+        for job in self._jobs.values():
+            task = job.tasks.get_task(task_id)
+            if task is not None:
+                return (job, task)
+        return (None, None)
+
+    def _dispatch(self) -> None:
+        """
+        _dispatch Assigns the pending parameters to the free slots of
+        the workers, each worker holding up to prefetch slots.
+        """
+        flushed = {}
+        while self._idle:
+            job = self._next_job()
+            if job is None:
+                break
+            key = job.scheduler.pick(self._idle)
+            worker = self._workers.get(key)
+            if worker is None:
+                continue
+            task_id, task = job.tasks.dispatch(
+                key, job.scheduler.chunk_size(key, job.tasks.remaining()))
+            if task_id is None:
+                self._idle.appendleft(key)
+                break
+            if task.attempts == 1 and not job.start(task):
+                job.tasks.complete(task_id)
+                self._idle.appendleft(key)
+                continue
+            worker.assign_task(task_id, task.parameters, job.job_id,
+                               job.function)
+            job.scheduler.dispatched(key, len(task.parameters))
+            self._logs.debug("Assigned parameters: {} to {}",
+                             task.parameters, key, verbose=self._verbose)
+            flushed[key] = worker
+        if self._speculative and self._next_job() is None:
+            self._speculate(flushed)
+        for worker in flushed.values():
+            self._flush(worker)
+
+    def _speculate(self, flushed) -> None:
+        """
+        _speculate Copies the longest running batches to the workers
+        with nothing left to run.
+
+        Parameters
+        ----------
+        flushed : dict
+            The workers to flush once done, keyed by address.
+        """
+        for _ in range(len(self._idle)):
+            key = self._idle.popleft()
+            worker = self._workers.get(key)
+            if worker is None:
+                continue
+            task_id = None
+            if not worker.is_assigned():
+                for job in self._jobs.values():
+                    task_id, task = job.tasks.speculate(key)
+                    if task_id is not None:
+                        break
+            if task_id is None:
+                self._idle.append(key)
+                continue
+            worker.assign_task(task_id, task.parameters, job.job_id,
+                               job.function)
+            job.scheduler.dispatched(key, len(task.parameters))
+            self._logs.debug("Speculatively assigned parameters: {} to {}",
+                             task.parameters, key, verbose=self._verbose)
+            flushed[key] = worker
+
+    def _handle(self, worker, mask) -> None:
         """
-        _update_clients Checks for new connections and
-        adds them to a queue of clients in self._new_workers.
+        _handle Handles the events of a worker's socket.
+
+        Parameters
+        ----------
+        worker : Worker
+            The worker whose socket is ready.
+        mask : int
+            The selector events that are ready.
+        """
+        if self._workers.get(worker.get_address()) is not worker:
+            # Removed while handling an earlier event of the same batch.
+            return
+        if mask & selectors.EVENT_WRITE and not self._flush(worker):
+            return
+        if mask & selectors.EVENT_READ:
+            if not worker.check_status():
+                self._remove_worker(worker)
+                return
+            capacity = worker.grant_capacity()
+            if capacity:
+                for job in self._jobs.values():
+                    job.scheduler.add_worker(worker.get_address(), capacity)
+            slots = capacity * self._prefetch
+            self._idle.extend([worker.get_address()] * slots)
+            if worker.is_done():
+                self._complete(worker)
+
+    def _complete(self, worker) -> None:
+        """
+        _complete Collects the results of a worker and marks it as idle.
+
+        Parameters
+        ----------
+        worker : Worker
+            The worker that has finished its batch.
         """
-        while self.running:
+        key = worker.get_address()
+        for task_id, batch in worker.get_finished():
+            if isinstance(task_id, tuple):
+                self._merge(worker, task_id, batch)
+                continue
+            self._idle.append(key)
+            (job, task) = self._find_task(task_id)
+            if batch is None or task is None or key not in task.workers:
+                continue
+            self._acknowledge(worker, job, task_id, task)
+            for index, parameters, outcome in zip(task.indexes,
+                                                  task.parameters, batch):
+                if job is not self._job:
+                    self._resolve(job, index, outcome)
+                    continue
+                if 'error' in outcome:
+                    self._metrics.counters['failed'] += 1
+                    self._report(outcome['error'])
+                    continue
+                result = {"input": parameters, "output": outcome['data']}
+                self._publish(result)
+                self._record(index, result)
+                if self._cache is not None:
+                    self._cache.put(parameters, result['output'])
+
+                self._logs.debug("Completed parameters: {} from {}",
+                                 parameters, key, verbose=self._verbose)
+                self._logs.output(result, verbose=self._verbose)
+        worker.terminate()
+        worker.get_stats().set_busy(worker.is_assigned())
+
+    def _acknowledge(self, worker, job, task_id, task) -> None:
+        """
+        _acknowledge Marks a batch as completed by a worker.
+
+        Parameters
+        ----------
+        worker : Worker
+            The worker that completed it.
+        job : Job
+            The job of the batch.
+        task_id : int
+            The ID of the batch.
+        task : Task
+            The batch.
+        """
+        key = worker.get_address()
+        job.tasks.complete(task_id)
+        job.scheduler.completed(key, len(task.parameters), task.dispatched)
+        self._metrics.latency.observe(time.monotonic() - task.dispatched,
+                                      len(task.parameters))
+        worker.get_stats().tasks += len(task.parameters)
+        self._cancel_copies(job, task_id, task, key)
+
+    def _merge(self, worker, task_ids, partial) -> None:
+        """
+        _merge Merges the partial value of the outputs of batches folded
+        by a client. If one of the batches completed elsewhere, the
+        partial value is dropped and the others are run again, so no
+        output is counted twice.
+
+        Parameters
+        ----------
+        worker : Worker
+            The worker that sent the partial value.
+        task_ids : tuple
+            The IDs of the batches.
+        partial : dict
+            The partial value, the number of outputs folded into it and
+            the error message of each task that failed.
+        """
+        key = worker.get_address()
+        self._idle.extend([key] * len(task_ids))
+        found = [(task_id,) + self._find_task(task_id)
+                 for task_id in task_ids]
+        if any(task is None or key not in task.workers or job is not self._job
+               for _, job, task in found):
+            for task_id, job, task in found:
+                if task is None or key not in task.workers:
+                    continue
+                task.workers.discard(key)
+                if not task.workers:
+                    self._retry(job, task_id, "Partial value from {} "
+                                "overlaps batches completed elsewhere"
+                                .format(key))
+            return
+        for task_id, job, task in found:
+            self._acknowledge(worker, job, task_id, task)
+        errors = partial['errors']
+        if partial['count'] and self._reducer is not None:
             try:
-                client, address = self._accept()
-                self._logs.info("Connection from {}".format(address),
-                                verbose=self._verbose)
-                if client is not None and address not in self._workers.keys():
-                    self._new_workers.append((client, address))
-            except ConnectionAbortedError:
+                with self._results_lock:
+                    self._reduced = self._reducer.merge(self._reduced,
+                                                        partial['partial'])
+                self._metrics.counters['succeeded'] += partial['count']
+            except Exception as e:
+                errors = errors + ["Cannot reduce output: {}".format(e)] \
+                    * partial['count']
+        self._metrics.counters['failed'] += len(errors)
+        for error in errors:
+            self._report(error)
+        self._logs.debug("Merged {} outputs of {} batches from {}",
+                         partial['count'], len(task_ids), key,
+                         verbose=self._verbose)
+
+    def _resolve(self, job, index, outcome) -> None:
+        """
+        _resolve Hands the outcome of a task to the job it belongs to.
+
+        Parameters
+        ----------
+        job : Job
+            The job of the task.
+        index : int
+            The position of the task in the job.
+        outcome : dict
+            The output or the error message of the task.
+        """
+        if 'error' in outcome:
+            self._metrics.counters['failed'] += 1
+            job.set_error(index, outcome['error'], outcome.get('exception'))
+        else:
+            self._metrics.counters['succeeded'] += 1
+            job.set_result(index, outcome['data'])
+
+    def _cancel_copies(self, job, task_id, task, winner) -> None:
+        """
+        _cancel_copies Cancels the other copies of a batch once one of
+        them has completed.
+
+        Parameters
+        ----------
+        job : Job
+            The job of the batch.
+        task_id : int
+            The ID of the batch.
+        task : Task
+            The batch.
+        winner : tuple
+            The address of the worker that completed it first.
+        """
+        for key in task.workers - {winner}:
+            worker = self._workers.get(key)
+            if worker is None:
+                continue
+            worker.cancel(task_id)
+            job.scheduler.cancelled(key, len(task.parameters))
+            self._logs.debug("Cancelled parameters: {} on {}",
+                             task.parameters, key, verbose=self._verbose)
+            self._flush(worker)
+
+    def _skip_known(self, index, parameters) -> bool:
+        """
+        _skip_known Answers a task from the journal or the cache as its
+        parameters are read, reporting an error raised doing so instead
+        of ending the source. The task is then run.
+
+        Parameters
+        ----------
+        index : int
+            The position of the task in the source.
+        parameters : dict
+            The parameters of the task.
+
+        Returns
+        -------
+        bool
+            True if the task was answered, False otherwise.
+        """
+        try:
+            return self._answer_known(index, parameters)
+        except Exception as e:
+            self._report("Cannot look up parameters {}: {}".format(
+                parameters, e))
+            return False
+
+    def _answer_known(self, index, parameters) -> bool:
+        """
+        _answer_known Completes a task from the journal being resumed,
+        or from the cache, if its output is found in either.
+
+        Parameters
+        ----------
+        index : int
+            The position of the task in the source.
+        parameters : dict
+            The parameters of the task.
+
+        Returns
+        -------
+        bool
+            True if the task was answered, False otherwise.
+        """
+        result = self._replay.pop(index, None)
+        if result is not None and _same_parameters(result['input'],
+                                                   parameters):
+            self._metrics.counters['resumed'] += 1
+            self._publish(result)
+            self._logs.debug("Resumed parameters: {}", parameters,
+                             verbose=self._verbose)
+            return True
+        if result is not None:
+            self._logs.warning("Journaled parameters {} do not match {}.",
+                               result['input'], parameters,
+                               verbose=self._verbose)
+        if self._cache is not None:
+            return self._answer_cached(index, parameters)
+        return False
+
+    def _record(self, index, result) -> None:
+        """
+        _record Writes a result to the journal, if any.
+
+        Parameters
+        ----------
+        index : int
+            The position of the task in the source.
+        result : dict
+            The input parameters and the output of the task.
+        """
+        if self._journal is None:
+            return
+        try:
+            self._journal.append(index, result)
+        except (OSError, pickle.PicklingError, TypeError,
+                AttributeError) as e:
+            self._logs.warning("Cannot journal parameters {}. {}",
+                               result['input'], e, verbose=self._verbose)
+
+    def _answer_cached(self, index, parameters) -> bool:
+        """
+        _answer_cached Completes a task from the cache if its output
+        is found in it.
+
+        Parameters
+        ----------
+        index : int
+            The position of the task in the source.
+        parameters : dict
+            The parameters of the task.
+
+        Returns
+        -------
+        bool
+            True if the task was answered from the cache, False otherwise.
+        """
+        (found, output) = self._cache.get(parameters)
+        if not found:
+            return False
+        result = {"input": parameters, "output": output}
+        self._metrics.counters['cached'] += 1
+        self._publish(result)
+        self._record(index, result)
+        self._logs.debug("Cached parameters: {}", parameters,
+                         verbose=self._verbose)
+        self._logs.output(result, verbose=self._verbose)
+        return True
+
+    def _check_deadlines(self) -> None:
+        """
+        _check_deadlines Drops the clients that stopped sending
+        heartbeats and retries the batches past their deadline.
+        """
+        now = time.monotonic()
+        if self._interval is None or now < self._next_check:
+            return
+        self._next_check = now + self._interval
+        if self._heartbeat:
+            for worker in list(self._workers.values()):
+                if now - worker.get_last_seen() > 3 * self._heartbeat:
+                    self._logs.warning("No heartbeat from {}.",
+                                       worker.get_address(),
+                                       verbose=self._verbose)
+                    self._remove_worker(worker)
+        if self._timeout:
+            for job in list(self._jobs.values()):
+                for task_id, task in list(job.tasks.get_in_flight().items()):
+                    if now - task.dispatched <= self._timeout:
+                        continue
+                    for key in task.workers:
+                        worker = self._workers.get(key)
+                        if worker is not None:
+                            worker.abandon(task_id)
+                            job.scheduler.cancelled(key, len(task.parameters))
+                    self._retry(job, task_id,
+                                "Parameters {} timed out on {}".format(
+                                    task.parameters,
+                                    ", ".join(map(str, task.workers))))
+
+    def _retry(self, job, task_id, error) -> None:
+        """
+        _retry Sends a batch in flight back to be dispatched again, or
+        reports it as failed once its retries are used up.
+
+        Parameters
+        ----------
+        job : Job
+            The job of the batch.
+        task_id : int
+            The ID of the batch.
+        error : str
+            The reason the batch did not complete.
+        """
+        task = job.tasks.get_task(task_id)
+        if task is None:
+            return
+        if task.attempts <= self._retries:
+            job.tasks.requeue(task_id)
+            self._metrics.counters['retried'] += len(task.parameters)
+            self._logs.warning("{}. Retrying.", error,
+                               verbose=self._verbose)
+            return
+        job.tasks.complete(task_id)
+        self._metrics.counters['failed'] += len(task.parameters)
+        if job is not self._job:
+            for index in task.indexes:
+                job.set_error(index, error)
+            return
+        self._report(error)
+
+    def _fail_job(self, job, error) -> None:
+        """
+        _fail_job Reports a job whose parameters could not be read past
+        an error. The parameters read before it still run for the job
+        bound to the server, the other jobs are closed.
+
+        Parameters
+        ----------
+        job : Job
+            The job.
+        error : str
+            The error message.
+        """
+        if job is not self._job:
+            self._remove_job(job, error)
+            return
+        self._report(error)
+
+    def _report(self, error) -> None:
+        """
+        _report Hands an error to the error callback, or logs it if
+        there is none or it raises.
+
+        Parameters
+        ----------
+        error : str
+            The error message.
+        """
+        if self._callback_error is not None:
+            try:
+                self._callback_error(error)
+                return
+            except Exception as e:
+                self._logs.error("Error callback failed: {}", e,
+                                 verbose=self._verbose)
+        self._logs.error(error, verbose=self._verbose)
+
+    def _flush(self, worker) -> bool:
+        """
+        _flush Sends the queued bytes of a worker and updates the
+        events the selector waits for.
+
+        Parameters
+        ----------
+        worker : Worker
+            The worker to flush.
+
+        Returns
+        -------
+        bool
+            True if the worker is still connected, False otherwise.
+        """
+        try:
+            worker.flush()
+        except OSError:
+            self._remove_worker(worker)
+            return False
+        events = selectors.EVENT_READ
+        if worker.wants_write():
+            events |= selectors.EVENT_WRITE
+        self._selector.modify(worker.get_socket(), events, worker)
+        return True
+
+    def _remove_worker(self, worker) -> None:
+        """
+        _remove_worker Unregisters and closes a disconnected worker,
+        unless it was removed already.
+
+        Parameters
+        ----------
+        worker : Worker
+            The worker to remove.
+        """
+        key = worker.get_address()
+        if self._workers.get(key) is not worker:
+            return
+        del self._workers[key]
+        self._logs.warning("Connection to {} lost.", key,
+                           verbose=self._verbose)
+        try:
+            self._selector.unregister(worker.get_socket())
+        except (KeyError, ValueError):
+            pass
+        worker.close()
+        self._metrics.remove_worker(key)
+        for job in self._jobs.values():
+            job.scheduler.remove_worker(key)
+        for task_id, parameters in list(worker.get_tasks().items()):
+            (job, task) = self._find_task(task_id)
+            if task is None or key not in task.workers:
+                continue
+            task.workers.discard(key)
+            if task.workers:
+                continue
+            self._retry(job, task_id, "Connection to {} lost while running "
+                        "parameters: {}".format(key, parameters))
+
+    def _update_clients(self) -> None:
+        """
+        _update_clients Accepts the pending connections and registers
+        them as workers, which get slots once the client is ready.
+        """
+        while True:
+            client, address = self._accept()
+            if client is None:
+                return
+            self._logs.info("Connection from {}", address,
+                            verbose=self._verbose)
+            if address in self._workers.keys():
+                client.close()
                 continue
+            client.setblocking(False)
+            worker = Worker(client, address, self._serializer,
+                            self._compression, self._heartbeat,
+                            self._metrics, self._function, self._combiner)
+            self._workers[address] = worker
+            self._selector.register(client, selectors.EVENT_READ, worker)
+            self._flush(worker)
+
+    def _drain_waker(self) -> None:
+        """
+        _drain_waker Empties the socket used to wake up the event loop.
+        """
+        try:
+            while self._waker[0].recv(1024):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _close(self) -> None:
+        """
+        _close Closes every socket owned by the event loop.
+        """
+        with self._jobs_lock:
+            self._accepting = False
+            jobs = [job for job in self._jobs.values()
+                    if job is not self._job] + list(self._new_jobs)
+            self._new_jobs.clear()
+            self._function_jobs = {}
+        for job in jobs:
+            job.close("Server stopped.")
+        self._jobs = {}
+        for worker in list(self._workers.values()):
+            worker.close()
+        self._workers = {}
+        self._idle.clear()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self._metrics_server is not None:
+            self._metrics_server.shutdown()
+            self._metrics_server.server_close()
+            self._metrics_server = None
+        self._replay = {}
+        self._selector.close()
+        self._sock.close()
+        self._waker[0].close()
+        self._waker[1].close()
+        with self._results_lock:
+            self._closed = True
+            for results in self._result_queues:
+                results.put(None)
+            self._result_queues = []
+
+    def join(self, timeout=None) -> None:
+        """
+        join Waits for the server to stop.
+
+        Parameters
+        ----------
+        timeout : float
+            Longest time to wait in seconds, None to wait until it stops.
+        """
+        if self._process is not None:
+            self._process.join(timeout)
 
     def stop(self) -> list:
         """
@@ -705,7 +2122,10 @@ class Server:
             if not self.running:
                 raise ValueError("Server is not running.")
             self.running = False
-            self._sock.close()
+            try:
+                self._waker[1].send(b'\0')
+            except OSError:
+                pass
             return self._completed
         except ValueError as e:
             self._logs.error(e, verbose=self._verbose)
@@ -721,3 +2141,76 @@ class Server:
             A list of results.
         """
         print(results)
+
+
+def _same_parameters(journaled, parameters) -> bool:
+    """
+    _same_parameters Checks if journaled parameters match the parameters
+    read from the source at the same position.
+
+    Parameters
+    ----------
+    journaled : dict
+        The parameters read from the journal.
+    parameters : dict
+        The parameters read from the source.
+
+    Returns
+    -------
+    bool
+        False if they differ, True if they match or hold values that
+        cannot be compared, such as NumPy arrays.
+    """
+    try:
+        return bool(journaled == parameters)
+    except (ValueError, TypeError):
+        return True
+
+
+def _check_parameters(parameters, chunksize, scheduler) -> tuple:
+    """
+    _check_parameters Checks the parameters of a job.
+
+    Parameters
+    ----------
+    parameters : iterable or ParameterSource
+        The parameters of the job.
+    chunksize : int or str
+        Number of parameters sent to a client in a single message.
+    scheduler : str or Scheduler
+        The policy choosing the client and the size of each message.
+
+    Returns
+    -------
+    (ParameterSource, Scheduler)
+        The source of the parameters and the scheduler.
+    """
+    if not isinstance(parameters, ParameterSource) and (
+            isinstance(parameters, (str, bytes, dict))
+            or not hasattr(parameters, '__iter__')):
+        raise TypeError("Parameters must be an iterable.")
+    if chunksize != 'auto' and (not isinstance(chunksize, int)
+                                or chunksize < 1):
+        raise TypeError("Chunksize must be a positive int or 'auto'.")
+    scheduler = get_scheduler(scheduler, chunksize)
+    if not isinstance(parameters, ParameterSource):
+        parameters = ParameterSource(parameters)
+    return (parameters, scheduler)
+
+
+def _failed(error):
+    """
+    _failed Raises an error once iterated, for a job that could not start.
+
+    Parameters
+    ----------
+    error : Exception
+        The error.
+
+    Yields
+    ------
+    None
+        Never yields.
+    """
+    raise error
+    yield
@@ -0,0 +1,408 @@
+"""Sources module for the parally package.
+
+A source hands the parameters of a job to the Server a few at a time, so
+sweeps too large to fit in memory can be streamed from a generator or a
+file instead of being built as a list up front.
+"""
+
+import csv
+import json
+from collections import deque
+from threading import Lock
+
+__all__ = ['ParameterSource', 'ParameterQueue', 'read_ndjson', 'read_csv']
+
+
+class ParameterSource:
+    """
+    A lazy queue of parameters pulled from any iterable, reading at most
+    read_ahead parameters ahead of the ones dispatched.
+
+    An error raised by the iterable ends the source, and is kept for
+    take_error() instead of being raised to the reader.
+    """
+    def __init__(self, parameters, read_ahead=1024):
+        """
+        __init__ Initialises the ParameterSource object.
+
+        Parameters
+        ----------
+        parameters : iterable
+            The parameters of the job: a list, a generator or any
+            other iterable.
+        read_ahead : int
+            Largest number of parameters read before they are needed.
+        """
+        try:
+            self._total = len(parameters)
+        except TypeError:
+            self._total = None
+        self._iterator = enumerate(parameters)
+        self._read_ahead = max(1, read_ahead)
+        self._buffer = deque()
+        self._exhausted = False
+        self._error = None
+        self._skip = None
+        self._taken = 0
+        self._skipped = 0
+
+    def get_total(self):
+        """
+        get_total Returns the number of parameters of the source.
+
+        Returns
+        -------
+        int or None
+            The number of parameters, None if the iterable has no length.
+        """
+        return self._total
+
+    def get_taken(self) -> int:
+        """
+        get_taken Returns the number of parameters taken so far.
+
+        Returns
+        -------
+        int
+            The number of parameters taken.
+        """
+        return self._taken
+
+    def remaining(self) -> int:
+        """
+        remaining Returns the number of parameters left, or the number
+        read ahead if the total is unknown.
+
+        Returns
+        -------
+        int
+            The number of parameters left.
+        """
+        if self._total is not None:
+            return self._total - self._taken - self._skipped
+        self._fill(1)
+        return len(self._buffer)
+
+    def empty(self) -> bool:
+        """
+        empty Checks if every parameter has been taken.
+
+        Returns
+        -------
+        bool
+            True if no parameter is left, False otherwise.
+        """
+        self._fill(1)
+        return not self._buffer
+
+    def take_error(self):
+        """
+        take_error Returns the error raised while reading the iterable,
+        once.
+
+        Returns
+        -------
+        Exception or None
+            The error, None if there was none since the last call.
+        """
+        (error, self._error) = (self._error, None)
+        return error
+
+    def take(self, size) -> list:
+        """
+        take Takes the next parameters of the source.
+
+        Parameters
+        ----------
+        size : int
+            Largest number of parameters to take.
+
+        Returns
+        -------
+        list
+            Up to size parameters, fewer if the source runs out.
+        """
+        return self.take_indexed(size)[1]
+
+    def take_indexed(self, size) -> tuple:
+        """
+        take_indexed Takes the next parameters of the source, with their
+        position in the iterable.
+
+        Parameters
+        ----------
+        size : int
+            Largest number of parameters to take.
+
+        Returns
+        -------
+        (list, list)
+            The positions and the parameters, up to size of them.
+        """
+        self._fill(size)
+        count = min(size, len(self._buffer))
+        indexes, batch = [], []
+        for _ in range(count):
+            (index, parameters) = self._buffer.popleft()
+            indexes.append(index)
+            batch.append(parameters)
+        self._taken += count
+        return (indexes, batch)
+
+    def skip(self, function) -> None:
+        """
+        skip Skips the parameters for which a function returns True,
+        as they are read. An error the function raises is not kept as
+        a read error: it reaches the reader.
+
+        Parameters
+        ----------
+        function : function
+            Called with the position and each set of parameters read.
+        """
+        self._skip = function
+
+    def close(self) -> None:
+        """
+        close Drops the parameters left, closing the underlying
+        generator if any.
+        """
+        self._buffer.clear()
+        self._exhausted = True
+        close = getattr(self._iterator, 'close', None)
+        if close is not None:
+            close()
+
+    def _fill(self, size) -> None:
+        """
+        _fill Reads parameters ahead until at least size of them are
+        buffered, or read_ahead of them if more.
+
+        Parameters
+        ----------
+        size : int
+            Number of parameters needed.
+        """
+        if self._exhausted or len(self._buffer) >= size:
+            return
+        wanted = max(size, self._read_ahead) - len(self._buffer)
+        if self._read(wanted) < wanted:
+            self._exhausted = True
+
+    def _read(self, count) -> int:
+        """
+        _read Reads parameters from the iterable into the buffer, but
+        the ones skipped. Every read of the iterable goes through here,
+        so an error it raises is kept instead of reaching the reader.
+
+        Parameters
+        ----------
+        count : int
+            Largest number of parameters to read.
+
+        Returns
+        -------
+        int
+            The number of parameters buffered, fewer than count if the
+            iterable ran out or raised an error.
+        """
+        before = len(self._buffer)
+        while len(self._buffer) - before < count:
+            try:
+                item = next(self._iterator)
+            except StopIteration:
+                break
+            except Exception as e:
+                self._error = e
+                break
+            if self._skip is not None and self._skip(*item):
+                self._skipped += 1
+            else:
+                self._buffer.append(item)
+        return len(self._buffer) - before
+
+
+class ParameterQueue:
+    """
+    An open-ended source the parameters are put in one at a time, from
+    any thread, while the job runs. It has the interface of a
+    ParameterSource.
+    """
+    def __init__(self):
+        """
+        __init__ Initialises the ParameterQueue object.
+        """
+        self._buffer = deque()
+        self._lock = Lock()
+        self._count = 0
+        self._taken = 0
+        self._closed = False
+
+    def put(self, parameters) -> int:
+        """
+        put Adds parameters at the end of the queue.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters of a task.
+
+        Returns
+        -------
+        int
+            The position of the parameters in the queue.
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("The queue is closed.")
+            index = self._count
+            self._count += 1
+            self._buffer.append((index, parameters))
+        return index
+
+    def get_total(self):
+        """
+        get_total Returns the number of parameters of the source, which
+        is never known for a queue.
+
+        Returns
+        -------
+        None
+            The number of parameters is unknown.
+        """
+        return None
+
+    def get_taken(self) -> int:
+        """
+        get_taken Returns the number of parameters taken so far.
+
+        Returns
+        -------
+        int
+            The number of parameters taken.
+        """
+        return self._taken
+
+    def remaining(self) -> int:
+        """
+        remaining Returns the number of parameters waiting in the queue.
+
+        Returns
+        -------
+        int
+            The number of parameters left.
+        """
+        return len(self._buffer)
+
+    def empty(self) -> bool:
+        """
+        empty Checks if the queue is empty.
+
+        Returns
+        -------
+        bool
+            True if no parameter is waiting, False otherwise.
+        """
+        return not self._buffer
+
+    def take_error(self):
+        """
+        take_error Returns the error raised while reading the source,
+        which never happens for a queue.
+
+        Returns
+        -------
+        None
+            There is no error.
+        """
+        return None
+
+    def take(self, size) -> list:
+        """
+        take Takes the next parameters of the queue.
+
+        Parameters
+        ----------
+        size : int
+            Largest number of parameters to take.
+
+        Returns
+        -------
+        list
+            Up to size parameters.
+        """
+        return self.take_indexed(size)[1]
+
+    def take_indexed(self, size) -> tuple:
+        """
+        take_indexed Takes the next parameters of the queue, with their
+        position in it.
+
+        Parameters
+        ----------
+        size : int
+            Largest number of parameters to take.
+
+        Returns
+        -------
+        (list, list)
+            The positions and the parameters, up to size of them.
+        """
+        indexes, batch = [], []
+        with self._lock:
+            for _ in range(min(size, len(self._buffer))):
+                (index, parameters) = self._buffer.popleft()
+                indexes.append(index)
+                batch.append(parameters)
+            self._taken += len(batch)
+        return (indexes, batch)
+
+    def close(self) -> None:
+        """
+        close Drops the parameters left and refuses new ones.
+        """
+        with self._lock:
+            self._buffer.clear()
+            self._closed = True
+
+
+def read_ndjson(path):
+    """
+    read_ndjson Reads parameters from a file holding one JSON object
+    per line, one line at a time.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+
+    Yields
+    ------
+    dict
+        The parameters of each line.
+    """
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_csv(path, **kwargs):
+    """
+    read_csv Reads parameters from a CSV file with a header row,
+    one row at a time. Values are read as strings.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    **kwargs
+        Passed to csv.DictReader.
+
+    Yields
+    ------
+    dict
+        The parameters of each row, keyed by column name.
+    """
+    with open(path, newline='') as file:
+        yield from csv.DictReader(file, **kwargs)
@@ -0,0 +1,255 @@
+"""Tasks module for the parally package.
+
+The TaskStore keeps track of every batch of a job by task ID: the ones
+waiting to be dispatched, and the ones in flight on a client, so that
+dispatching and completing a batch take constant time.
+"""
+
+import time
+from collections import deque
+from itertools import count
+
+__all__ = ['Task', 'TaskStore']
+
+
+class Task:
+    """
+    A batch of parameters, with their position in the source, the workers
+    running it and when it was dispatched.
+    """
+    __slots__ = ('indexes', 'parameters', 'workers', 'dispatched',
+                 'attempts')
+
+    def __init__(self, indexes, parameters):
+        """
+        __init__ Initialises the Task object.
+
+        Parameters
+        ----------
+        indexes : list
+            The position of each task in the source.
+        parameters : list
+            The parameters of the batch, one dict per task.
+        """
+        self.indexes = indexes
+        self.parameters = parameters
+        self.workers = set()
+        self.dispatched = None
+        self.attempts = 0
+
+
+class TaskStore:
+    """
+    The batches of a job, keyed by task ID. Batches are cut from a
+    ParameterSource when first dispatched; batches sent back to the
+    store are dispatched again before any new one.
+    """
+    def __init__(self, source, task_ids=None):
+        """
+        __init__ Initialises the TaskStore object.
+
+        Parameters
+        ----------
+        source : ParameterSource or ParameterQueue
+            The parameters of the job.
+        task_ids : iterator
+            The task IDs to number the batches with, shared by the jobs
+            of a server so that IDs are unique across them. None to
+            count from 0.
+        """
+        self._source = source
+        self._task_ids = count() if task_ids is None else task_ids
+        self._pending = deque()
+        self._requeued = {}
+        self._requeued_size = 0
+        self._in_flight = {}
+
+    def get_source(self):
+        """
+        get_source Returns the parameters of the job.
+
+        Returns
+        -------
+        ParameterSource
+            The parameters of the job.
+        """
+        return self._source
+
+    def get_in_flight(self) -> dict:
+        """
+        get_in_flight Returns the batches in flight.
+
+        Returns
+        -------
+        dict
+            The task of each batch in flight, keyed by task ID.
+        """
+        return self._in_flight
+
+    def get_task(self, task_id):
+        """
+        get_task Returns a batch in flight.
+
+        Parameters
+        ----------
+        task_id : int
+            The ID of the batch.
+
+        Returns
+        -------
+        Task or None
+            The batch, None if it is not in flight.
+        """
+        return self._in_flight.get(task_id)
+
+    def remaining(self) -> int:
+        """
+        remaining Returns the number of parameters left to dispatch, or
+        a lower bound if the size of the source is unknown.
+
+        Returns
+        -------
+        int
+            The number of parameters left.
+        """
+        return self._requeued_size + self._source.remaining()
+
+    def pending_estimate(self):
+        """
+        pending_estimate Returns the number of parameters left to
+        dispatch without reading the source.
+
+        Returns
+        -------
+        int or None
+            The number of parameters left, None if the size of the
+            source is unknown.
+        """
+        if self._source.get_total() is None:
+            return None
+        return self._requeued_size + self._source.remaining()
+
+    def has_pending(self) -> bool:
+        """
+        has_pending Checks if some parameters are left to dispatch.
+
+        Returns
+        -------
+        bool
+            True if a batch can be dispatched, False otherwise.
+        """
+        return bool(self._pending) or not self._source.empty()
+
+    def is_done(self) -> bool:
+        """
+        is_done Checks if every batch has been dispatched and completed.
+
+        Returns
+        -------
+        bool
+            True if the job is done, False otherwise.
+        """
+        return not self._in_flight and not self.has_pending()
+
+    def dispatch(self, worker, size):
+        """
+        dispatch Marks the next batch as in flight on a worker.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker.
+        size : int
+            Largest number of parameters of a new batch.
+
+        Returns
+        -------
+        (int, Task) or (None, None)
+            The ID and the task of the batch, (None, None) if no
+            parameter is left.
+        """
+        if self._pending:
+            task_id = self._pending.popleft()
+            task = self._requeued.pop(task_id)
+            self._requeued_size -= len(task.parameters)
+        else:
+            (indexes, parameters) = self._source.take_indexed(size)
+            if not parameters:
+                return (None, None)
+            task_id = next(self._task_ids)
+            task = Task(indexes, parameters)
+        task.workers = {worker}
+        task.dispatched = time.monotonic()
+        task.attempts += 1
+        self._in_flight[task_id] = task
+        return (task_id, task)
+
+    def speculate(self, worker):
+        """
+        speculate Marks the longest running batch in flight, not
+        already copied, as also running on a worker.
+
+        Parameters
+        ----------
+        worker : tuple
+            The address of the worker.
+
+        Returns
+        -------
+        (int, Task) or (None, None)
+            The ID and the task of the batch, (None, None) if no batch
+            can be copied to the worker.
+        """
+        for task_id, task in self._in_flight.items():
+            if len(task.workers) == 1 and worker not in task.workers:
+                task.workers.add(worker)
+                return (task_id, task)
+        return (None, None)
+
+    def complete(self, task_id):
+        """
+        complete Removes a batch that has completed.
+
+        Parameters
+        ----------
+        task_id : int
+            The ID of the batch.
+
+        Returns
+        -------
+        Task or None
+            The batch, None if it was not in flight.
+        """
+        return self._in_flight.pop(task_id, None)
+
+    def requeue(self, task_id):
+        """
+        requeue Sends a batch in flight back to be dispatched again
+        before any new one.
+
+        Parameters
+        ----------
+        task_id : int
+            The ID of the batch.
+
+        Returns
+        -------
+        Task or None
+            The batch, None if it was not in flight.
+        """
+        task = self._in_flight.pop(task_id, None)
+        if task is not None:
+            task.workers = set()
+            self._requeued[task_id] = task
+            self._requeued_size += len(task.parameters)
+            self._pending.appendleft(task_id)
+        return task
+
+    def close(self) -> None:
+        """
+        close Drops the parameters left to dispatch.
+        """
+        self._pending.clear()
+        self._requeued.clear()
+        self._requeued_size = 0
+        self._source.close()
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from parally import AsyncServer, AsyncClient
+from test_server import free_port
+
+
+async def double(params):
+    await asyncio.sleep(0)
+    return params['a'] * 2
+
+
+class TestAsync:
+
+    def test_submit_and_results(self):
+        async def main():
+            port = free_port()
+            server = AsyncServer('localhost', port)
+            await server.start()
+            clients = []
+            for _ in range(3):
+                client = AsyncClient('localhost', port)
+                client.run_function(double)
+                clients.append(asyncio.create_task(client.start()))
+            futures = [await server.submit({"a": i}) for i in range(10)]
+            results = [result async for result in server.results()]
+            await server.stop()
+            await asyncio.gather(*clients, return_exceptions=True)
+            return futures, results
+
+        futures, results = asyncio.run(main())
+        assert [future.result() for future in futures] == \
+            [2 * i for i in range(10)]
+        assert sorted(r['output'] for r in results) == \
+            [2 * i for i in range(10)]
+
+    def test_stop_with_pending(self):
+        async def main():
+            port = free_port()
+            server = AsyncServer('localhost', port)
+            await server.start()
+            futures = [await server.submit({"a": i}) for i in range(3)]
+            await server.stop()
+            results = [result async for result in server.results()]
+            return futures, results
+
+        futures, results = asyncio.run(main())
+        assert results == []
+        for future in futures:
+            with pytest.raises(RuntimeError, match="Server stopped."):
+                future.result()
+
+    def test_unsendable_parameters(self):
+        async def main():
+            port = free_port()
+            server = AsyncServer('localhost', port)
+            await server.start()
+            client = AsyncClient('localhost', port)
+            client.run_function(double)
+            task = asyncio.create_task(client.start())
+            bad = await server.submit({"a": object()})
+            good = await server.submit({"a": 2})
+            results = [result async for result in server.results()]
+            await server.stop()
+            await asyncio.gather(task, return_exceptions=True)
+            return bad, good, results
+
+        bad, good, results = asyncio.run(main())
+        with pytest.raises(RuntimeError, match="Cannot send parameters"):
+            bad.result()
+        assert good.result() == 4
+        assert [r['output'] for r in results] == [4]
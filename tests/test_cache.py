@@ -0,0 +1,35 @@
+import numpy as np
+from parally import ResultCache
+
+
+class TestCache:
+
+    def test_round_trip(self, tmp_path):
+        cache = ResultCache(str(tmp_path / "cache.db"), version='1')
+        cache.put({"a": 1, "b": [1, 2]}, {"sum": 4})
+        assert cache.get({"b": [1, 2], "a": 1}) == (True, {"sum": 4})
+        assert cache.get({"a": 2}) == (False, None)
+        assert cache.get_stats()['hits'] == 1
+        cache.close()
+        assert ResultCache(str(tmp_path / "cache.db"), version='1').get(
+            {"a": 1, "b": [1, 2]}) == (True, {"sum": 4})
+        assert ResultCache(str(tmp_path / "cache.db"), version='2').get(
+            {"a": 1, "b": [1, 2]}) == (False, None)
+
+    def test_arrays(self, tmp_path):
+        cache = ResultCache(str(tmp_path / "cache.db"))
+        cache.put({"x": np.arange(4)}, np.ones(2))
+        (found, output) = cache.get({"x": np.arange(4)})
+        assert found and np.array_equal(output, np.ones(2))
+        assert not cache.get({"x": np.arange(5)})[0]
+        assert cache.key({"x": object()}) is None
+
+    def test_lru_eviction(self, tmp_path):
+        cache = ResultCache(str(tmp_path / "cache.db"), max_size=3000)
+        for i in range(3):
+            cache.put({"a": i}, "x" * 900)
+        assert cache.get({"a": 0})[0]
+        cache.put({"a": 3}, "x" * 900)
+        assert cache.get_stats()['size'] <= 3000
+        assert [cache.get({"a": i})[0] for i in range(4)] == \
+            [True, False, True, True]
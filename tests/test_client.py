@@ -0,0 +1,36 @@
+import pytest
+
+from parally.client import run_batch
+from test_server import run_server
+
+
+def square(params):
+    if params['x'] < 0:
+        raise ValueError("negative")
+    return params['x'] ** 2
+
+
+class TestClient:
+
+    def test_run_batch(self):
+        assert run_batch(square, [{'x': 2}, {'x': -1}]) == \
+            [{'data': 4}, {'error': 'negative'}]
+        assert run_batch(lambda params: 1 / params, [0, 2]) == \
+            [{'error': 'division by zero'}, {'data': 0.5}]
+
+    def test_any_exception(self):
+        results, errors = run_server(
+            [{'x': i} for i in range(10)], lambda params: 6 // params['x'],
+            clients=1)
+        assert errors == ['integer division or modulo by zero']
+        assert sorted(r['output'] for r in results) == \
+            sorted(6 // i for i in range(1, 10))
+
+    @pytest.mark.parametrize('threads', [True, False])
+    def test_pool(self, threads):
+        results, errors = run_server(
+            [{'x': i} for i in range(40)], square, clients=1, chunksize=3,
+            client_kwargs={'processes': 4, 'threads': threads})
+        assert errors == []
+        assert sorted(r['output'] for r in results) == \
+            [i ** 2 for i in range(40)]
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+import parally
+from parally import ParallyExecutor
+from test_server import free_port, start_clients
+
+
+def power(base, exponent=2):
+    if base < 0:
+        raise ValueError("negative")
+    return base ** exponent
+
+
+def slow(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def divide(a, b):
+    return a / b
+
+
+class TestExecutor:
+
+    def test_submit_and_map(self):
+        port = free_port()
+        with ParallyExecutor('localhost', port) as executor:
+            threads = start_clients(port, None)
+            assert executor.submit(power, 3, exponent=3).result() == 27
+            assert list(executor.map(power, range(10), [3] * 10,
+                                     chunksize=4)) == \
+                [i ** 3 for i in range(10)]
+            with pytest.raises(ValueError, match="negative"):
+                executor.submit(power, -1).result()
+        assert not executor.get_server().running
+        with pytest.raises(RuntimeError):
+            executor.submit(power, 2)
+        for thread in threads:
+            thread.join(timeout=10)
+
+    def test_shutdown_waits(self):
+        port = free_port()
+        executor = ParallyExecutor('localhost', port)
+        futures = [executor.submit(lambda x: x + 1, i) for i in range(20)]
+        threads = start_clients(port, None, count=1)
+        executor.shutdown(wait=True)
+        assert [f.result() for f in futures] == list(range(1, 21))
+        for thread in threads:
+            thread.join(timeout=10)
+
+    def test_cancel_futures(self):
+        port = free_port()
+        executor = ParallyExecutor('localhost', port, prefetch=1)
+        threads = start_clients(port, None, count=1)
+        first = executor.submit(slow, 0.2)
+        while not first.running():
+            time.sleep(0.01)
+        pending = [executor.submit(slow, 0.2) for _ in range(3)]
+        executor.shutdown(wait=True, cancel_futures=True)
+        assert first.result() == 0.2
+        assert all(future.cancelled() for future in pending)
+        assert not executor.get_server().running
+        for thread in threads:
+            thread.join(timeout=10)
+
+    @pytest.mark.parametrize('processes', [1, 2])
+    def test_exception(self, processes):
+        port = free_port()
+        with ParallyExecutor('localhost', port) as executor:
+            threads = start_clients(port, None, processes=processes)
+            with pytest.raises(ZeroDivisionError):
+                executor.submit(divide, 1, 0).result(timeout=10)
+            with pytest.raises(ZeroDivisionError):
+                list(executor.map(divide, [1, 2], [1, 0], timeout=10))
+            assert executor.submit(divide, 1, 2).result(timeout=10) == 0.5
+        for thread in threads:
+            thread.join(timeout=10)
@@ -0,0 +1,54 @@
+import pickle
+
+import pytest
+import parally.functions
+from parally.functions import ShippedFunction, load_function, pack_function
+
+OFFSET = 10
+
+
+def shifted(params):
+    return params['a'] + OFFSET
+
+
+class TestFunctions:
+    def test_source(self, tmp_path):
+        spec = pack_function(shifted)
+        assert spec['kind'] == 'source'
+        function = load_function(spec, str(tmp_path))
+        assert function({'a': 1}) == 11
+        assert len(list(tmp_path.glob(spec['hash'] + '.*.pyc'))) == 1
+
+    def test_code(self):
+        def scale(params, factor=3):
+            import math
+            return math.floor(params['a'] * factor)
+
+        spec = pack_function(scale)
+        assert spec['kind'] == 'code'
+        assert load_function(spec, None)({'a': 2}) == 6
+
+    def test_cached(self, tmp_path):
+        spec = pack_function(shifted)
+        first = load_function(spec, str(tmp_path)).load()
+        assert load_function(dict(spec), str(tmp_path)).load() is first
+
+    def test_pickle(self):
+        function = load_function(pack_function(lambda params: params * 2))
+        copy = pickle.loads(pickle.dumps(function))
+        assert isinstance(copy, ShippedFunction)
+        assert copy(4) == 8
+
+    def test_invalid(self):
+        def closure(params):
+            return params + OFFSET + factor
+
+        factor = 2
+        with pytest.raises(ValueError):
+            pack_function(closure)
+        with pytest.raises(TypeError):
+            pack_function(len)
+        spec = pack_function(lambda params: params)
+        spec['python'] = 'cpython-2.7'
+        with pytest.raises(ValueError):
+            load_function(spec)
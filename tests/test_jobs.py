@@ -0,0 +1,61 @@
+from concurrent.futures import wait
+
+import pytest
+from parally import ParameterQueue, ParameterSource
+from parally.jobs import Job
+from parally.scheduling import get_scheduler
+from parally.tasks import TaskStore
+
+
+def make_job(source, **kwargs):
+    return Job(TaskStore(source), get_scheduler('fixed'), 1, **kwargs)
+
+
+class TestJobs:
+
+    def test_ordered_results(self):
+        job = make_job(ParameterSource(range(4)), ordered=True)
+        for index in (2, 0, 3, 1):
+            job.set_result(index, index * 10)
+        job.close()
+        assert list(job.results()) == [0, 10, 20, 30]
+
+    def test_error_stops_results(self):
+        job = make_job(ParameterSource(range(3)), ordered=True)
+        job.set_result(0, 'a')
+        job.set_error(1, "failed")
+        job.set_result(2, 'c')
+        job.close()
+        results = job.results()
+        assert next(results) == 'a'
+        with pytest.raises(RuntimeError, match="failed"):
+            next(results)
+
+    def test_futures(self):
+        job = make_job(ParameterQueue(), open=True)
+        first, second, third = (job.submit({"a": i}) for i in range(3))
+        assert job.tasks.remaining() == 3 and not job.is_done()
+        job.set_result(0, 1)
+        job.set_error(1, "failed")
+        job.close("Server stopped.")
+        assert first.result() == 1
+        assert str(second.exception()) == "failed"
+        assert str(third.exception()) == "Server stopped."
+
+    def test_cancel(self):
+        job = make_job(ParameterQueue(), open=True)
+        futures = [job.submit({"a": i}) for i in range(3)]
+        assert futures[1].cancel()
+        (task_id, task) = job.tasks.dispatch('worker', 3)
+        assert job.start(task)
+        assert task.indexes == [0, 2]
+        assert task.parameters == [{"a": 0}, {"a": 2}]
+        assert not futures[0].cancel()
+        assert wait(futures, timeout=0).done == {futures[1]}
+        assert futures[2].cancel() is False
+        job.set_result(2, 20)
+        assert futures[2].result() == 20
+        cancelled = job.submit({"a": 3})
+        cancelled.cancel()
+        job.close("Server stopped.")
+        assert wait([cancelled], timeout=0).done == {cancelled}
@@ -0,0 +1,50 @@
+import pickle
+
+import pytest
+from parally.journal import RECORD, Journal
+
+
+def framed(payload):
+    return RECORD.pack(len(payload)) + payload
+
+
+class TestJournal:
+
+    def test_append_and_load(self, tmp_path):
+        path = str(tmp_path / "job.journal")
+        journal = Journal(path, sync_every=2)
+        for i in range(3):
+            journal.append(i, {"input": {"a": i}, "output": i * 2})
+        journal.close()
+        assert Journal(path).load() == {
+            i: {"input": {"a": i}, "output": i * 2} for i in range(3)}
+
+    def test_truncated_record(self, tmp_path):
+        path = tmp_path / "job.journal"
+        journal = Journal(str(path))
+        journal.append(0, {"input": {"a": 0}, "output": 0})
+        journal.append(1, {"input": {"a": 1}, "output": 1})
+        journal.close()
+        path.write_bytes(path.read_bytes()[:-3])
+        journal = Journal(str(path))
+        assert list(journal.load()) == [0]
+        journal.append(2, {"input": {"a": 2}, "output": 2})
+        journal.close()
+        assert list(Journal(str(path)).load()) == [0, 2]
+
+    @pytest.mark.parametrize('tail', [
+        RECORD.pack(20)[:2],
+        RECORD.pack(12) + b"\x80\x05\x95" + b"\0" * 9,
+        framed(pickle.dumps((1, Journal)).replace(b"Journal", b"Missing")),
+        framed(pickle.dumps((1, Journal)).replace(b"parally", b"missing")),
+        RECORD.pack(5) + b"hello"])
+    def test_corrupt_tail(self, tmp_path, tail):
+        path = tmp_path / "job.journal"
+        journal = Journal(str(path))
+        journal.append(0, {"input": {"a": 0}, "output": 0})
+        journal.close()
+        size = path.stat().st_size
+        with open(path, 'ab') as file:
+            file.write(tail)
+        assert list(Journal(str(path)).load()) == [0]
+        assert path.stat().st_size == size
@@ -0,0 +1,64 @@
+import math
+
+from parally.metrics import Histogram, Metrics, to_prometheus
+
+
+class TestMetrics:
+
+    def test_histogram(self):
+        histogram = Histogram((1.0, 5.0))
+        histogram.observe(0.5)
+        histogram.observe(1.0, count=2)
+        histogram.observe(7.0)
+        assert histogram.to_dict() == {
+            "buckets": {1.0: 3, 5.0: 3, math.inf: 4},
+            "sum": 9.5, "count": 4}
+
+    def test_quantile(self):
+        histogram = Histogram((1.0, 2.0))
+        assert math.isnan(histogram.quantile(0.5))
+        histogram.observe(0.5, count=2)
+        histogram.observe(1.5, count=2)
+        assert histogram.quantile(0.5) == 1.0
+        assert histogram.quantile(0.75) == 1.5
+        histogram.observe(10.0)
+        assert histogram.quantile(1.0) == 2.0
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        stats = metrics.add_worker(('127.0.0.1', 4000))
+        stats.bytes_sent = 10
+        metrics.counters['succeeded'] = 3
+        metrics.latency.observe(0.2, count=3)
+        text = to_prometheus(metrics.to_dict(pending=5, in_flight=2))
+        lines = text.splitlines()
+        assert "parally_tasks_pending 5" in lines
+        assert "parally_tasks_succeeded_total 3" in lines
+        assert "parally_bytes_sent_total 10" in lines
+        assert 'parally_task_latency_seconds_bucket{le="0.25"} 3' in lines
+        assert 'parally_task_latency_seconds_bucket{le="+Inf"} 3' in lines
+        assert "# TYPE parally_worker_busy_ratio gauge" in lines
+        assert any(line.startswith(
+            'parally_worker_busy_ratio{worker="127.0.0.1:4000"}')
+            for line in lines)
+        metrics.remove_worker(('127.0.0.1', 4000))
+        assert metrics.to_dict()['bytes_sent'] == 10
+
+    def test_prometheus_families(self):
+        metrics = Metrics()
+        for port in (4000, 4001, 4002):
+            metrics.add_worker(('127.0.0.1', port))
+        text = to_prometheus(metrics.to_dict(pending=0, in_flight=0))
+        families, current = [], None
+        for line in text.splitlines():
+            if line.startswith("# HELP "):
+                continue
+            if line.startswith("# TYPE "):
+                current = line.split()[2]
+                families.append(current)
+                continue
+            name = line.split('{')[0].split()[0]
+            assert name == current or name in (
+                current + "_bucket", current + "_sum", current + "_count")
+        assert len(families) == len(set(families))
+        assert text.count('parally_worker_busy_ratio{') == 3
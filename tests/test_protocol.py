@@ -0,0 +1,93 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+import parally.protocol
+from parally.protocol import FrameBuffer
+
+
+class TestProtocol:
+
+    def test_coalesced_messages(self):
+        left, right = socket.socketpair()
+        parally.protocol.send_message(left, {'action': 'ready'})
+        parally.protocol.send_message(left, {'action': 'result', 'data': 3})
+        buffer = FrameBuffer()
+        first = parally.protocol.recv_message(right, buffer)
+        assert buffer.buffered()
+        second = parally.protocol.recv_message(right, buffer)
+        assert not buffer.buffered()
+        assert first == {'action': 'ready'}
+        assert second == {'action': 'result', 'data': 3}
+        left.close()
+        assert parally.protocol.recv_message(right, buffer) is None
+        right.close()
+
+    def test_large_frame(self):
+        left, right = socket.socketpair()
+        payload = bytes(range(256)) * (4 * 1024 * 16)
+        sender = threading.Thread(
+            target=parally.protocol.send_frame, args=(left, [payload]))
+        sender.start()
+        frame = parally.protocol.recv_frame(right, FrameBuffer(size=1024))
+        sender.join()
+        assert frame == payload
+        left.close()
+        right.close()
+
+    def test_split_header(self):
+        left, right = socket.socketpair()
+        data = parally.protocol.HEADER.pack(0, 5) + b'hello'
+        buffer = FrameBuffer(size=16)
+        for byte in data[:-1]:
+            left.send(bytes([byte]))
+            buffer.recv_from(right)
+            assert buffer.next_frame() is None
+        left.send(data[-1:])
+        buffer.recv_from(right)
+        assert list(buffer.frames()) == [b'hello']
+        left.close()
+        right.close()
+
+    def test_arrays_out_of_band(self):
+        arrays = {
+            'matrix': np.arange(12, dtype=np.float32).reshape(3, 4),
+            'fortran': np.asfortranarray(np.ones((2, 3), dtype=np.int16)),
+            'records': np.zeros(2, dtype=[('a', '<i4'), ('b', '<f8', 2)]),
+            'scalar': np.float64(1.5),
+        }
+        segments = parally.protocol.encode_message(arrays)
+        assert len(segments) > 2
+        payload = bytearray(b''.join(memoryview(s).cast('B')
+                                     for s in segments))
+        decoded = parally.protocol.decode_message(payload)
+        for key in ('matrix', 'fortran', 'records'):
+            assert decoded[key].dtype == arrays[key].dtype
+            assert np.array_equal(decoded[key], arrays[key])
+        assert decoded['scalar'] == 1.5
+        assert np.shares_memory(decoded['matrix'],
+                                np.frombuffer(payload, dtype=np.uint8))
+
+    def test_compression(self):
+        left, right = socket.socketpair()
+        compression = parally.protocol.Compression('zlib', threshold=1024)
+        big = {'blob': 'x' * 100000}
+        for message in ({'action': 'ready'}, big):
+            segments = parally.protocol.frame_segments(
+                parally.protocol.encode_message(message), compression)
+            if message is big:
+                assert sum(len(s) for s in segments) < 10000
+            parally.protocol.send_message(left, message,
+                                          compression=compression)
+        buffer = FrameBuffer(size=1024)
+        assert parally.protocol.recv_message(right, buffer) == \
+            {'action': 'ready'}
+        assert parally.protocol.recv_message(right, buffer) == big
+        left.close()
+        right.close()
+
+    def test_corrupt_compression(self):
+        for codec in (1, 2, 9):
+            with pytest.raises(ValueError):
+                parally.protocol.decompress(codec, b'junk!')
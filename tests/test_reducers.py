@@ -0,0 +1,88 @@
+import math
+
+import pytest
+from parally.reducers import Count, Fold, Histogram, Max, Mean, Min, Sum, \
+    Top, get_reducer
+
+
+def reduce(reducer, outputs):
+    state = reducer.initial()
+    for output in outputs:
+        state = reducer.add(state, output)
+    return state
+
+
+class TestReducers:
+    @pytest.mark.parametrize('reducer, expected', [
+        (Sum(), 45), (Count(), 10), (Min(), 0), (Max(), 9),
+        (Top(3), [9, 8, 7]), (Top(2, largest=False), [0, 1]),
+        (Fold(lambda total, output: total * 2 + output, 0), 1013),
+        (Histogram([2, 5]), {"bounds": [2, 5], "counts": [3, 3, 4]})])
+    def test_reduce(self, reducer, expected):
+        assert reducer.result(reduce(reducer, range(10))) == expected
+
+    @pytest.mark.parametrize('reducer', [
+        Sum(), Count(), Min(), Max(), Mean(), Top(4, key=lambda x: -x),
+        Histogram([3, 12]),
+        Fold(lambda a, b: a + b * b, 0, lambda a, b: a + b)])
+    def test_merge(self, reducer):
+        outputs = [7, 3, 18, 4, 11, 0, 9, 5, 14]
+        expected = reducer.result(reduce(reducer, outputs))
+        for split in range(len(outputs) + 1):
+            merged = reducer.merge(reduce(reducer, outputs[:split]),
+                                   reduce(reducer, outputs[split:]))
+            result = reducer.result(merged)
+            if isinstance(reducer, Mean):
+                assert result['count'] == expected['count']
+                assert result['mean'] == pytest.approx(expected['mean'])
+                assert result['variance'] == \
+                    pytest.approx(expected['variance'])
+            else:
+                assert result == expected
+
+    def test_mean(self):
+        result = Mean().result(reduce(Mean(), [2, 4, 4, 4, 5, 5, 7, 9]))
+        assert result == {"count": 8, "mean": 5.0, "variance": 4.0}
+        assert math.isnan(Mean().result(Mean().initial())['mean'])
+
+    @pytest.mark.parametrize('reducer', [
+        Sum(), Mean(), Histogram([1, 4]), Top(2, key=lambda x: x % 5),
+        Fold(lambda best, output: max(best, output), -1,
+             lambda best, other: max(best, other))])
+    def test_to_dict(self, reducer):
+        copy = get_reducer(reducer.to_dict())
+        assert type(copy) is type(reducer)
+        assert copy.result(reduce(copy, range(8))) == \
+            reducer.result(reduce(reducer, range(8)))
+
+    def test_mutable_initial(self):
+        fold = Fold(lambda acc, output: acc.append(output) or acc, [],
+                    lambda acc, other: acc.extend(other) or acc)
+        states = [reduce(fold, range(i, i + 2)) for i in range(0, 6, 2)]
+        merged = fold.initial()
+        for state in states:
+            merged = fold.merge(merged, state)
+        assert sorted(fold.result(merged)) == list(range(6))
+        assert fold.initial() == []
+
+    def test_unrankable(self):
+        top = Top(2)
+        state = reduce(top, [3, 1])
+        with pytest.raises(TypeError):
+            top.add(state, None)
+        assert top.result(top.add(state, 2)) == [3, 2]
+
+    def test_get_reducer(self):
+        assert isinstance(get_reducer('sum'), Sum)
+        top = Top(5)
+        assert get_reducer(top) is top
+        with pytest.raises(ValueError):
+            get_reducer('median')
+        with pytest.raises(ValueError):
+            Top(0)
+        with pytest.raises(TypeError):
+            Fold(None)
+        fold = Fold(lambda a, b: a + b, 0)
+        assert fold.to_dict() is None
+        with pytest.raises(ValueError):
+            fold.merge(1, 2)
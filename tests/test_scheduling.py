@@ -0,0 +1,52 @@
+from collections import deque
+
+import pytest
+from parally import GuidedScheduler, LeastLoadedScheduler, \
+    ThroughputScheduler, get_scheduler
+
+
+class TestScheduling:
+
+    def test_guided(self):
+        scheduler = GuidedScheduler(chunksize=2)
+        scheduler.add_worker('a', 2)
+        scheduler.add_worker('b', 2)
+        assert scheduler.chunk_size('a', 100) == 25
+        assert scheduler.chunk_size('a', 5) == 2
+
+    def test_throughput(self):
+        scheduler = ThroughputScheduler()
+        scheduler.add_worker('fast', 1)
+        scheduler.add_worker('slow', 1)
+        assert scheduler.chunk_size('fast', 100) == \
+            scheduler.chunk_size('slow', 100)
+        scheduler._throughput = {'fast': 30.0, 'slow': 10.0}
+        assert scheduler.chunk_size('fast', 100) == 38
+        assert scheduler.chunk_size('slow', 100) == 13
+
+    def test_throughput_measured(self, monkeypatch):
+        scheduler = ThroughputScheduler(alpha=0.5)
+        scheduler.add_worker('a', 1)
+        now = [10.0]
+        monkeypatch.setattr('time.monotonic', lambda: now[0])
+        scheduler.dispatched('a', 10)
+        scheduler.dispatched('a', 10)
+        now[0] = 12.0
+        scheduler.completed('a', 10, 10.0)
+        now[0] = 13.0
+        scheduler.completed('a', 10, 10.0)
+        assert scheduler.get_throughput() == {'a': 7.5}
+
+    def test_least_loaded(self):
+        scheduler = LeastLoadedScheduler(chunksize=3)
+        scheduler.add_worker('busy', 1)
+        scheduler.add_worker('free', 1)
+        scheduler.dispatched('busy', 3)
+        idle = deque(['busy', 'free'])
+        assert scheduler.pick(idle) == 'free'
+        assert idle == deque(['busy'])
+        assert scheduler.chunk_size('busy', 100) == 3
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            get_scheduler('random')
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from parally.protocol import encode_message, decode_message
+from parally.serializers import SERIALIZERS, get_serializer
+from test_server import run_server
+
+
+def round_trip(message, serializer):
+    segments = encode_message(message, serializer)
+    payload = bytearray(b''.join(memoryview(s).cast('B') for s in segments))
+    return decode_message(payload, serializer)
+
+
+class TestSerializers:
+
+    @pytest.mark.parametrize('name', list(SERIALIZERS))
+    def test_round_trip(self, name):
+        try:
+            serializer = get_serializer(name)
+        except ValueError:
+            pytest.skip("{} is not installed".format(name))
+        message = {'action': 'run', 'id': 3,
+                   'batch': [{'a': 1, 'b': [1.5, None, True, 'x']}]}
+        assert round_trip(message, serializer) == message
+
+    @pytest.mark.parametrize('name', list(SERIALIZERS))
+    def test_corrupt(self, name):
+        try:
+            serializer = get_serializer(name)
+        except ValueError:
+            pytest.skip("{} is not installed".format(name))
+        payloads = [bytearray(b''.join(memoryview(s).cast('B') for s in
+                                       encode_message(message, serializer)))
+                    for message in ({'action': 'ready'}, [1])]
+        for corrupt in (payloads[0][:-2] + b'\xc1\xff', payloads[0][:6],
+                        payloads[1]):
+            with pytest.raises(ValueError):
+                decode_message(corrupt, serializer)
+
+    @pytest.mark.parametrize('name', ['json', 'pickle'])
+    def test_arrays(self, name):
+        array = np.arange(10000, dtype=np.float64).reshape(100, 100)
+        decoded = round_trip({'data': array}, get_serializer(name))
+        assert np.array_equal(decoded['data'], array)
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            get_serializer('yaml')
+
+    def test_handshake(self):
+        results, errors = run_server(
+            [{"x": np.arange(5) * i} for i in range(10)],
+            lambda p: p['x'].sum(), server_kwargs={'serializer': 'pickle'})
+        assert errors == []
+        assert sorted(r['output'] for r in results) == \
+            [10 * i for i in range(10)]
@@ -1,5 +1,57 @@
+import selectors
+import socket
+import threading
+import urllib.request
+
 import pytest
+import parally
+import parally.journal
+import parally.protocol
+import parally.serializers
 import parally.server
+from parally import Client
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def start_clients(port, function, count=2, **kwargs):
+    threads = []
+    for _ in range(count):
+        client = Client('localhost', port, **kwargs)
+        client.run_function(function)
+        thread = threading.Thread(target=client.start, daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def take_batch(port):
+    sock = socket.create_connection(('localhost', port))
+    buffer = parally.protocol.FrameBuffer()
+    parally.protocol.recv_message(sock, buffer)
+    parally.protocol.send_message(sock, {'action': 'ready'})
+    return sock, parally.protocol.recv_message(sock, buffer)
+
+
+def run_server(parameters, function, clients=3, client_kwargs={},
+               server_kwargs={}, **kwargs):
+    port = free_port()
+    results, errors = [], []
+    server = parally.server.Server('localhost', port, **server_kwargs)
+    server.bind_parameters(parameters, **kwargs)
+    server.on_completed(results.extend)
+    server.on_error(errors.append)
+    server.start()
+    threads = start_clients(port, function, count=clients, **client_kwargs)
+    server._process.join(timeout=10)
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not server.running
+    return results, errors
 
 
 class TestServer:
@@ -9,3 +61,566 @@ class TestServer:
         assert server.host == 'localhost'
         assert server.port == 5000
         assert server._workers == {}
+
+    def test_accept_error(self):
+        class Aborting:
+            def accept(self):
+                raise ConnectionAbortedError("reset by peer")
+
+        server = parally.server.Server('localhost', free_port())
+        server._sock = Aborting()
+        assert server._accept() == (None, None)
+        assert server.get_logs()[-1] == {
+            "timestamp": server.get_logs()[-1]['timestamp'],
+            "type": "warning",
+            "message": "Cannot accept a connection: reset by peer"}
+
+    def test_remove_worker_twice(self):
+        server = parally.server.Server('localhost', free_port())
+        server._selector = selectors.DefaultSelector()
+        (ours, theirs) = socket.socketpair()
+        worker = parally.server.Worker(
+            ours, ('localhost', 1), parally.serializers.get_serializer('json'))
+        server._workers[worker.get_address()] = worker
+        server._selector.register(ours, selectors.EVENT_READ, worker)
+        server._remove_worker(worker)
+        server._remove_worker(worker)
+        server._handle(worker, selectors.EVENT_READ | selectors.EVENT_WRITE)
+        assert server._workers == {}
+        assert server._selector.get_map() == {}
+        server._selector.close()
+        theirs.close()
+
+    def test_run_to_completion(self):
+        results, errors = run_server([{"a": i, "b": i} for i in range(20)],
+                                     lambda p: p['a'] + p['b'])
+        assert errors == []
+        assert sorted(r['output'] for r in results) == \
+            [2 * i for i in range(20)]
+
+    @pytest.mark.parametrize('chunksize', [4, 'auto'])
+    def test_chunksize(self, chunksize):
+        def half(params):
+            if params['a'] % 2:
+                raise ValueError("odd")
+            return params['a'] // 2
+
+        results, errors = run_server([{"a": i} for i in range(50)], half,
+                                     chunksize=chunksize)
+        assert errors == ["odd"] * 25
+        assert sorted(r['output'] for r in results) == list(range(25))
+
+    @pytest.mark.parametrize('scheduler', ['guided', 'throughput',
+                                           'least-loaded'])
+    def test_schedulers(self, scheduler):
+        results, errors = run_server([{"a": i} for i in range(200)],
+                                     lambda p: p['a'], scheduler=scheduler)
+        assert errors == []
+        assert sorted(r['output'] for r in results) == list(range(200))
+
+    def test_prefetch_out_of_order(self):
+        port = free_port()
+        results = []
+        server = parally.server.Server('localhost', port, prefetch=2)
+        server.bind_parameters([{"a": 1}, {"a": 2}])
+        server.on_completed(results.extend)
+        server.on_error(results.append)
+        server.start()
+        with socket.create_connection(('localhost', port)) as sock:
+            buffer = parally.protocol.FrameBuffer()
+            hello = parally.protocol.recv_message(sock, buffer)
+            assert hello['serializer'] == 'json'
+            parally.protocol.send_message(sock, {'action': 'ready'})
+            first = parally.protocol.recv_message(sock, buffer)
+            second = parally.protocol.recv_message(sock, buffer)
+            for message in (second, first):
+                parally.protocol.send_message(sock, {
+                    'action': 'result',
+                    'id': message['id'],
+                    'batch': [{'data': message['batch'][0]['a'] * 10}]
+                })
+            server._process.join(timeout=10)
+        assert results == [{"input": {"a": 2}, "output": 20},
+                           {"input": {"a": 1}, "output": 10}]
+
+    def test_numpy_payloads(self):
+        np = pytest.importorskip('numpy')
+        parameters = [{"x": np.full(100000, i, dtype=np.int64)}
+                      for i in range(4)]
+        results, errors = run_server(parameters, lambda p: p['x'] * 2)
+        assert errors == []
+        assert sorted(int(r['output'].sum()) for r in results) == \
+            [200000 * i for i in range(4)]
+
+    @pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+    def test_compression(self, codec):
+        compression = parally.protocol.Compression(codec, threshold=100)
+        results, errors = run_server(
+            [{"text": "ab" * 1000 * i} for i in range(5)],
+            lambda p: p['text'].upper(),
+            server_kwargs={'compression': compression})
+        assert errors == []
+        assert sorted(len(r['output']) for r in results) == \
+            [2000 * i for i in range(5)]
+
+    @pytest.mark.parametrize('serializer, codec', [
+        ('json', 1), ('json', 2), ('pickle', 0), ('marshal', 0)])
+    def test_corrupt_frame(self, serializer, codec):
+        port = free_port()
+        results, errors = [], []
+        server = parally.server.Server('localhost', port,
+                                       serializer=serializer)
+        server.bind_parameters([{"a": i} for i in range(10)])
+        server.on_completed(results.extend)
+        server.on_error(errors.append)
+        server.start()
+        with socket.create_connection(('localhost', port)) as sock:
+            parally.protocol.recv_message(sock,
+                                          parally.protocol.FrameBuffer())
+            sock.sendall(parally.protocol.HEADER.pack(codec, 5) + b'junk!')
+            assert sock.recv(1024) == b''
+        threads = start_clients(port, lambda p: p['a'])
+        server.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert errors == []
+        assert sorted(r['output'] for r in results) == list(range(10))
+
+    def test_streaming_results(self):
+        port = free_port()
+        streamed, completed = [], []
+        server = parally.server.Server('localhost', port, keep_results=False)
+        server.bind_parameters([{"a": i} for i in range(30)], chunksize=4)
+        server.on_result(streamed.append)
+        server.on_completed(completed.extend)
+        server.on_error(completed.append)
+        results = server.results()
+        server.start()
+        threads = start_clients(port, lambda p: p['a'] * 2)
+        iterated = [r['output'] for r in results]
+        server._process.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert sorted(iterated) == [2 * i for i in range(30)]
+        assert sorted(r['output'] for r in streamed) == sorted(iterated)
+        assert completed == []
+        assert list(server.results()) == []
+
+    def test_raising_callbacks(self):
+        port = free_port()
+        errors, completed = [], []
+
+        def on_result(result):
+            if result['output'] % 3 == 0:
+                raise RuntimeError("bad result callback")
+
+        def on_error(error):
+            errors.append(error)
+            raise RuntimeError("bad error callback")
+
+        server = parally.server.Server('localhost', port, keep_results=False)
+        server.bind_parameters([{"a": i} for i in range(12)], chunksize=2)
+        server.on_result(on_result)
+        server.on_completed(completed.extend)
+        server.on_error(on_error)
+        results = server.results()
+        server.start()
+        threads = start_clients(port, lambda p: p['a'])
+        iterated = [r['output'] for r in results]
+        server.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert not server.running
+        assert sorted(iterated) == list(range(12))
+        assert errors == ["Result callback failed: bad result callback"] * 4
+        assert any(log['message'] == "Error callback failed: bad error "
+                   "callback" for log in server._logs.get_logs())
+
+    def test_generator_parameters(self):
+        parameters = parally.ParameterSource(
+            ({"a": i, "b": 1} for i in range(40)), read_ahead=4)
+        results, errors = run_server(parameters, lambda p: p['a'] + p['b'],
+                                     chunksize='auto')
+        assert errors == []
+        assert sorted(r['output'] for r in results) == \
+            [i + 1 for i in range(40)]
+
+    def test_bad_parameters(self, tmp_path):
+        ndjson = tmp_path / "parameters.ndjson"
+        ndjson.write_text("".join('{"a": %d}\n' % i for i in range(5))
+                          + '{"a": \n{"a": 6}\n')
+        results, errors = run_server(parally.read_ndjson(ndjson),
+                                     lambda p: p['a'])
+        assert len(errors) == 1
+        assert errors[0].startswith("Cannot read parameters:")
+        assert sorted(r['output'] for r in results) == list(range(5))
+
+    def test_bad_job_parameters(self):
+        def parameters():
+            yield 1
+            raise OSError("disk lost")
+
+        port = free_port()
+        server = parally.server.Server('localhost', port)
+        server.start()
+        threads = start_clients(port, None, count=1)
+        with pytest.raises(RuntimeError, match="disk lost"):
+            list(server.map(lambda p: p, parameters()))
+        assert server.submit(lambda p: p + 1, 1).result(timeout=10) == 2
+        server.stop()
+        server.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+
+    def test_duplicate_parameters(self):
+        results, errors = run_server([{"a": 1}] * 30, lambda p: p['a'])
+        assert errors == []
+        assert [r['output'] for r in results] == [1] * 30
+
+    @pytest.mark.parametrize('failure', ['disconnect', 'timeout', 'silent'])
+    def test_requeue(self, failure):
+        port = free_port()
+        results, errors = [], []
+        server = parally.server.Server(
+            'localhost', port, prefetch=1,
+            heartbeat=0.1 if failure == 'silent' else None,
+            timeout=0.3 if failure == 'timeout' else None)
+        server.bind_parameters([{"a": i} for i in range(10)])
+        server.on_completed(results.extend)
+        server.on_error(errors.append)
+        server.start()
+        sock, message = take_batch(port)
+        if failure == 'disconnect':
+            sock.close()
+        threads = start_clients(port, lambda p: p['a'], count=1)
+        server._process.join(timeout=10)
+        sock.close()
+        threads[0].join(timeout=10)
+        assert errors == []
+        assert sorted(r['output'] for r in results) == list(range(10))
+
+    def test_retries_exhausted(self):
+        port = free_port()
+        results, errors = [], []
+        server = parally.server.Server('localhost', port, retries=0)
+        server.bind_parameters([{"a": 1}])
+        server.on_completed(results.extend)
+        server.on_error(errors.append)
+        server.start()
+        sock, message = take_batch(port)
+        assert message['batch'] == [{"a": 1}]
+        sock.close()
+        server._process.join(timeout=10)
+        assert results == []
+        assert len(errors) == 1 and "lost" in errors[0]
+
+    def test_speculative(self):
+        port = free_port()
+        results, errors = [], []
+        server = parally.server.Server('localhost', port, prefetch=1,
+                                       heartbeat=None, speculative=True)
+        server.bind_parameters([{"a": i} for i in range(10)])
+        server.on_completed(results.extend)
+        server.on_error(errors.append)
+        server.start()
+        sock, message = take_batch(port)
+        threads = start_clients(port, lambda p: p['a'], count=1)
+        buffer = parally.protocol.FrameBuffer()
+        cancel = parally.protocol.recv_message(sock, buffer)
+        server._process.join(timeout=10)
+        sock.close()
+        threads[0].join(timeout=10)
+        assert cancel == {'action': 'cancel', 'id': message['id']}
+        assert errors == []
+        assert sorted(r['output'] for r in results) == list(range(10))
+
+    def test_cache(self, tmp_path):
+        cache = parally.ResultCache(str(tmp_path / "cache.db"))
+        results, errors = run_server([{"a": i} for i in range(10)],
+                                     lambda p: p['a'] * 3,
+                                     server_kwargs={'cache': cache})
+        assert errors == []
+        port = free_port()
+        cached = []
+        server = parally.server.Server('localhost', port, cache=cache)
+        server.bind_parameters([{"a": i} for i in range(10)])
+        server.on_completed(cached.extend)
+        server.on_error(cached.append)
+        server.start()
+        server._process.join(timeout=10)
+        assert sorted(r['output'] for r in cached) == \
+            [3 * i for i in range(10)]
+
+    def test_cache_error(self, tmp_path):
+        class BrokenCache(parally.ResultCache):
+            def get(self, parameters):
+                if parameters['a'] == 3:
+                    raise OSError("disk error")
+                return super().get(parameters)
+
+        cache = BrokenCache(str(tmp_path / "cache.db"))
+        results, errors = run_server([{"a": i} for i in range(10)],
+                                     lambda p: p['a'] * 3,
+                                     server_kwargs={'cache': cache})
+        assert errors == ["Cannot look up parameters {'a': 3}: disk error"]
+        assert sorted(r['output'] for r in results) == \
+            [3 * i for i in range(10)]
+
+    def test_resume(self, tmp_path):
+        path = str(tmp_path / "job.journal")
+        journal = parally.journal.Journal(path)
+        for i in range(0, 20, 2):
+            journal.append(i, {"input": {"a": i}, "output": i})
+        journal.close()
+
+        def odd_only(params):
+            if params['a'] % 2 == 0:
+                raise ValueError("already done")
+            return params['a']
+
+        port = free_port()
+        results, errors = [], []
+        server = parally.server.Server('localhost', port)
+        server.bind_parameters({"a": i} for i in range(20))
+        server.on_completed(results.extend)
+        server.on_error(errors.append)
+        server.start(resume=path)
+        threads = start_clients(port, odd_only)
+        server._process.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert errors == []
+        assert sorted(r['output'] for r in results) == list(range(20))
+        assert sorted(parally.journal.Journal(path).load()) == list(range(20))
+
+    def test_stats(self):
+        port, metrics_port = free_port(), free_port()
+        results = []
+        server = parally.server.Server('localhost', port,
+                                       metrics_port=metrics_port)
+        server.bind_parameters([{"a": i} for i in range(20)], chunksize=5)
+        server.on_completed(results.extend)
+        server.on_error(results.append)
+        server.start()
+        with urllib.request.urlopen(
+                'http://localhost:{}/metrics'.format(metrics_port)) as page:
+            assert "parally_tasks_pending 20" in page.read().decode()
+        threads = start_clients(port, lambda p: p['a'])
+        server._process.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        stats = server.stats()
+        assert stats['tasks']['succeeded'] == 20
+        assert stats['tasks']['pending'] == 0
+        assert stats['latency']['count'] == 20
+        assert stats['messages_received'] >= 4
+        assert stats['bytes_sent'] > 0 and stats['bytes_received'] > 0
+        assert sum(w['tasks'] for w in stats['workers'].values()) == 20
+
+    @pytest.mark.parametrize('processes', [1, 2])
+    def test_bind_function(self, processes):
+        port = free_port()
+        results, errors = [], []
+        server = parally.server.Server('localhost', port)
+        server.bind_parameters([{"a": i} for i in range(20)], chunksize=4)
+        server.bind_function(lambda params: params['a'] * 3)
+        server.on_completed(results.extend)
+        server.on_error(errors.append)
+        server.start()
+        threads = start_clients(port, None, processes=processes)
+        server._process.join(timeout=20)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert errors == []
+        assert sorted(r['output'] for r in results) == \
+            [3 * i for i in range(20)]
+
+    @pytest.mark.parametrize('reducer, initial, expected', [
+        ('sum', None, 4950), (lambda total, output: max(total, output), -1,
+                              99)])
+    def test_reduce(self, reducer, initial, expected):
+        port = free_port()
+        results = []
+        server = parally.server.Server('localhost', port)
+        server.bind_parameters([{"a": i} for i in range(100)], chunksize=8)
+        server.on_reduce(reducer, initial)
+        server.on_completed(results.append)
+        server.on_error(results.append)
+        server.start()
+        threads = start_clients(port, lambda p: p['a'])
+        server._process.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert results == [expected]
+        assert server.get_reduced() == expected
+        assert server._completed == []
+
+    @pytest.mark.parametrize('window', [None, 0])
+    def test_reduce_error(self, window):
+        port = free_port()
+        results, errors = [], []
+        server = parally.server.Server('localhost', port)
+        server.bind_parameters([{"a": i} for i in range(10)], chunksize=2)
+        server.bind_function(lambda p: None if p['a'] == 3 else p['a'])
+        server.on_reduce('sum', window=window)
+        server.on_completed(results.append)
+        server.on_error(errors.append)
+        server.start()
+        threads = start_clients(port, None, count=1)
+        server.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert not server.running
+        assert len(errors) == 1
+        assert errors[0].startswith("Cannot reduce output:")
+        assert results == [42]
+        assert server.stats()['tasks']['failed'] == 1
+
+    @pytest.mark.parametrize('merge', [None, lambda a, b: a + b])
+    def test_combine_fold(self, merge):
+        port = free_port()
+        results = []
+        server = parally.server.Server('localhost', port)
+        server.bind_parameters([{"a": i} for i in range(1, 11)], chunksize=2)
+        server.bind_function(lambda params: params['a'])
+        server.on_reduce(lambda total, output: total + output * output, 0,
+                         window=0, merge=merge)
+        server.on_completed(results.append)
+        server.on_error(results.append)
+        server.start()
+        assert (server._combiner is None) == (merge is None)
+        threads = start_clients(port, None)
+        server.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert results == [385]
+
+    def test_combine_mutable_initial(self):
+        port = free_port()
+        results = []
+        server = parally.server.Server('localhost', port)
+        server.bind_parameters([{"a": i} for i in range(6)], chunksize=1)
+        server.bind_function(lambda params: params['a'])
+        server.on_reduce(lambda acc, output: acc.append(output) or acc, [],
+                         window=0,
+                         merge=lambda acc, other: acc.extend(other) or acc)
+        server.on_completed(results.append)
+        server.on_error(results.append)
+        server.start()
+        threads = start_clients(port, None, count=1)
+        server.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert sorted(results[0]) == list(range(6))
+
+    @pytest.mark.parametrize('window, processes', [(0, 1), (0.05, 2)])
+    def test_combine(self, window, processes):
+        port = free_port()
+        results, errors = [], []
+        server = parally.server.Server('localhost', port)
+        server.bind_parameters([{"a": i} for i in range(200)], chunksize=5)
+        server.bind_function(
+            lambda params: params['a'] if params['a'] % 50 else int('x'))
+        server.on_reduce('mean', window=window)
+        server.on_completed(results.append)
+        server.on_error(errors.append)
+        server.start()
+        threads = start_clients(port, None, processes=processes)
+        server._process.join(timeout=20)
+        for thread in threads:
+            thread.join(timeout=10)
+        outputs = [i for i in range(200) if i % 50]
+        assert len(errors) == 4
+        assert results[0]['count'] == len(outputs)
+        assert results[0]['mean'] == pytest.approx(sum(outputs) / 196)
+        assert server.stats()['tasks']['succeeded'] == len(outputs)
+
+    def test_partial_overlap(self):
+        port = free_port()
+        results = []
+        server = parally.server.Server('localhost', port)
+        server.bind_parameters([{"a": 1}, {"a": 2}], chunksize=2)
+        server.on_reduce('sum', window=0)
+        server.on_completed(results.append)
+        server.on_error(results.append)
+        server.start()
+        with socket.create_connection(('localhost', port)) as sock:
+            buffer = parally.protocol.FrameBuffer()
+            parally.protocol.recv_message(sock, buffer)
+            combine = parally.protocol.recv_message(sock, buffer)
+            assert combine == {'action': 'combine', 'window': 0.0,
+                               'reducer': {'name': 'sum'}}
+            parally.protocol.send_message(sock, {'action': 'ready'})
+            first = parally.protocol.recv_message(sock, buffer)
+            parally.protocol.send_message(sock, {
+                'action': 'partial', 'ids': [first['id'], 999],
+                'partial': 3, 'count': 2, 'errors': []})
+            second = parally.protocol.recv_message(sock, buffer)
+            assert second['batch'] == first['batch']
+            parally.protocol.send_message(sock, {
+                'action': 'partial', 'ids': [second['id']],
+                'partial': 3, 'count': 2, 'errors': []})
+            server._process.join(timeout=10)
+        assert results == [3]
+
+    def test_jobs(self):
+        port = free_port()
+        server = parally.server.Server('localhost', port)
+        server.start()
+        assert server.running
+        threads = start_clients(port, None)
+        doubled = [server.submit(lambda p: p * 2, i) for i in range(10)]
+        squares = server.map(lambda p: p ** 2, iter(range(30)), chunksize=4)
+        cubes = server.map(lambda p: p ** 3, range(10))
+        assert list(cubes) == [i ** 3 for i in range(10)]
+        assert list(squares) == [i ** 2 for i in range(30)]
+        assert [f.result(timeout=10) for f in doubled] == \
+            [2 * i for i in range(10)]
+
+        def odd(params):
+            if params % 2:
+                raise ValueError("odd")
+            return params
+
+        assert str(server.submit(odd, 1).exception(timeout=10)) == "odd"
+        with pytest.raises(RuntimeError, match="odd"):
+            list(server.map(odd, range(4)))
+        assert server.running
+        server.stop()
+        server._process.join(timeout=10)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert isinstance(server.submit(odd, 2).exception(), ValueError)
+
+
+class Unformattable:
+    def __format__(self, spec):
+        raise AssertionError("formatted")
+
+
+class TestLogs:
+    def test_level(self):
+        logs = parally.server.Logs('info')
+        logs.debug("Parameters: {}", Unformattable(), verbose=True)
+        logs.output(Unformattable(), verbose=True)
+        logs.info("Started on {}:{}", 'localhost', 5000)
+        assert [(log['type'], log['message']) for log in logs.get_logs()] \
+            == [('info', "Started on localhost:5000")]
+        with pytest.raises(ValueError):
+            parally.server.Logs('verbose')
+
+    def test_history(self):
+        logs = parally.server.Logs('debug', history=3)
+        for i in range(10):
+            logs.debug("Message {}", i)
+        assert [log['message'] for log in logs.get_logs()] == \
+            ["Message 7", "Message 8", "Message 9"]
+        logs.clear_logs()
+        assert logs.get_logs() == []
+
+    def test_logger(self, caplog):
+        logs = parally.server.Logs('debug', logger='parally.test')
+        with caplog.at_level('INFO', logger='parally.test'):
+            logs.debug("Parameters: {}", Unformattable())
+            logs.warning("No heartbeat from {}.", 'worker')
+        assert caplog.messages == ["No heartbeat from worker."]
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+from parally import ParameterQueue, ParameterSource, read_csv, read_ndjson
+
+
+class TestSources:
+
+    def test_lazy_generator(self):
+        pulled = []
+
+        def parameters():
+            for i in range(100):
+                pulled.append(i)
+                yield {"a": i}
+
+        source = ParameterSource(parameters(), read_ahead=10)
+        assert source.get_total() is None
+        assert source.take(3) == [{"a": 0}, {"a": 1}, {"a": 2}]
+        assert len(pulled) == 10
+        assert source.take(25) == [{"a": i} for i in range(3, 28)]
+        assert len(pulled) == 28
+        while not source.empty():
+            source.take(7)
+        assert source.get_taken() == 100
+        assert source.take(1) == []
+
+    def test_list(self):
+        source = ParameterSource([{"a": 1}, {"a": 1}])
+        assert source.get_total() == 2
+        assert source.take(5) == [{"a": 1}, {"a": 1}]
+        assert source.empty()
+
+    def test_queue(self):
+        queue = ParameterQueue()
+        assert queue.empty() and queue.get_total() is None
+        assert [queue.put({"a": i}) for i in range(3)] == [0, 1, 2]
+        assert queue.take_indexed(2) == ([0, 1], [{"a": 0}, {"a": 1}])
+        assert queue.remaining() == 1 and queue.get_taken() == 2
+        queue.close()
+        assert queue.empty()
+        with pytest.raises(ValueError):
+            queue.put({"a": 3})
+
+    def test_read_error(self, tmp_path):
+        ndjson = tmp_path / "parameters.ndjson"
+        ndjson.write_text('{"a": 0}\n{"a": 1}\n{"a": \n{"a": 3}\n')
+        source = ParameterSource(read_ndjson(ndjson), read_ahead=1)
+        assert source.take(5) == [{"a": 0}, {"a": 1}]
+        assert source.empty()
+        assert isinstance(source.take_error(), ValueError)
+        assert source.take_error() is None
+
+    def test_skip_error(self):
+        def skip(index, parameters):
+            if index == 1:
+                raise KeyError("lookup failed")
+            return index == 2
+
+        source = ParameterSource([{"a": i} for i in range(4)], read_ahead=1)
+        source.skip(skip)
+        assert source.take(1) == [{"a": 0}]
+        with pytest.raises(KeyError):
+            source.take(1)
+        assert source.take(2) == [{"a": 3}]
+        assert source.take_error() is None
+
+    def test_readers(self, tmp_path):
+        ndjson = tmp_path / "parameters.ndjson"
+        ndjson.write_text("\n".join(json.dumps({"a": i}) for i in range(3)))
+        assert list(read_ndjson(ndjson)) == [{"a": i} for i in range(3)]
+        table = tmp_path / "parameters.csv"
+        table.write_text("a,b\n1,2\n3,4\n")
+        assert list(read_csv(table)) == [{"a": "1", "b": "2"},
+                                         {"a": "3", "b": "4"}]
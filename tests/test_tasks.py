@@ -0,0 +1,41 @@
+from parally import ParameterSource
+from parally.tasks import TaskStore
+
+
+class TestTasks:
+
+    def test_dispatch_and_complete(self):
+        store = TaskStore(ParameterSource([{"a": 1}] * 5))
+        first, task = store.dispatch('worker', 2)
+        assert task.parameters == [{"a": 1}, {"a": 1}]
+        assert task.workers == {'worker'} and task.attempts == 1
+        second, _ = store.dispatch('worker', 2)
+        assert first != second
+        assert store.remaining() == 1
+        assert store.complete(first) is task
+        assert store.complete(first) is None
+        assert not store.is_done()
+
+    def test_requeue_first(self):
+        store = TaskStore(ParameterSource({"a": i} for i in range(4)))
+        task_id, task = store.dispatch('lost', 2)
+        store.requeue(task_id)
+        assert store.get_task(task_id) is None
+        assert store.remaining() == 4
+        again, retried = store.dispatch('other', 1)
+        assert (again, retried) == (task_id, task)
+        assert retried.attempts == 2 and retried.workers == {'other'}
+        store.complete(again)
+        last, _ = store.dispatch('other', 5)
+        store.complete(last)
+        assert store.is_done()
+        assert store.dispatch('other', 1) == (None, None)
+
+    def test_speculate_oldest(self):
+        store = TaskStore(ParameterSource({"a": i} for i in range(2)))
+        first, task = store.dispatch('slow', 1)
+        store.dispatch('fast', 1)
+        assert store.speculate('slow') == (1, store.get_task(1))
+        assert store.speculate('idle') == (first, task)
+        assert task.workers == {'slow', 'idle'}
+        assert store.speculate('other') == (None, None)